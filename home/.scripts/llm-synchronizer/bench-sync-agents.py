@@ -0,0 +1,1126 @@
+#!/usr/bin/env python3
+
+
+"""Benchmark suite for sync-agents.py.
+
+Generates synthetic template trees of increasing size and times each phase of
+a sync separately, storing the results as JSON so runs can be compared.
+
+Requirements
+------------
+- PyYAML
+
+Usage
+-----
+uv run python bench-sync-agents.py [--sizes 100,1000] [--output FILE]
+                                   [--compare BASELINE]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime
+from pathlib import Path
+from types import ModuleType
+from typing import Any, NamedTuple
+
+import yaml
+
+from mcp_proxy import proxy_request
+from mcp_servers import initialize_params, process_tree_rss, read_jsonrpc_response
+
+
+def load_sync_agents() -> ModuleType:
+    """Import sync-agents.py, whose name is not a valid module name.
+
+    Returns
+    -------
+    ModuleType
+        The loaded sync-agents module
+    """
+    path = Path(__file__).with_name("sync-agents.py")
+    spec = importlib.util.spec_from_file_location("sync_agents", path)
+
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+sync_agents = load_sync_agents()
+
+
+class CorpusSpec(NamedTuple):
+    """Shape of a synthetic corpus.
+
+    Attributes
+    ----------
+    agents : int
+        Number of agent templates
+    commands : int
+        Number of command templates
+    skills : int
+        Number of skill templates
+    skill_assets : int
+        Supporting files per skill
+    asset_size : int
+        Size in bytes of each supporting file
+    body_size : int
+        Size in bytes of each template body
+    mcp_servers : int
+        Number of MCP servers in config.yml
+    """
+
+    agents: int
+    commands: int
+    skills: int
+    skill_assets: int
+    asset_size: int
+    body_size: int
+    mcp_servers: int
+
+
+def _frontmatter(template_type: str, index: int, *, opencode: bool) -> str:
+    """Build frontmatter for a synthetic template."""
+    shared: dict[str, Any] = {"description": f"Synthetic {template_type} {index}"}
+
+    if template_type == "skill":
+        shared["name"] = f"skill-{index}"
+
+    frontmatter = {
+        "type": template_type,
+        "shared": shared,
+        "claude": {"enabled": True, "model": "sonnet", "tools": "Read, Grep, Glob"},
+        "opencode": {"enabled": opencode, "mode": "subagent"},
+    }
+
+    return yaml.safe_dump(frontmatter, sort_keys=False)
+
+
+def generate_corpus(root: Path, spec: CorpusSpec) -> Path:
+    """Create a templates/ tree, config.yml and fake provider home under root.
+
+    Every tenth template is disabled for OpenCode so the cleanup phase has
+    work to do.
+
+    Parameters
+    ----------
+    root : Path
+        Empty directory to build the corpus in
+    spec : CorpusSpec
+        Shape of the corpus
+
+    Returns
+    -------
+    Path
+        Path to the generated config.yml
+    """
+    templates_dir = root / "templates"
+    home = root / "home"
+    body = ("Synthetic template body. " * (spec.body_size // 25 + 1))[: spec.body_size]
+    asset = b"x" * spec.asset_size
+
+    for template_type, count in (("agent", spec.agents), ("command", spec.commands)):
+        for i in range(count):
+            path = templates_dir / f"{template_type}s" / f"group-{i % 10}" / f"{i}.md"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            frontmatter = _frontmatter(template_type, i, opencode=i % 10 != 0)
+            path.write_text(f"---\n{frontmatter}---\n\n{body}\n")
+
+    for i in range(spec.skills):
+        skill_dir = templates_dir / "skills" / f"skill-{i}"
+        skill_dir.mkdir(parents=True)
+        frontmatter = _frontmatter("skill", i, opencode=i % 10 != 0)
+        (skill_dir / "SKILL.md").write_text(f"---\n{frontmatter}---\n\n{body}\n")
+
+        for j in range(spec.skill_assets):
+            asset_dir = skill_dir / ("references" if j % 2 else "scripts")
+            asset_dir.mkdir(exist_ok=True)
+            (asset_dir / f"asset-{j}.md").write_bytes(asset)
+
+    mcp_servers = {
+        f"server-{i}": {
+            "values": {
+                "command": "uvx",
+                "args": ["--from", f"synthetic-server-{i}", "serve"],
+                "env": {"TOKEN": f"token-{i}"},
+            },
+            "providers": {
+                "claude": {"enabled": True},
+                "opencode": {"enabled": True, "extra": {"type": "local"}},
+                "gemini": {"enabled": i % 2 == 0},
+            },
+        }
+        for i in range(spec.mcp_servers)
+    }
+    config = {
+        "providers": {
+            "claude": {
+                "templates_dir": str(home / ".claude"),
+                "mcp_config": str(home / ".claude.json"),
+            },
+            "opencode": {
+                "templates_dir": str(home / ".config" / "opencode"),
+                "mcp_config": str(home / ".config" / "opencode" / "opencode.json"),
+            },
+            "gemini": {"mcp_config": str(home / ".gemini" / "settings.json")},
+        },
+        "mcp_servers": mcp_servers,
+    }
+    config_file = root / "config.yml"
+    config_file.write_text(yaml.safe_dump(config, sort_keys=False))
+
+    return config_file
+
+
+def _time_phase(
+    func: Callable[[], int],
+    *,
+    repeat: int,
+    setup: Callable[[], None] | None = None,
+) -> dict[str, Any]:
+    """Time func over repeat runs, calling setup (untimed) before each.
+
+    func returns the number of items it processed. Output printed by the
+    sync engine is discarded.
+    """
+    timings = []
+    items = 0
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        with (
+            contextlib.redirect_stdout(io.StringIO()),
+            contextlib.redirect_stderr(io.StringIO()),
+        ):
+            start = time.perf_counter()
+            items = func()
+            timings.append(time.perf_counter() - start)
+
+    return {
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "items": items,
+    }
+
+
+def _reset_home(root: Path) -> None:
+    """Remove all generated output from the fake provider home."""
+    shutil.rmtree(root / "home", ignore_errors=True)
+    (root / "home").mkdir()
+
+
+def benchmark_corpus(
+    root: Path,
+    spec: CorpusSpec,
+    *,
+    repeat: int,
+) -> dict[str, dict[str, Any]]:
+    """Generate a corpus and time every sync phase against it.
+
+    Parameters
+    ----------
+    root : Path
+        Empty directory to build the corpus in
+    spec : CorpusSpec
+        Shape of the corpus
+    repeat : int
+        Runs per phase; the minimum and median are reported
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        Timing results keyed by phase name
+    """
+    config_file = generate_corpus(root, spec)
+    manager = sync_agents.AgentSyncManager(config_file)
+    parser = sync_agents.FrontmatterParser
+    generator = sync_agents.TemplateGenerator
+    phases: dict[str, dict[str, Any]] = {}
+
+    phases["discovery"] = _time_phase(
+        lambda: len(manager.discover_templates()),
+        repeat=repeat,
+    )
+
+    # Only time the files the sync would render; templates that fail to parse
+    # are skipped.
+    templates = []
+
+    for path in manager.discover_templates():
+        with contextlib.suppress(ValueError):
+            manager.parse_template(path)
+            templates.append(path)
+
+    fresh: list[Any] = []
+
+    def parse() -> int:
+        return len([fresh[-1].parse_template(path) for path in templates])
+
+    phases["parse"] = _time_phase(
+        parse,
+        repeat=repeat,
+        setup=lambda: fresh.append(sync_agents.AgentSyncManager(config_file)),
+    )
+
+    parsed = {path: manager.parse_template(path) for path in templates}
+    loaded = {path: parser.load_body(path, t) for path, t in parsed.items()}
+    outputs = {
+        path: manager._get_template_outputs(path, template)
+        for path, template in parsed.items()
+    }
+
+    def render() -> int:
+        return len(
+            [
+                generator.generate_file_content(template, provider)
+                for path, template in loaded.items()
+                for provider in outputs[path]["enabled"]
+            ],
+        )
+
+    phases["render"] = _time_phase(render, repeat=repeat)
+
+    bodies = {path: template.body.encode() for path, template in loaded.items()}
+
+    def render_cached() -> int:
+        return len(
+            [
+                manager._render_file(template, provider, bodies[path])
+                for path, template in loaded.items()
+                for provider in outputs[path]["enabled"]
+            ],
+        )
+
+    # Frontmatter is reused across providers within a run, not across runs
+    phases["render_cached"] = _time_phase(
+        render_cached,
+        repeat=repeat,
+        setup=manager._frontmatter_cache.clear,
+    )
+
+    rendered = [
+        (output_path, generator.generate_file_content(loaded[path], provider))
+        for path in templates
+        for provider, output_path in outputs[path]["enabled"].items()
+    ]
+
+    def write() -> int:
+        for output_path, content in rendered:
+            manager.write_generated_file(output_path, content)
+        return len(rendered)
+
+    phases["write"] = _time_phase(write, repeat=repeat, setup=lambda: _reset_home(root))
+    phases["write_unchanged"] = _time_phase(write, repeat=repeat)
+
+    skills = [
+        (path.parent, output_path.parent)
+        for path in templates
+        if parsed[path].type == "skill"
+        for output_path in outputs[path]["enabled"].values()
+    ]
+
+    def copy_skills() -> int:
+        return sum(
+            manager.copy_skill_directory(src, dest).copied for src, dest in skills
+        )
+
+    phases["skill_copy"] = _time_phase(
+        copy_skills,
+        repeat=repeat,
+        setup=lambda: [shutil.rmtree(dest, ignore_errors=True) for _, dest in skills],
+    )
+    phases["skill_copy_unchanged"] = _time_phase(copy_skills, repeat=repeat)
+
+    disabled = manager._get_template_mappings(templates)["disabled"]
+
+    def create_disabled() -> None:
+        for paths in disabled.values():
+            for path in paths:
+                target = path / "SKILL.md" if path.suffix != ".md" else path
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text("stale\n")
+
+    phases["cleanup"] = _time_phase(
+        lambda: manager._cleanup_disabled_templates(disabled),
+        repeat=repeat,
+        setup=create_disabled,
+    )
+    phases["mcp_merge"] = _time_phase(
+        manager.sync_mcp_servers,
+        repeat=repeat,
+    )
+
+    return phases | _benchmark_full_sync(root, config_file, repeat=repeat)
+
+
+def _benchmark_full_sync(
+    root: Path,
+    config_file: Path,
+    *,
+    repeat: int,
+) -> dict[str, dict[str, Any]]:
+    """Time a complete forced sync, then a no-op sync."""
+    return {
+        "full_sync": _time_phase(
+            lambda: sync_agents.AgentSyncManager(config_file).sync_all(force=True),
+            repeat=repeat,
+            setup=lambda: _reset_home(root),
+        ),
+        "noop_sync": _time_phase(
+            lambda: sync_agents.AgentSyncManager(config_file).sync_all(),
+            repeat=repeat,
+        ),
+    }
+
+
+def benchmark_yaml_backends(root: Path, *, repeat: int) -> dict[str, dict[str, Any]]:
+    """Time frontmatter parse and emit throughput per available YAML backend.
+
+    Parameters
+    ----------
+    root : Path
+        Directory containing a generated corpus
+    repeat : int
+        Runs per measurement
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        Timing results keyed by "<backend>_parse" / "<backend>_emit"
+    """
+    documents = []
+
+    for path in sorted((root / "templates").rglob("*.md")):
+        with path.open() as f, contextlib.suppress(ValueError):
+            documents.append(sync_agents.FrontmatterParser._read_frontmatter(path, f))
+
+    backends = {"python": (yaml.SafeLoader, yaml.SafeDumper)}
+
+    if hasattr(yaml, "CSafeLoader"):
+        backends["libyaml"] = (yaml.CSafeLoader, yaml.CSafeDumper)
+
+    results = {}
+    dump_options = {
+        "default_flow_style": False,
+        "sort_keys": False,
+        "width": 999999,
+        "allow_unicode": True,
+    }
+
+    for name, (loader, dumper) in backends.items():
+        loaded = [yaml.load(doc, Loader=loader) for doc in documents]
+        results[f"{name}_parse"] = _time_phase(
+            lambda loader=loader: len(
+                [yaml.load(doc, Loader=loader) for doc in documents],
+            ),
+            repeat=repeat,
+        )
+        results[f"{name}_emit"] = _time_phase(
+            lambda dumper=dumper, loaded=loaded: len(
+                [yaml.dump(doc, Dumper=dumper, **dump_options) for doc in loaded],
+            ),
+            repeat=repeat,
+        )
+
+    return results
+
+
+def _claude_json(size_mb: int, servers: dict[str, Any]) -> bytes:
+    """Build a ~/.claude.json-like document of about size_mb megabytes.
+
+    Most of the bytes are per-project prompt history, as in real files; the
+    strings contain brackets, quotes and escapes so the scanner cannot take
+    shortcuts.
+    """
+    entry = {
+        "display": 'fix the [parser] in {module} and "quote" \\ paths \u00e9 ' * 3,
+        "pastedContents": {},
+    }
+    project = {
+        "allowedTools": [],
+        "history": [entry] * 50,
+        "mcpContextUris": [],
+        "hasTrustDialogAccepted": True,
+    }
+    project_size = len(json.dumps(project, indent=2))
+    document = {
+        "numStartups": 42,
+        "projects": {
+            f"/home/user/src/project-{i}": project
+            for i in range(max(1, size_mb * 1024 * 1024 // project_size))
+        },
+        "mcpServers": servers,
+    }
+
+    return (json.dumps(document, indent=2) + "\n").encode()
+
+
+def benchmark_mcp_files(
+    root: Path,
+    size_mb: int,
+    *,
+    repeat: int,
+) -> dict[str, dict[str, Any]]:
+    """Time updating the MCP section of a large Claude config file.
+
+    Compares splicing the section into the existing bytes with parsing and
+    re-dumping the whole document. Nothing is written to disk.
+
+    Parameters
+    ----------
+    root : Path
+        Empty directory to build the config in
+    size_mb : int
+        Approximate size of the config file in megabytes
+    repeat : int
+        Runs per measurement
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        Timing results keyed by phase name
+    """
+    target = root / ".claude.json"
+    config_file = root / "config.yml"
+    config_file.write_text(
+        yaml.safe_dump({"providers": {"claude": {"mcp_config": str(target)}}}),
+    )
+    (root / "templates").mkdir()
+    manager = sync_agents.AgentSyncManager(config_file)
+
+    servers = {
+        f"server-{i}": {"command": "uvx", "args": [f"synthetic-server-{i}"]}
+        for i in range(50)
+    }
+    changed = {"mcpServers": {**servers, "server-0": {"command": "npx"}}}
+    existing = _claude_json(size_mb, servers)
+    target.write_bytes(existing)
+
+    def full_merge() -> int:
+        merged = manager._merge_json_document(
+            target,
+            existing,
+            changed,
+            "mcpServers",
+        )
+        return len((json.dumps(merged, indent=2) + "\n").encode())
+
+    return {
+        "mcp_scan": _time_phase(
+            lambda: len(sync_agents.scan_json_object(existing).members),
+            repeat=repeat,
+        ),
+        "mcp_splice": _time_phase(
+            lambda: len(manager._splice_mcp_section(existing, changed, "mcpServers")),
+            repeat=repeat,
+        ),
+        "mcp_full_merge": _time_phase(full_merge, repeat=repeat),
+        "mcp_unchanged": _time_phase(
+            lambda: manager.merge_json_file(
+                target,
+                {"mcpServers": servers},
+                "mcpServers",
+            )[0],
+            repeat=repeat,
+        ),
+    }
+
+
+def benchmark_mcp_emit(
+    root: Path,
+    server_count: int,
+    *,
+    repeat: int,
+) -> dict[str, dict[str, Any]]:
+    """Time loading MCP servers and generating every provider's section.
+
+    Parameters
+    ----------
+    root : Path
+        Empty directory to build the config in
+    server_count : int
+        Number of MCP servers in config.yml
+    repeat : int
+        Runs per measurement
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        Timing results keyed by phase name
+    """
+    spec = CorpusSpec(
+        agents=0,
+        commands=0,
+        skills=0,
+        skill_assets=0,
+        asset_size=0,
+        body_size=0,
+        mcp_servers=server_count,
+    )
+    config_file = generate_corpus(root, spec)
+    (root / "templates").mkdir()
+    manager = sync_agents.AgentSyncManager(config_file)
+    servers = manager.load_mcp_servers()
+
+    return {
+        "mcp_load": _time_phase(
+            lambda: len(manager.load_mcp_servers()),
+            repeat=repeat,
+        ),
+        "mcp_emit": _time_phase(
+            lambda: [
+                len(generator_func(servers))
+                for generator_func in sync_agents.MCP_GENERATORS.values()
+            ],
+            repeat=repeat,
+        ),
+        "mcp_targets": _time_phase(
+            lambda: len(manager._get_mcp_targets(servers)),
+            repeat=repeat,
+        ),
+    }
+
+
+# Stand-in for a uvx/npx server: slow to start, with some resident memory
+_STUB_MCP_SERVER = """\
+import json, sys, time
+
+time.sleep({startup_s})
+ballast = bytearray({size_mb} * 1024 * 1024)
+ballast[::4096] = b"\\1" * len(ballast[::4096])
+
+for line in sys.stdin:
+    request = json.loads(line)
+
+    if "id" in request:
+        result = {{"serverInfo": {{"name": "stub", "version": "1"}}}}
+        response = {{"jsonrpc": "2.0", "id": request["id"], "result": result}}
+        print(json.dumps(response), flush=True)
+"""
+MCP_PROXY_SERVERS = 3
+MCP_PROXY_STARTUP_MS = 500
+MCP_PROXY_SERVER_MB = 30
+
+
+def _open_mcp_session(
+    entries: dict[str, dict[str, Any]],
+) -> tuple[float, list[subprocess.Popen[bytes]]]:
+    """Start a session's MCP servers like a provider CLI does.
+
+    Every server in entries (a generated mcpServers section) is started at
+    once and sent an initialize request.
+
+    Returns
+    -------
+    tuple[float, list[subprocess.Popen[bytes]]]
+        Seconds until every server answered, and the server processes
+    """
+    start = time.perf_counter()
+    processes = [
+        subprocess.Popen(
+            [entry["command"], *entry.get("args", [])],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        for entry in entries.values()
+    ]
+    request = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": initialize_params("bench"),
+    }
+
+    for process in processes:
+        process.stdin.write(json.dumps(request).encode() + b"\n")  # type: ignore[union-attr]
+        process.stdin.flush()  # type: ignore[union-attr]
+
+    for process in processes:
+        read_jsonrpc_response(
+            process.stdout.fileno(),  # type: ignore[union-attr]
+            1,
+            start + 60,
+        )
+
+    return time.perf_counter() - start, processes
+
+
+def _close_mcp_session(processes: list[subprocess.Popen[bytes]]) -> None:
+    """Close the stdin of a session's servers and wait for them to exit."""
+    for process in processes:
+        process.stdin.close()  # type: ignore[union-attr]
+
+    for process in processes:
+        process.wait()
+        process.stdout.close()  # type: ignore[union-attr]
+
+
+def _run_mcp_sessions(
+    entries: dict[str, dict[str, Any]],
+    sessions: int,
+    memory_pids: Callable[[list[int]], list[int]],
+) -> tuple[list[float], int]:
+    """Open sessions one after another, keeping them open, then close them.
+
+    Returns
+    -------
+    tuple[list[float], int]
+        Startup time of each session, and the resident memory in KB of the
+        process trees memory_pids returns (given every server pid) while all
+        sessions were open
+    """
+    timings = []
+    opened: list[subprocess.Popen[bytes]] = []
+
+    try:
+        for _ in range(sessions):
+            elapsed, processes = _open_mcp_session(entries)
+            timings.append(elapsed)
+            opened.extend(processes)
+
+        rss_kb = sum(
+            process_tree_rss(pid) or 0
+            for pid in memory_pids([process.pid for process in opened])
+        )
+    finally:
+        _close_mcp_session(opened)
+
+    return timings, rss_kb
+
+
+def benchmark_mcp_proxy(
+    root: Path,
+    sessions: int,
+    *,
+    repeat: int,
+) -> dict[str, dict[str, Any]]:
+    """Time session startup and memory with and without the MCP proxy.
+
+    Each session starts MCP_PROXY_SERVERS stub servers that take
+    MCP_PROXY_STARTUP_MS to start and hold MCP_PROXY_SERVER_MB of memory.
+    Without the proxy every session starts its own servers. With it, the
+    first session starts the proxy and the servers, and later sessions
+    only start proxy clients.
+
+    Parameters
+    ----------
+    root : Path
+        Empty directory to build the config in
+    sessions : int
+        Sessions open at the same time
+    repeat : int
+        Runs per measurement
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        Timing results keyed by phase name; the direct and warm proxy
+        phases also hold the total resident memory with every session open
+    """
+    stub = root / "stub-server.py"
+    stub.write_text(
+        _STUB_MCP_SERVER.format(
+            startup_s=MCP_PROXY_STARTUP_MS / 1000,
+            size_mb=MCP_PROXY_SERVER_MB,
+        ),
+    )
+    socket_path = root / "proxy.sock"
+    config_file = root / "config.yml"
+    config = {
+        "providers": {"claude": {"mcp_config": str(root / ".claude.json")}},
+        "mcp_proxy": {"enabled": True, "socket": str(socket_path)},
+        "mcp_servers": {
+            f"stub-{i}": {
+                "values": {"command": sys.executable, "args": [str(stub), str(i)]},
+                "providers": {"claude": {"enabled": True}},
+            }
+            for i in range(MCP_PROXY_SERVERS)
+        },
+    }
+    config_file.write_text(yaml.safe_dump(config, sort_keys=False))
+    (root / "templates").mkdir()
+    manager = sync_agents.AgentSyncManager(config_file)
+    servers = manager.load_mcp_servers()
+    direct = sync_agents.MCPGenerator.generate_claude_format(servers)
+    proxied = manager._get_mcp_targets(servers)[0].data
+
+    def proxy_pids(client_pids: list[int]) -> list[int]:
+        status = proxy_request(socket_path, {"command": "status"})
+        return [*client_pids, status["pid"]]
+
+    direct_timings: list[float] = []
+    cold_timings: list[float] = []
+    warm_timings: list[float] = []
+    direct_rss = proxy_rss = 0
+
+    for _ in range(repeat):
+        timings, direct_rss = _run_mcp_sessions(
+            direct["mcpServers"],
+            sessions,
+            lambda pids: pids,
+        )
+        direct_timings.extend(timings)
+
+        try:
+            timings, proxy_rss = _run_mcp_sessions(
+                proxied["mcpServers"],
+                sessions,
+                proxy_pids,
+            )
+        finally:
+            with contextlib.suppress(OSError):
+                proxy_request(socket_path, {"command": "stop"})
+
+            while socket_path.exists():
+                time.sleep(0.01)
+
+        cold_timings.append(timings[0])
+        warm_timings.extend(timings[1:])
+
+    def phase(timings: list[float], **extra: Any) -> dict[str, Any]:
+        return {
+            "min_s": min(timings),
+            "median_s": statistics.median(timings),
+            "items": MCP_PROXY_SERVERS,
+            **extra,
+        }
+
+    phases = {
+        "mcp_session_direct": phase(direct_timings, rss_kb=direct_rss),
+        "mcp_session_proxy_cold": phase(cold_timings),
+    }
+
+    if warm_timings:
+        phases["mcp_session_proxy_warm"] = phase(warm_timings, rss_kb=proxy_rss)
+
+    return phases
+
+
+def _run_label(run: dict[str, Any]) -> str:
+    """Describe the corpus of a benchmark run in a few words."""
+    corpus = run["corpus"]
+
+    if "mcp_file_mb" in corpus:
+        return f"{corpus['mcp_file_mb']}MB json"
+
+    if "mcp_emit_servers" in corpus:
+        return f"{corpus['mcp_emit_servers']} servers"
+
+    if "mcp_proxy_sessions" in corpus:
+        return f"{corpus['mcp_proxy_sessions']} sessions"
+
+    return f"{corpus['agents']} agents"
+
+
+def compare_results(
+    current: dict[str, Any],
+    baseline: dict[str, Any],
+    threshold: float,
+) -> list[str]:
+    """Find phases that got slower than baseline by more than threshold.
+
+    Parameters
+    ----------
+    current : dict[str, Any]
+        Results of this run
+    baseline : dict[str, Any]
+        Results of an earlier run
+    threshold : float
+        Allowed slowdown as a fraction (0.2 = 20%)
+
+    Returns
+    -------
+    list[str]
+        Description of each regression
+    """
+    baseline_runs = {
+        json.dumps(run["corpus"], sort_keys=True): run["phases"]
+        for run in baseline["runs"]
+    }
+    regressions = []
+
+    for run in current["runs"]:
+        old_phases = baseline_runs.get(json.dumps(run["corpus"], sort_keys=True), {})
+
+        for phase, result in run["phases"].items():
+            old = old_phases.get(phase)
+
+            if not old or old["min_s"] <= 0:
+                continue
+
+            ratio = result["min_s"] / old["min_s"]
+
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{phase} @ {_run_label(run)}: "
+                    f"{old['min_s'] * 1000:.1f}ms -> {result['min_s'] * 1000:.1f}ms "
+                    f"({ratio:.2f}x)",
+                )
+
+    return regressions
+
+
+def print_table(results: dict[str, Any]) -> None:
+    """Print results as a table of milliseconds per phase and corpus size."""
+    runs = results["runs"]
+    phases = list(dict.fromkeys(phase for run in runs for phase in run["phases"]))
+    headers = [_run_label(run) for run in runs]
+    width = max(len(phase) for phase in phases) + 2
+
+    print(f"{'phase (ms)':<{width}}" + "".join(f"{h:>14}" for h in headers))
+
+    for phase in phases:
+        cells = [
+            f"{run['phases'][phase]['min_s'] * 1000:>14.1f}"
+            if phase in run["phases"]
+            else f"{'-':>14}"
+            for run in runs
+        ]
+        print(f"{phase:<{width}}" + "".join(cells))
+
+    memory_phases = [
+        phase
+        for phase in phases
+        if any("rss_kb" in run["phases"].get(phase, {}) for run in runs)
+    ]
+
+    if memory_phases:
+        print(f"\n{'memory (MB)':<{width}}" + "".join(f"{h:>14}" for h in headers))
+
+    for phase in memory_phases:
+        cells = [
+            f"{run['phases'][phase]['rss_kb'] / 1024:>14.1f}"
+            if "rss_kb" in run["phases"].get(phase, {})
+            else f"{'-':>14}"
+            for run in runs
+        ]
+        print(f"{phase:<{width}}" + "".join(cells))
+
+
+def _int_list(value: str) -> list[int]:
+    """Parse a comma-separated list of positive integers."""
+    numbers = [int(item) for item in value.split(",") if item.strip()]
+
+    if not numbers or any(n < 1 for n in numbers):
+        raise argparse.ArgumentTypeError(f"expected positive integers, got {value!r}")
+
+    return numbers
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse command-line arguments.
+
+    Returns
+    -------
+    argparse.Namespace
+        Parsed command-line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark sync-agents.py phases on synthetic template trees",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Default corpus sizes, results printed as a table
+  %(prog)s
+
+  # Store results, then compare a later run against them
+  %(prog)s --output baseline.json
+  %(prog)s --compare baseline.json
+        """,
+    )
+    parser.add_argument(
+        "--sizes",
+        type=_int_list,
+        default=[100, 1000],
+        metavar="N[,N...]",
+        help="Agents and commands per corpus; skills are N/10 (default: 100,1000)",
+    )
+    parser.add_argument(
+        "--skill-assets",
+        type=int,
+        default=20,
+        metavar="N",
+        help="Supporting files per skill (default: 20)",
+    )
+    parser.add_argument(
+        "--asset-size",
+        type=int,
+        default=4096,
+        metavar="BYTES",
+        help="Size of each supporting file (default: 4096)",
+    )
+    parser.add_argument(
+        "--body-size",
+        type=int,
+        default=4096,
+        metavar="BYTES",
+        help="Size of each template body (default: 4096)",
+    )
+    parser.add_argument(
+        "--mcp-servers",
+        type=int,
+        default=50,
+        metavar="N",
+        help="MCP servers in config.yml (default: 50)",
+    )
+    parser.add_argument(
+        "--mcp-emit-servers",
+        type=_int_list,
+        default=[10000],
+        metavar="N[,N...]",
+        help="MCP server counts to time generating provider sections for "
+        "(default: 10000)",
+    )
+    parser.add_argument(
+        "--mcp-file-sizes",
+        type=_int_list,
+        default=[1, 10, 100],
+        metavar="MB[,MB...]",
+        help="Sizes of the Claude config files to time MCP updates on "
+        "(default: 1,10,100)",
+    )
+    parser.add_argument(
+        "--mcp-proxy-sessions",
+        type=_int_list,
+        default=[8],
+        metavar="N[,N...]",
+        help="Concurrent agent sessions to time MCP server startup for, with "
+        "and without the MCP proxy (default: 8)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        metavar="N",
+        help="Runs per phase; the fastest is reported (default: 3)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        metavar="FILE",
+        help="Write results as JSON to FILE",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        metavar="FILE",
+        help="Compare against results from an earlier run",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        metavar="FRACTION",
+        help="Slowdown that counts as a regression (default: 0.2)",
+    )
+
+    return parser.parse_args()
+
+
+def main() -> int:
+    """Run the benchmark suite.
+
+    Returns
+    -------
+    int
+        Exit code (0 for success, 1 if regressions were found)
+    """
+    args = parse_arguments()
+    results: dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(tz=UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "yaml_backend": sync_agents.YAML_BACKEND,
+            "repeat": args.repeat,
+        },
+        "runs": [],
+    }
+
+    for size in args.sizes:
+        spec = CorpusSpec(
+            agents=size,
+            commands=size,
+            skills=max(1, size // 10),
+            skill_assets=args.skill_assets,
+            asset_size=args.asset_size,
+            body_size=args.body_size,
+            mcp_servers=args.mcp_servers,
+        )
+        print(f"Benchmarking {size} agents/commands...", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory(prefix="sync-agents-bench-") as tmp:
+            root = Path(tmp)
+            phases = benchmark_corpus(root, spec, repeat=args.repeat)
+            phases |= benchmark_yaml_backends(root, repeat=args.repeat)
+
+        results["runs"].append({"corpus": spec._asdict(), "phases": phases})
+
+    for server_count in args.mcp_emit_servers:
+        print(f"Benchmarking {server_count} MCP servers...", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory(prefix="sync-agents-bench-") as tmp:
+            phases = benchmark_mcp_emit(Path(tmp), server_count, repeat=args.repeat)
+
+        results["runs"].append(
+            {"corpus": {"mcp_emit_servers": server_count}, "phases": phases},
+        )
+
+    for size_mb in args.mcp_file_sizes:
+        print(f"Benchmarking {size_mb}MB MCP config file...", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory(prefix="sync-agents-bench-") as tmp:
+            phases = benchmark_mcp_files(Path(tmp), size_mb, repeat=args.repeat)
+
+        results["runs"].append({"corpus": {"mcp_file_mb": size_mb}, "phases": phases})
+
+    for sessions in args.mcp_proxy_sessions:
+        print(f"Benchmarking {sessions} MCP sessions...", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory(prefix="sync-agents-bench-") as tmp:
+            phases = benchmark_mcp_proxy(Path(tmp), sessions, repeat=args.repeat)
+
+        results["runs"].append(
+            {"corpus": {"mcp_proxy_sessions": sessions}, "phases": phases},
+        )
+
+    print_table(results)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare_results(results, baseline, args.threshold)
+
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+
+"""Stdio client of the sync-agents MCP proxy.
+
+Provider CLIs start this script in place of a proxied MCP server. It connects
+to the proxy's Unix socket, starting the proxy first if it is not running, asks
+for the named server and then relays JSON-RPC between its stdin/stdout and the
+socket. It only uses the standard library, so it starts in a few tens of
+milliseconds.
+
+Usage
+-----
+python3 mcp-proxy-connect.py SOCKET SERVER [PROXY_COMMAND ...]
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import TextIO
+
+# Time to wait for a proxy started by this client to accept connections
+PROXY_START_TIMEOUT = 10.0
+# Time after which a proxy that is not accepting connections is started again
+PROXY_RESTART_INTERVAL = 1.0
+
+
+def start_proxy(socket_path: str, proxy_command: list[str]) -> TextIO | None:
+    """Start the proxy, unless another client is already starting it.
+
+    Returns
+    -------
+    TextIO | None
+        The start lock, to hold until the proxy accepts connections, or None
+        if another client holds it
+    """
+    lock_file = Path(f"{socket_path}.start").open("a")  # noqa: SIM115 - returned to the caller
+
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+
+    # Started from a short-lived child, so the proxy is reparented to init
+    # instead of staying a child of this session
+    pid = os.fork()
+
+    if pid == 0:
+        try:
+            subprocess.Popen(
+                proxy_command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                cwd=Path.home(),
+                start_new_session=True,
+            )
+        finally:
+            os._exit(0)
+
+    os.waitpid(pid, 0)
+
+    return lock_file
+
+
+def connect(socket_path: str, proxy_command: list[str]) -> socket.socket:
+    """Connect to the proxy, starting it with proxy_command if needed.
+
+    Raises
+    ------
+    OSError
+        If the proxy is not running and cannot be started
+    """
+    deadline = time.monotonic() + PROXY_START_TIMEOUT
+    start_lock = None
+    started = 0.0
+
+    try:
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                sock.connect(socket_path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+
+                if not proxy_command or time.monotonic() > deadline:
+                    raise
+
+                # Sessions often start several clients at once; one of them
+                # starts the proxy while the others wait for it
+                if start_lock is None:
+                    start_lock = start_proxy(socket_path, proxy_command)
+                    started = time.monotonic()
+                elif time.monotonic() - started > PROXY_RESTART_INTERVAL:
+                    # The proxy gives up if one that is still shutting down
+                    # holds its lock; only one of those started stays running
+                    start_lock.close()
+                    start_lock = None
+                    continue
+
+                time.sleep(0.01)
+            else:
+                return sock
+    finally:
+        if start_lock is not None:
+            start_lock.close()
+
+
+def copy_stdin(sock: socket.socket) -> None:
+    """Forward stdin to the socket until either side is closed."""
+    with contextlib.suppress(OSError):
+        while data := os.read(0, 65536):
+            sock.sendall(data)
+
+        sock.shutdown(socket.SHUT_WR)
+
+
+def main() -> int:
+    """Relay stdio to the proxy.
+
+    Returns
+    -------
+    int
+        Exit code (0 once the proxy closes the session, 1 on errors)
+    """
+    if len(sys.argv) < 3:
+        print(__doc__.split("Usage")[1].strip("-\n"), file=sys.stderr)
+        return 1
+
+    socket_path, server, *proxy_command = sys.argv[1:]
+
+    try:
+        sock = connect(socket_path, proxy_command)
+        sock.sendall(json.dumps({"server": server}).encode() + b"\n")
+        reply = sock.makefile("rb", buffering=0)
+        line = reply.readline()
+    except OSError as e:
+        print(f"Error: Could not connect to MCP proxy: {e}", file=sys.stderr)
+        return 1
+
+    status = json.loads(line or b'{"error": "MCP proxy closed the connection"}')
+
+    if "error" in status:
+        print(f"Error: {status['error']}", file=sys.stderr)
+        return 1
+
+    threading.Thread(target=copy_stdin, args=(sock,), daemon=True).start()
+    stdout = sys.stdout.buffer
+
+    with contextlib.suppress(OSError):
+        while data := sock.recv(65536):
+            stdout.write(data)
+            stdout.flush()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""Content-addressed store of config files as they were before a sync."""
+
+import contextlib
+import gzip
+import hashlib
+import json
+import lzma
+import threading
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from types import ModuleType
+from typing import Any, NamedTuple
+
+from mcp_servers import cache_dir
+
+# Compressors for the backup store, keyed by the name used in config.yml
+_BACKUP_COMPRESSIONS: dict[str, tuple[str, ModuleType]] = {
+    "gzip": (".gz", gzip),
+    "lzma": (".xz", lzma),
+}
+
+
+class BackupSnapshot(NamedTuple):
+    """A file's content as it was before a sync changed it.
+
+    Attributes
+    ----------
+    id : str
+        Snapshot identifier, "<UTC timestamp>-<digest>"
+    path : str
+        File the content was read from
+    sha256 : str
+        SHA-256 hex digest of the uncompressed content
+    size : int
+        Size of the uncompressed content in bytes
+    created : str
+        When the snapshot was taken, as an ISO 8601 UTC timestamp
+    """
+
+    id: str
+    path: str
+    sha256: str
+    size: int
+    created: str
+
+
+class BackupStore:
+    """Content-addressed, compressed store of MCP config backups.
+
+    Each distinct file content is stored once, as objects/<aa>/<sha256>.gz
+    (or .xz), however many snapshots refer to it. snapshots.json lists which
+    file held which content when. Old snapshots are evicted by prune(), and
+    objects no snapshot refers to are deleted with them.
+    """
+
+    VERSION = 1
+    INDEX_FILENAME = "snapshots.json"
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        compression: str = "gzip",
+        keep: int | None = 20,
+        max_age_days: float | None = 30,
+    ) -> None:
+        """Initialize a store; nothing is created on disk until the first save.
+
+        Parameters
+        ----------
+        root : Path
+            Directory holding the index and objects
+        compression : str, optional
+            "gzip" or "lzma"; used for new objects only
+        keep : int | None, optional
+            Snapshots kept per file, or None for no limit
+        max_age_days : float | None, optional
+            Age after which snapshots are evicted, or None for no limit. The
+            newest snapshot of each file is kept regardless of age.
+        """
+        self.root = root
+        self._suffix, self._compressor = _BACKUP_COMPRESSIONS[compression]
+        self._keep = keep
+        self._max_age_days = max_age_days
+        # Serializes index updates from concurrent MCP merges
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> "BackupStore":
+        """Create a store from the optional backups section of config.yml.
+
+        Parameters
+        ----------
+        config : dict[str, Any]
+            Loaded configuration dictionary
+
+        Returns
+        -------
+        BackupStore
+            Store with the configured (or default) location and policy
+
+        Raises
+        ------
+        ValueError
+            If the backups section has invalid values
+        """
+        settings = config.get("backups") or {}
+        compression = settings.get("compression", "gzip")
+        keep = settings.get("keep", 20)
+        max_age_days = settings.get("max_age_days", 30)
+
+        if compression not in _BACKUP_COMPRESSIONS:
+            raise ValueError(
+                f"backups.compression must be one of "
+                f"{', '.join(_BACKUP_COMPRESSIONS)}, got {compression!r}",
+            )
+
+        if keep is not None and (type(keep) is not int or keep < 1):
+            raise ValueError(f"backups.keep must be a positive integer, got {keep!r}")
+
+        if max_age_days is not None and (
+            isinstance(max_age_days, bool)
+            or not isinstance(max_age_days, int | float)
+            or max_age_days <= 0
+        ):
+            raise ValueError(
+                f"backups.max_age_days must be a positive number, got {max_age_days!r}",
+            )
+
+        directory = settings.get("directory")
+
+        return cls(
+            Path(directory).expanduser() if directory else cache_dir() / "backups",
+            compression=compression,
+            keep=keep,
+            max_age_days=max_age_days,
+        )
+
+    def _object_path(self, digest: str) -> Path | None:
+        """Return the stored object for a digest, whatever its compression."""
+        for suffix, _ in _BACKUP_COMPRESSIONS.values():
+            path = self.root / "objects" / digest[:2] / f"{digest}{suffix}"
+
+            if path.exists():
+                return path
+
+        return None
+
+    def _write_object(self, digest: str, data: bytes) -> None:
+        """Compress data into the object file for digest."""
+        object_path = self.root / "objects" / digest[:2] / f"{digest}{self._suffix}"
+        # Backed-up config files can hold secrets
+        self.root.mkdir(mode=0o700, parents=True, exist_ok=True)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = object_path.with_name(object_path.name + ".tmp")
+
+        try:
+            temp_path.write_bytes(self._compressor.compress(data))
+            temp_path.replace(object_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def snapshots(self) -> list[BackupSnapshot]:
+        """Return every snapshot in the store, oldest first."""
+        try:
+            data = json.loads((self.root / self.INDEX_FILENAME).read_text())
+        except FileNotFoundError:
+            return []
+
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            raise ValueError(f"Unsupported backup index in {self.root}")
+
+        return [BackupSnapshot(**entry) for entry in data["snapshots"]]
+
+    def _write_index(self, snapshots: list[BackupSnapshot]) -> None:
+        """Replace the index via a temp file for atomicity."""
+        index_path = self.root / self.INDEX_FILENAME
+        temp_path = index_path.with_suffix(".tmp")
+        data = {
+            "version": self.VERSION,
+            "snapshots": [snapshot._asdict() for snapshot in snapshots],
+        }
+
+        try:
+            temp_path.write_text(json.dumps(data, indent=2) + "\n")
+            temp_path.replace(index_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def save(self, path: Path, data: bytes) -> BackupSnapshot:
+        """Record data as the content of path before it is changed.
+
+        The content is compressed and stored only if no snapshot of any file
+        already holds it, and no new snapshot is added if it matches the
+        newest snapshot of path.
+
+        Parameters
+        ----------
+        path : Path
+            File the content belongs to
+        data : bytes
+            Current content of the file
+
+        Returns
+        -------
+        BackupSnapshot
+            The new snapshot, or the existing one holding the same content
+
+        Raises
+        ------
+        OSError
+            If the store cannot be written
+        ValueError
+            If the index is unreadable
+        """
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            snapshots = self.snapshots()
+            latest = next((s for s in reversed(snapshots) if s.path == str(path)), None)
+
+            if latest is not None and latest.sha256 == digest:
+                return latest
+
+            if self._object_path(digest) is None:
+                self._write_object(digest, data)
+
+            now = datetime.now(tz=UTC)
+            id_digest = hashlib.sha256(f"{path}\0{digest}\0{now}".encode()).hexdigest()
+            snapshot = BackupSnapshot(
+                id=f"{now:%Y%m%d-%H%M%S}-{id_digest[:8]}",
+                path=str(path),
+                sha256=digest,
+                size=len(data),
+                created=now.isoformat(timespec="seconds"),
+            )
+            self._write_index([*snapshots, snapshot])
+
+            return snapshot
+
+    def find(self, snapshot_id: str) -> BackupSnapshot:
+        """Look up a snapshot by its id or a unique prefix of it.
+
+        Raises
+        ------
+        KeyError
+            If no snapshot, or more than one, matches
+        """
+        matches = [s for s in self.snapshots() if s.id.startswith(snapshot_id)]
+
+        if len(matches) != 1:
+            problem = "No" if not matches else f"{len(matches)}"
+            raise KeyError(f"{problem} snapshots match {snapshot_id!r}")
+
+        return matches[0]
+
+    def read(self, snapshot: BackupSnapshot) -> bytes:
+        """Return the content of a snapshot.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the snapshot's object is missing
+        ValueError
+            If the object does not match the snapshot's digest
+        """
+        object_path = self._object_path(snapshot.sha256)
+
+        if object_path is None:
+            raise FileNotFoundError(f"Backup object for {snapshot.id} is missing")
+
+        compressor = next(
+            module
+            for suffix, module in _BACKUP_COMPRESSIONS.values()
+            if object_path.suffix == suffix
+        )
+        data = compressor.decompress(object_path.read_bytes())
+
+        if hashlib.sha256(data).hexdigest() != snapshot.sha256:
+            raise ValueError(f"Backup object for {snapshot.id} is corrupt")
+
+        return data
+
+    def prune(self) -> int:
+        """Evict snapshots beyond the retention policy and unused objects.
+
+        Returns
+        -------
+        int
+            Number of snapshots evicted
+        """
+        with self._lock:
+            snapshots = self.snapshots()
+            cutoff = (
+                None
+                if self._max_age_days is None
+                else datetime.now(tz=UTC) - timedelta(days=self._max_age_days)
+            )
+            by_path: dict[str, list[BackupSnapshot]] = {}
+
+            for snapshot in snapshots:
+                by_path.setdefault(snapshot.path, []).append(snapshot)
+
+            kept = set()
+
+            for history in by_path.values():
+                recent = history[-self._keep :] if self._keep is not None else history
+                kept.add(recent[-1])
+                kept.update(
+                    s
+                    for s in recent
+                    if cutoff is None or datetime.fromisoformat(s.created) >= cutoff
+                )
+
+            remaining = [s for s in snapshots if s in kept]
+
+            if len(remaining) != len(snapshots):
+                self._write_index(remaining)
+
+            referenced = {s.sha256 for s in remaining}
+
+            for object_path in self.root.glob("objects/*/*"):
+                if object_path.name.split(".", 1)[0] not in referenced:
+                    object_path.unlink(missing_ok=True)
+
+            return len(snapshots) - len(remaining)
+
+    def restore(self, snapshot: BackupSnapshot, target: Path | None = None) -> Path:
+        """Write a snapshot's content back, backing up what it replaces.
+
+        Parameters
+        ----------
+        snapshot : BackupSnapshot
+            Snapshot to restore
+        target : Path | None, optional
+            Where to write it (default: the file it was taken from)
+
+        Returns
+        -------
+        Path
+            The restored file
+        """
+        data = self.read(snapshot)
+        target = target or Path(snapshot.path)
+
+        with contextlib.suppress(FileNotFoundError):
+            current = target.read_bytes()
+
+            if current != data:
+                self.save(target, current)
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_suffix(target.suffix + ".tmp")
+        temp_path.write_bytes(data)
+        temp_path.replace(target)
+
+        return target
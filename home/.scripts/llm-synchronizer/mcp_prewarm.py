@@ -0,0 +1,544 @@
+"""Pinned environments for uvx and npx MCP servers."""
+
+import hashlib
+import itertools
+import json
+import re
+import shutil
+import subprocess
+from collections.abc import Callable, Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from textwrap import indent
+from typing import Any, NamedTuple
+
+from mcp_servers import mcp_server_argv
+
+PREWARM_TIMEOUT = 600
+
+
+class PrewarmError(Exception):
+    """A uvx or npx command could not be installed into a pinned environment."""
+
+
+class LauncherCommand(NamedTuple):
+    """A server command line that installs its package on every launch.
+
+    Attributes
+    ----------
+    launcher : str
+        "uvx" or "npx"
+    packages : list[str]
+        Package specs to install
+    executable : str | None
+        Executable to run, or None for the one the first package provides
+    args : list[str]
+        Arguments passed to the executable
+    install_options : list[str]
+        Options for the installer, such as package indexes
+    python : str | None
+        Python version or interpreter requested with uvx --python
+    """
+
+    launcher: str
+    packages: list[str]
+    executable: str | None
+    args: list[str]
+    install_options: list[str] = []  # noqa: RUF012 - NamedTuple defaults are not mutated
+    python: str | None = None
+
+
+# uvx flags that do not change what is installed
+_UVX_FLAGS = {"--isolated", "--offline", "--quiet", "-q", "--refresh"}
+_UVX_INDEX_OPTIONS = {"--index", "--default-index", "--index-url", "--extra-index-url"}
+_NPX_FLAGS = {"--yes", "-y", "--quiet", "-q"}
+
+
+def _split_options(
+    args: list[str],
+    flags: set[str],
+    value_options: set[str],
+    launcher: str,
+) -> tuple[list[tuple[str, str | None]], list[str]]:
+    """Split leading launcher options from the command and its arguments.
+
+    Returns
+    -------
+    tuple[list[tuple[str, str | None]], list[str]]
+        Each option with its value (None for flags), and the remaining
+        arguments
+
+    Raises
+    ------
+    PrewarmError
+        If an option is not supported or lacks its value
+    """
+    options: list[tuple[str, str | None]] = []
+    index = 0
+
+    while index < len(args) and args[index].startswith("-"):
+        option, has_value, value = args[index].partition("=")
+        index += 1
+
+        if option == "--":
+            break
+
+        if option in flags:
+            options.append((option, None))
+        elif option in value_options:
+            if not has_value:
+                if index == len(args):
+                    raise PrewarmError(f"{launcher} {option} needs a value")
+
+                value = args[index]
+                index += 1
+
+            options.append((option, value))
+        else:
+            raise PrewarmError(f"Unsupported {launcher} option: {option}")
+
+    if index == len(args):
+        raise PrewarmError(f"{launcher} is not given a command to run")
+
+    return options, args[index:]
+
+
+def _parse_uvx(args: list[str]) -> LauncherCommand:
+    """Parse the arguments of uvx (or uv tool run)."""
+    options, (command, *server_args) = _split_options(
+        args,
+        _UVX_FLAGS,
+        {"--from", "--with", "--python", "-p", *_UVX_INDEX_OPTIONS},
+        "uvx",
+    )
+    source = next((value for option, value in options if option == "--from"), None)
+
+    if source is None:
+        # uvx name[extra]@version runs the executable name of that package
+        name, _, version = command.partition("@")
+        source = f"{name}=={version}" if version and version != "latest" else name
+        command = name.split("[", 1)[0]
+
+    return LauncherCommand(
+        launcher="uvx",
+        packages=[
+            source,
+            *(str(value) for option, value in options if option == "--with"),
+        ],
+        executable=command,
+        args=server_args,
+        install_options=[
+            str(item)
+            for option, value in options
+            if option in _UVX_INDEX_OPTIONS
+            for item in (option, value)
+        ],
+        python=next(
+            (value for option, value in options if option in {"--python", "-p"}),
+            None,
+        ),
+    )
+
+
+def _parse_npx(args: list[str]) -> LauncherCommand:
+    """Parse the arguments of npx."""
+    options, (command, *server_args) = _split_options(
+        args,
+        _NPX_FLAGS,
+        {"--package", "-p"},
+        "npx",
+    )
+    packages = [str(value) for option, value in options if value is not None]
+
+    return LauncherCommand(
+        launcher="npx",
+        packages=packages or [command],
+        # Without --package, the command is a package providing the executable
+        executable=command if packages else None,
+        args=server_args,
+    )
+
+
+def parse_launcher_command(values: dict[str, Any]) -> LauncherCommand | None:
+    """Parse a server's command line if it is started through uvx or npx.
+
+    Returns
+    -------
+    LauncherCommand | None
+        The packages to install and the executable to run, or None if the
+        server is not started through a supported launcher
+
+    Raises
+    ------
+    PrewarmError
+        If the launcher is used with options that cannot be pinned
+    """
+    argv = mcp_server_argv(values)
+    launcher = Path(argv[0]).name
+
+    if launcher == "uv" and argv[1:3] == ["tool", "run"]:
+        launcher, argv = "uvx", argv[2:]
+
+    parser = PREWARM_LAUNCHERS.get(launcher)
+
+    return None if parser is None else parser(argv[1:])
+
+
+def _run_installer(argv: list[str]) -> str:
+    """Run an installer command and return its output.
+
+    Raises
+    ------
+    PrewarmError
+        If the command fails or cannot be run
+    """
+    try:
+        completed = subprocess.run(
+            argv,
+            capture_output=True,
+            text=True,
+            timeout=PREWARM_TIMEOUT,
+            check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise PrewarmError(f"{Path(argv[0]).name}: {e}") from e
+
+    if completed.returncode != 0:
+        subcommand = " ".join(
+            itertools.takewhile(lambda arg: not arg.startswith("-"), argv[1:]),
+        )
+        # Installers explain failures over several lines
+        output = completed.stderr.strip() or f"exit status {completed.returncode}"
+        raise PrewarmError(
+            f"{Path(argv[0]).name} {subcommand} failed:\n{indent(output, '      ')}",
+        )
+
+    return completed.stdout
+
+
+def _find_installer(name: str) -> str:
+    """Return the path of an installer executable.
+
+    Raises
+    ------
+    PrewarmError
+        If it is not on PATH
+    """
+    path = shutil.which(name)
+
+    if path is None:
+        raise PrewarmError(f"{name} is not installed")
+
+    return path
+
+
+def _install_uvx(
+    command: LauncherCommand,
+    directory: Path,
+    *,
+    offline: bool,
+) -> tuple[Path, list[str]]:
+    """Install a uvx command's packages into a virtual environment.
+
+    Returns
+    -------
+    tuple[Path, list[str]]
+        The executable, and the installed packages as pinned requirements
+    """
+    uv = _find_installer("uv")
+    offline_flag = ["--offline"] if offline else []
+    python = ["--python", command.python] if command.python else []
+    _run_installer([uv, "venv", "--quiet", *offline_flag, *python, str(directory)])
+    interpreter = str(directory / "bin" / "python")
+    _run_installer(
+        [
+            uv,
+            "pip",
+            "install",
+            "--quiet",
+            *offline_flag,
+            "--python",
+            interpreter,
+            *command.install_options,
+            *command.packages,
+        ],
+    )
+    pinned = _run_installer([uv, "pip", "freeze", "--python", interpreter])
+
+    return directory / "bin" / str(command.executable), pinned.splitlines()
+
+
+def _npm_package_name(spec: str) -> str:
+    """Return the package name of an npm spec such as @scope/name@1.0."""
+    at = spec.rfind("@")
+
+    return spec[:at] if at > 0 else spec
+
+
+def _install_npx(
+    command: LauncherCommand,
+    directory: Path,
+    *,
+    offline: bool,
+) -> tuple[Path, list[str]]:
+    """Install an npx command's packages into a node_modules directory.
+
+    Returns
+    -------
+    tuple[Path, list[str]]
+        The executable, and the installed packages as name@version
+
+    Raises
+    ------
+    PrewarmError
+        If the executable of the package cannot be determined
+    """
+    npm = _find_installer("npm")
+    _run_installer(
+        [
+            npm,
+            "install",
+            "--prefix",
+            str(directory),
+            "--no-audit",
+            "--no-fund",
+            "--loglevel=error",
+            *(["--offline"] if offline else []),
+            *command.packages,
+        ],
+    )
+    executable = command.executable
+
+    if executable is None:
+        # Like npx: the package's only executable, or the one named after it
+        name = _npm_package_name(command.packages[0])
+        manifest = json.loads(
+            (directory / "node_modules" / name / "package.json").read_text(),
+        )
+        bins = manifest.get("bin")
+        short_name = name.rsplit("/", 1)[-1]
+
+        if isinstance(bins, str) or (isinstance(bins, dict) and short_name in bins):
+            executable = short_name
+        elif isinstance(bins, dict) and len(bins) == 1:
+            executable = next(iter(bins))
+        else:
+            raise PrewarmError(f"Cannot tell which executable of {name} to run")
+
+    lock = json.loads((directory / "package-lock.json").read_text())
+    pinned = [
+        f"{path.removeprefix('node_modules/')}@{package['version']}"
+        for path, package in lock.get("packages", {}).items()
+        if path.count("node_modules/") == 1 and "version" in package
+    ]
+
+    return directory / "node_modules" / ".bin" / executable, pinned
+
+
+# Parser and installer of each supported launcher, keyed by executable name
+PREWARM_LAUNCHERS: dict[str, Callable[[list[str]], LauncherCommand]] = {
+    "npx": _parse_npx,
+    "uvx": _parse_uvx,
+}
+PREWARM_INSTALLERS: dict[str, Callable[..., tuple[Path, list[str]]]] = {
+    "npx": _install_npx,
+    "uvx": _install_uvx,
+}
+
+
+class PrewarmedServer(NamedTuple):
+    """A server's launcher command, resolved to an installed executable.
+
+    Attributes
+    ----------
+    name : str
+        Server name
+    source : list[str]
+        Command line in config.yml the environment was installed from
+    executable : str
+        Installed executable that is started instead
+    args : list[str]
+        Arguments passed to the executable
+    environment : str
+        Directory holding the installed packages
+    pinned : list[str]
+        Installed packages and their versions
+    created : str
+        When the environment was installed, as an ISO 8601 UTC timestamp
+    """
+
+    name: str
+    source: list[str]
+    executable: str
+    args: list[str]
+    environment: str
+    pinned: list[str]
+    created: str
+
+
+class PrewarmStore:
+    """Pinned environments of MCP servers started through uvx or npx.
+
+    Each server's packages are installed once into environments/<name>-<id>.
+    prewarmed.json records, per server, the command line in config.yml the
+    environment was installed from, so it can be refreshed from it later,
+    and the executable to start instead.
+    """
+
+    VERSION = 1
+    INDEX_FILENAME = "prewarmed.json"
+
+    def __init__(self, root: Path) -> None:
+        """Initialize a store; nothing is created on disk until an install.
+
+        Parameters
+        ----------
+        root : Path
+            Directory holding the index and environments
+        """
+        self.root = root
+
+    def entries(self) -> dict[str, PrewarmedServer]:
+        """Return the prewarmed servers, keyed by server name."""
+        try:
+            data = json.loads((self.root / self.INDEX_FILENAME).read_text())
+        except FileNotFoundError:
+            return {}
+
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            raise ValueError(f"Unsupported prewarm index in {self.root}")
+
+        return {entry["name"]: PrewarmedServer(**entry) for entry in data["servers"]}
+
+    def _write_index(self, entries: dict[str, PrewarmedServer]) -> None:
+        """Replace the index via a temp file for atomicity."""
+        index_path = self.root / self.INDEX_FILENAME
+        temp_path = index_path.with_suffix(".tmp")
+        data = {
+            "version": self.VERSION,
+            "servers": [entry._asdict() for entry in entries.values()],
+        }
+
+        try:
+            temp_path.write_text(json.dumps(data, indent=2) + "\n")
+            temp_path.replace(index_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def install(
+        self,
+        name: str,
+        source: list[str],
+        command: LauncherCommand,
+        *,
+        offline: bool = False,
+    ) -> PrewarmedServer:
+        """Install a launcher command's packages and record the executable.
+
+        The previous environment of the server, if any, is deleted once the
+        new one is recorded.
+
+        Parameters
+        ----------
+        name : str
+            Server name
+        source : list[str]
+            Command line in config.yml, as recorded for later refreshes
+        command : LauncherCommand
+            Parsed command line, with placeholders resolved
+        offline : bool, optional
+            Install from the launcher's local cache only
+
+        Returns
+        -------
+        PrewarmedServer
+            The recorded entry
+
+        Raises
+        ------
+        PrewarmError
+            If the packages or the executable cannot be installed
+        """
+        now = datetime.now(UTC)
+        digest = hashlib.sha256(f"{source}\0{now.isoformat()}".encode()).hexdigest()
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        directory = self.root / "environments" / f"{safe_name}-{digest[:8]}"
+        directory.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            executable, pinned = PREWARM_INSTALLERS[command.launcher](
+                command,
+                directory,
+                offline=offline,
+            )
+        except PrewarmError:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        except (OSError, ValueError) as e:
+            # Unreadable package.json or lock file of an npm install
+            shutil.rmtree(directory, ignore_errors=True)
+            raise PrewarmError(str(e)) from e
+
+        if not executable.exists():
+            shutil.rmtree(directory, ignore_errors=True)
+            raise PrewarmError(f"{executable.name} was not installed")
+
+        entry = PrewarmedServer(
+            name=name,
+            source=source,
+            executable=str(executable),
+            args=command.args,
+            environment=str(directory),
+            pinned=pinned,
+            created=now.isoformat(timespec="seconds"),
+        )
+        entries = self.entries()
+        previous = entries.get(name)
+        entries[name] = entry
+        self._write_index(entries)
+
+        if previous is not None:
+            shutil.rmtree(previous.environment, ignore_errors=True)
+
+        return entry
+
+    def remove(self, names: Iterable[str]) -> list[str]:
+        """Delete the environments of servers and forget them.
+
+        Returns
+        -------
+        list[str]
+            Names that were prewarmed
+        """
+        entries = self.entries()
+        removed = [name for name in names if name in entries]
+
+        if removed:
+            for name in removed:
+                shutil.rmtree(entries.pop(name).environment, ignore_errors=True)
+
+            self._write_index(entries)
+
+        return removed
+
+
+class PrewarmResult(NamedTuple):
+    """Outcome of prewarming one server.
+
+    Attributes
+    ----------
+    name : str
+        Server name
+    entry : PrewarmedServer | None
+        The server's environment, or None if it could not be installed
+    installed : bool
+        Whether the environment was installed by this run
+    error : str | None
+        Why the server could not be prewarmed
+    """
+
+    name: str
+    entry: PrewarmedServer | None = None
+    installed: bool = False
+    error: str | None = None
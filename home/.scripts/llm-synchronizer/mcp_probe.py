@@ -0,0 +1,103 @@
+"""Startup probe of local MCP servers."""
+
+import shlex
+import time
+from typing import NamedTuple
+
+from mcp_servers import (
+    MCPServerConfig,
+    MCPServerError,
+    format_server_info,
+    initialize_params,
+    mcp_request,
+    mcp_server_argv,
+    process_tree_rss,
+    spawn_mcp_server,
+    stop_process_group,
+)
+
+PROBE_TIMEOUT = 60.0
+PROBE_SLOW_MS = 2000.0
+
+
+class ProbeResult(NamedTuple):
+    """Startup measurements of one MCP server.
+
+    Attributes
+    ----------
+    name : str
+        Server name
+    command : str
+        Command line the server was started with
+    spawn_ms : float | None
+        Time taken to create the server process
+    response_ms : float | None
+        Time from starting the process to its initialize response
+    rss_kb : int | None
+        Resident memory of the server's process tree once initialized
+        (Linux only)
+    server_info : str | None
+        Name and version the server reported
+    error : str | None
+        Why the probe failed, or None if it succeeded
+    """
+
+    name: str
+    command: str
+    spawn_ms: float | None = None
+    response_ms: float | None = None
+    rss_kb: int | None = None
+    server_info: str | None = None
+    error: str | None = None
+
+
+def probe_mcp_server(
+    server: MCPServerConfig,
+    *,
+    timeout: float = PROBE_TIMEOUT,
+) -> ProbeResult:
+    """Start a local MCP server, run the initialize handshake and stop it.
+
+    Parameters
+    ----------
+    server : MCPServerConfig
+        Server to probe; its values must have a command
+    timeout : float, optional
+        Seconds to wait for the initialize response
+
+    Returns
+    -------
+    ProbeResult
+        Timings and memory use, or the error that stopped the probe
+    """
+    result = ProbeResult(
+        name=server.name,
+        command=shlex.join(mcp_server_argv(server.values)),
+    )
+    start = time.perf_counter()
+
+    try:
+        process = spawn_mcp_server(server.values)
+    except OSError as e:
+        return result._replace(error=str(e))
+
+    result = result._replace(spawn_ms=(time.perf_counter() - start) * 1000)
+
+    try:
+        initialized = mcp_request(
+            process,
+            1,
+            "initialize",
+            initialize_params("sync-agents-probe"),
+            start + timeout,
+        )
+        result = result._replace(
+            response_ms=(time.perf_counter() - start) * 1000,
+            rss_kb=process_tree_rss(process.pid),
+        )
+    except MCPServerError as e:
+        return result._replace(error=str(e))
+    finally:
+        stop_process_group(process)
+
+    return result._replace(server_info=format_server_info(initialized))
@@ -0,0 +1,740 @@
+"""Multiplexing proxy that shares local MCP servers between sessions."""
+
+import hashlib
+import json
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, NamedTuple, Self
+
+from mcp_servers import (
+    MCPServerConfig,
+    cache_dir,
+    mcp_server_argv,
+    process_tree_rss,
+    spawn_mcp_server,
+    stop_process_group,
+)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+
+PROXY_IDLE_TIMEOUT = 600.0
+# Stdio client that provider CLIs start in place of a proxied server
+PROXY_CLIENT = Path(__file__).resolve().with_name("mcp-proxy-connect.py")
+# Values that decide how a server process is started. The proxy holds them, so
+# they are not written to provider configs for proxied servers.
+PROXY_SPAWN_KEYS = ("command", "args", "env", "cwd")
+_JSONRPC_METHOD_NOT_FOUND = -32601
+_JSONRPC_INTERNAL_ERROR = -32603
+
+
+class MCPProxySettings(NamedTuple):
+    """Settings of the optional MCP multiplexing proxy.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether provider configs start local servers through the proxy
+    socket : Path
+        Unix socket the proxy listens on
+    idle_timeout : float
+        Seconds a pooled server is kept running without sessions. The proxy
+        exits once it has had no servers or sessions for as long.
+    """
+
+    enabled: bool
+    socket: Path
+    idle_timeout: float
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any], config_file: Path) -> Self:
+        """Read the optional mcp_proxy section of config.yml.
+
+        Parameters
+        ----------
+        config : dict[str, Any]
+            Loaded configuration dictionary
+        config_file : Path
+            Path of the config file; the default socket is specific to it
+
+        Returns
+        -------
+        MCPProxySettings
+            Configured (or default) settings
+
+        Raises
+        ------
+        ValueError
+            If the mcp_proxy section has invalid values
+        """
+        settings = config.get("mcp_proxy") or {}
+        idle_timeout = settings.get("idle_timeout", PROXY_IDLE_TIMEOUT)
+
+        if (
+            isinstance(idle_timeout, bool)
+            or not isinstance(idle_timeout, int | float)
+            or idle_timeout <= 0
+        ):
+            raise ValueError(
+                f"mcp_proxy.idle_timeout must be a positive number, "
+                f"got {idle_timeout!r}",
+            )
+
+        socket_path = settings.get("socket")
+        config_digest = hashlib.sha256(str(config_file).encode()).hexdigest()[:12]
+
+        return cls(
+            enabled=bool(settings.get("enabled", False)),
+            socket=(
+                Path(socket_path).expanduser()
+                if socket_path
+                else cache_dir() / f"mcp-proxy-{config_digest}.sock"
+            ),
+            idle_timeout=float(idle_timeout),
+        )
+
+
+def proxy_request(socket_path: Path, message: dict[str, Any]) -> dict[str, Any]:
+    """Send a control message to a running proxy and return its reply.
+
+    Raises
+    ------
+    OSError
+        If no proxy is listening on socket_path
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(message).encode() + b"\n")
+
+        with sock.makefile("rb") as reply:
+            return json.loads(reply.readline() or b"{}")
+
+
+class _JsonRpcStream:
+    """Newline-delimited JSON-RPC messages over non-blocking descriptors."""
+
+    def __init__(self, read_fd: int, write_fd: int) -> None:
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self._partial = bytearray()
+        self.outgoing = bytearray()
+
+    def feed(self, data: bytes) -> list[dict[str, Any]]:
+        """Return the messages completed by data.
+
+        Lines that are not JSON objects, such as log output some servers
+        print to stdout, are skipped.
+        """
+        self._partial += data
+
+        if b"\n" not in data:
+            return []
+
+        *lines, self._partial = self._partial.split(b"\n")
+        messages = []
+
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+
+            if isinstance(message, dict):
+                messages.append(message)
+
+        return messages
+
+    def send(self, message: dict[str, Any]) -> None:
+        """Queue a message; flush() writes it."""
+        self.outgoing += json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+    def flush(self) -> bool:
+        """Write as much queued output as possible.
+
+        Returns
+        -------
+        bool
+            Whether output is still queued because the descriptor is full
+
+        Raises
+        ------
+        OSError
+            If the other end has been closed
+        """
+        while self.outgoing:
+            try:
+                written = os.write(self.write_fd, self.outgoing)
+            except BlockingIOError:
+                return True
+
+            del self.outgoing[:written]
+
+        return False
+
+
+@dataclass(eq=False)
+class _ProxySession:
+    """A provider CLI's connection to the proxy, for one MCP server."""
+
+    sock: socket.socket
+    stream: _JsonRpcStream
+    server: "_PooledServer | None" = None
+    # Closed once queued output is written
+    closing: bool = False
+
+
+@dataclass(eq=False)
+class _PooledServer:
+    """A server process shared by every session with the same spawn values."""
+
+    key: str
+    name: str
+    process: subprocess.Popen[bytes]
+    stream: _JsonRpcStream
+    sessions: set[_ProxySession] = field(default_factory=set)
+    # Proxy id of the initialize request sent on behalf of the first session
+    initialize_id: int | None = None
+    # The server's initialize result, returned to every session
+    initialize_result: dict[str, Any] | None = None
+    # Sessions waiting for the initialize result, with their request ids
+    initializing: list[tuple[_ProxySession, Any]] = field(default_factory=list)
+    idle_since: float | None = None
+
+
+class MCPProxy:
+    """Multiplexes MCP sessions of provider CLIs onto pooled server processes.
+
+    Sessions connect to a Unix socket and name a server. The first session
+    for a server starts it and its initialize request is forwarded, without
+    the client capabilities, since server requests such as roots/list or
+    sampling could not be routed to one session. Later sessions get the
+    cached initialize result at once. Request ids and progress tokens are
+    rewritten so sessions cannot collide, responses are routed back to the
+    session that sent the request, and other notifications are broadcast.
+    Servers without sessions are stopped after the idle timeout.
+
+    Everything runs on one thread around a selector.
+    """
+
+    def __init__(
+        self,
+        settings: MCPProxySettings,
+        resolve_server: Callable[[str], MCPServerConfig],
+    ) -> None:
+        """Initialize a proxy; nothing happens until serve() is called.
+
+        Parameters
+        ----------
+        settings : MCPProxySettings
+            Socket path and idle timeout
+        resolve_server : Callable[[str], MCPServerConfig]
+            Returns the server to start for a name, with placeholders
+            resolved, or raises ValueError
+        """
+        self._settings = settings
+        self._resolve_server = resolve_server
+        self._selector = selectors.DefaultSelector()
+        self._servers: dict[str, _PooledServer] = {}
+        self._sessions: set[_ProxySession] = set()
+        # Forwarded requests by proxy id: the session and its own request id
+        self._requests: dict[int, tuple[_ProxySession, Any]] = {}
+        # Rewritten progress tokens: the session and its own token
+        self._progress: dict[str, tuple[_ProxySession, Any]] = {}
+        self._last_id = 0
+        # Sessions and servers with queued output
+        self._dirty: set[_ProxySession | _PooledServer] = set()
+        self._idle_since: float | None = time.monotonic()
+        self._running = False
+
+    def _new_id(self) -> int:
+        self._last_id += 1
+
+        return self._last_id
+
+    def serve(self) -> bool:
+        """Accept sessions until stopped, idle or interrupted.
+
+        Returns
+        -------
+        bool
+            False if another proxy already serves the socket
+        """
+        path = self._settings.socket
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        with path.with_name(path.name + ".lock").open("a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+
+            path.unlink(missing_ok=True)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(str(path))
+            path.chmod(0o600)
+            listener.listen(128)
+            listener.settimeout(0)  # non-blocking
+            self._selector.register(
+                listener,
+                selectors.EVENT_READ,
+                lambda _events: self._accept(listener),
+            )
+            previous_handler = signal.signal(signal.SIGTERM, signal.default_int_handler)
+            self._running = True
+            print(f"MCP proxy listening on {path}")
+
+            try:
+                self._run()
+            finally:
+                signal.signal(signal.SIGTERM, previous_handler)
+                path.unlink(missing_ok=True)
+                listener.close()
+
+                for pooled in list(self._servers.values()):
+                    self._stop_server(pooled, "proxy stopped")
+
+                for session in list(self._sessions):
+                    self._close_session(session)
+
+                self._selector.close()
+
+        return True
+
+    def _run(self) -> None:
+        while self._running:
+            for key, events in self._selector.select(self._next_timeout()):
+                key.data(events)
+
+            for owner in list(self._dirty):
+                self._flush(owner)
+
+            self._dirty.clear()
+            self._expire_idle()
+
+    def _next_timeout(self) -> float | None:
+        """Return the time until a server or the proxy itself becomes idle."""
+        deadlines = [
+            pooled.idle_since
+            for pooled in self._servers.values()
+            if pooled.idle_since is not None
+        ]
+
+        if self._idle_since is not None:
+            deadlines.append(self._idle_since)
+
+        if not deadlines:
+            return None
+
+        return max(
+            0.0,
+            min(deadlines) + self._settings.idle_timeout - time.monotonic(),
+        )
+
+    def _expire_idle(self) -> None:
+        now = time.monotonic()
+
+        for pooled in list(self._servers.values()):
+            if (
+                pooled.idle_since is not None
+                and now - pooled.idle_since >= self._settings.idle_timeout
+            ):
+                self._stop_server(pooled, "idle")
+
+        if self._sessions or self._servers:
+            self._idle_since = None
+        elif self._idle_since is None:
+            self._idle_since = now
+        elif now - self._idle_since >= self._settings.idle_timeout:
+            print("MCP proxy idle, exiting")
+            self._running = False
+
+    def status(self) -> dict[str, Any]:
+        """Return the pooled servers and session counts."""
+        return {
+            "pid": os.getpid(),
+            "sessions": sum(session.server is not None for session in self._sessions),
+            "servers": [
+                {
+                    "name": pooled.name,
+                    "pid": pooled.process.pid,
+                    "sessions": len(pooled.sessions),
+                    "initialized": pooled.initialize_result is not None,
+                    "rss_kb": process_tree_rss(pooled.process.pid),
+                }
+                for pooled in self._servers.values()
+            ],
+        }
+
+    def _flush(self, owner: _ProxySession | _PooledServer) -> None:
+        """Write queued output and watch for writability while some remains."""
+        try:
+            pending = owner.stream.flush()
+        except OSError:
+            # Closed by the other side; the read side reports it
+            owner.stream.outgoing.clear()
+            pending = False
+
+        if isinstance(owner, _ProxySession):
+            if owner not in self._sessions:
+                return
+
+            if owner.closing and not pending:
+                self._close_session(owner)
+                return
+
+            key = self._selector.get_key(owner.sock)
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0)
+
+            if key.events != events:
+                self._selector.modify(owner.sock, events, key.data)
+
+            return
+
+        fd = owner.stream.write_fd
+        registered = fd in self._selector.get_map()
+
+        if pending and not registered:
+            self._selector.register(
+                fd,
+                selectors.EVENT_WRITE,
+                lambda _events: self._dirty.add(owner),
+            )
+        elif registered and not pending:
+            self._selector.unregister(fd)
+
+    def _accept(self, listener: socket.socket) -> None:
+        try:
+            sock, _ = listener.accept()
+        except BlockingIOError:
+            return
+
+        sock.settimeout(0)  # non-blocking
+        session = _ProxySession(sock, _JsonRpcStream(sock.fileno(), sock.fileno()))
+        self._sessions.add(session)
+        self._selector.register(
+            sock,
+            selectors.EVENT_READ,
+            lambda events: self._on_session_event(session, events),
+        )
+
+    def _close_session(self, session: _ProxySession) -> None:
+        if session not in self._sessions:
+            return
+
+        self._sessions.discard(session)
+        self._selector.unregister(session.sock)
+        session.sock.close()
+
+        for proxy_id, (owner, _) in list(self._requests.items()):
+            if owner is session:
+                del self._requests[proxy_id]
+
+        for token, (owner, _) in list(self._progress.items()):
+            if owner is session:
+                del self._progress[token]
+
+        pooled = session.server
+
+        if pooled is not None:
+            pooled.sessions.discard(session)
+            pooled.initializing = [
+                entry for entry in pooled.initializing if entry[0] is not session
+            ]
+
+            if not pooled.sessions:
+                pooled.idle_since = time.monotonic()
+
+    def _on_session_event(self, session: _ProxySession, events: int) -> None:
+        if events & selectors.EVENT_WRITE:
+            self._dirty.add(session)
+
+        if not events & selectors.EVENT_READ:
+            return
+
+        try:
+            data = session.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self._close_session(session)
+            return
+
+        for message in session.stream.feed(data):
+            if session.closing:
+                break
+
+            if session.server is None:
+                self._handshake(session, message)
+            else:
+                self._from_session(session, message)
+
+    def _handshake(self, session: _ProxySession, hello: dict[str, Any]) -> None:
+        """Attach a new session to its server, or answer a control message."""
+        self._dirty.add(session)
+        command = hello.get("command")
+
+        if command == "status":
+            session.stream.send(self.status())
+            session.closing = True
+        elif command == "stop":
+            session.stream.send({"ok": True})
+            session.closing = True
+            self._running = False
+        else:
+            try:
+                self._attach(session, str(hello.get("server")))
+            except (OSError, ValueError) as e:
+                session.stream.send({"error": str(e)})
+                session.closing = True
+            else:
+                session.stream.send({"ok": True})
+
+    def _attach(self, session: _ProxySession, name: str) -> None:
+        """Attach a session to the pooled server for name, starting it if needed.
+
+        Raises
+        ------
+        ValueError
+            If name is not a local server in config.yml
+        OSError
+            If the server cannot be started
+        """
+        values = self._resolve_server(name).values
+        key = json.dumps(
+            [mcp_server_argv(values), values.get("env") or {}, values.get("cwd")],
+            sort_keys=True,
+            default=str,
+        )
+        pooled = self._servers.get(key)
+
+        if pooled is None:
+            process = spawn_mcp_server(values)
+            stdout = process.stdout.fileno()  # type: ignore[union-attr]
+            stdin = process.stdin.fileno()  # type: ignore[union-attr]
+            os.set_blocking(stdout, False)
+            os.set_blocking(stdin, False)
+            pooled = _PooledServer(key, name, process, _JsonRpcStream(stdout, stdin))
+            self._servers[key] = pooled
+            self._selector.register(
+                stdout,
+                selectors.EVENT_READ,
+                lambda _events: self._on_server_output(pooled),
+            )
+            print(f"Started {name} (pid {process.pid})")
+
+        pooled.sessions.add(session)
+        pooled.idle_since = None
+        session.server = pooled
+
+    def _from_session(self, session: _ProxySession, message: dict[str, Any]) -> None:
+        """Forward a session's message to its server, rewriting ids."""
+        pooled = session.server
+        method = message.get("method")
+
+        if pooled is None or method is None or method == "notifications/initialized":
+            # Responses to server requests are answered by the proxy itself,
+            # and the server is told it is initialized once
+            return
+
+        if method == "initialize" and "id" in message:
+            self._initialize(pooled, session, message)
+            return
+
+        message = dict(message)
+
+        if "id" in message:
+            proxy_id = self._new_id()
+            self._requests[proxy_id] = (session, message["id"])
+            message["id"] = proxy_id
+            params = message.get("params")
+            meta = params.get("_meta") if isinstance(params, dict) else None
+
+            if isinstance(meta, dict) and "progressToken" in meta:
+                token = f"proxy-{proxy_id}"
+                self._progress[token] = (session, meta["progressToken"])
+                message["params"] = params | {"_meta": meta | {"progressToken": token}}
+        elif method == "notifications/cancelled":
+            params = message.get("params") or {}
+            proxy_id = next(
+                (
+                    proxy_id
+                    for proxy_id, entry in self._requests.items()
+                    if entry == (session, params.get("requestId"))
+                ),
+                None,
+            )
+
+            if proxy_id is None:
+                return
+
+            message["params"] = params | {"requestId": proxy_id}
+
+        pooled.stream.send(message)
+        self._dirty.add(pooled)
+
+    def _initialize(
+        self,
+        pooled: _PooledServer,
+        session: _ProxySession,
+        request: dict[str, Any],
+    ) -> None:
+        """Answer a session's initialize request from its pooled server."""
+        result = pooled.initialize_result
+
+        if result is not None:
+            response = {"jsonrpc": "2.0", "id": request["id"], "result": result}
+            self._send(session, response)
+            return
+
+        pooled.initializing.append((session, request["id"]))
+
+        if pooled.initialize_id is None:
+            pooled.initialize_id = self._new_id()
+            params = request.get("params") or {}
+            pooled.stream.send(
+                {
+                    "jsonrpc": "2.0",
+                    "id": pooled.initialize_id,
+                    "method": "initialize",
+                    "params": params | {"capabilities": {}},
+                },
+            )
+            self._dirty.add(pooled)
+
+    def _on_server_output(self, pooled: _PooledServer) -> None:
+        try:
+            data = os.read(pooled.stream.read_fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            status = pooled.process.poll()
+            self._stop_server(
+                pooled,
+                "closed its output" if status is None else f"exited (status {status})",
+            )
+            return
+
+        for message in pooled.stream.feed(data):
+            self._from_server(pooled, message)
+
+    def _from_server(self, pooled: _PooledServer, message: dict[str, Any]) -> None:
+        """Route a server's message to the session it belongs to, or to all."""
+        method = message.get("method")
+        message_id = message.get("id")
+
+        if method is None:
+            if message_id is not None and message_id == pooled.initialize_id:
+                self._on_initialized(pooled, message)
+                return
+
+            self._progress.pop(f"proxy-{message_id}", None)
+            entry = self._requests.pop(message_id, None)
+
+            if entry is not None:
+                self._send(entry[0], message | {"id": entry[1]})
+
+            return
+
+        if message_id is not None:
+            # Requests to the client; only ping is expected, as the proxy
+            # declares no client capabilities
+            pooled.stream.send(
+                {"jsonrpc": "2.0", "id": message_id, "result": {}}
+                if method == "ping"
+                else {
+                    "jsonrpc": "2.0",
+                    "id": message_id,
+                    "error": {
+                        "code": _JSONRPC_METHOD_NOT_FOUND,
+                        "message": f"{method} is not supported through the MCP proxy",
+                    },
+                },
+            )
+            self._dirty.add(pooled)
+            return
+
+        params = message.get("params") or {}
+
+        if method == "notifications/progress":
+            entry = self._progress.get(params.get("progressToken"))
+
+            if entry is not None:
+                self._send(
+                    entry[0],
+                    message | {"params": params | {"progressToken": entry[1]}},
+                )
+        elif method != "notifications/cancelled":
+            for session in pooled.sessions:
+                self._send(session, message)
+
+    def _on_initialized(self, pooled: _PooledServer, response: dict[str, Any]) -> None:
+        waiting, pooled.initializing = pooled.initializing, []
+
+        if "error" in response:
+            pooled.initialize_id = None
+
+            for session, request_id in waiting:
+                self._send(session, response | {"id": request_id})
+
+            return
+
+        pooled.initialize_result = response.get("result") or {}
+        pooled.stream.send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        self._dirty.add(pooled)
+
+        for session, request_id in waiting:
+            self._send(session, response | {"id": request_id})
+
+    def _send(self, session: _ProxySession, message: dict[str, Any]) -> None:
+        if session in self._sessions:
+            session.stream.send(message)
+            self._dirty.add(session)
+
+    def _stop_server(self, pooled: _PooledServer, reason: str) -> None:
+        """Stop a pooled server, failing its requests and closing its sessions."""
+        if self._servers.get(pooled.key) is pooled:
+            del self._servers[pooled.key]
+
+        for fd in (pooled.stream.read_fd, pooled.stream.write_fd):
+            if fd in self._selector.get_map():
+                self._selector.unregister(fd)
+
+        self._dirty.discard(pooled)
+        stop_process_group(pooled.process)
+        error = {
+            "code": _JSONRPC_INTERNAL_ERROR,
+            "message": f"MCP server {pooled.name} {reason}",
+        }
+        failed = list(pooled.initializing)
+
+        for proxy_id, (session, request_id) in list(self._requests.items()):
+            if session.server is pooled:
+                del self._requests[proxy_id]
+                self._progress.pop(f"proxy-{proxy_id}", None)
+                failed.append((session, request_id))
+
+        for session, request_id in failed:
+            self._send(session, {"jsonrpc": "2.0", "id": request_id, "error": error})
+
+        for session in pooled.sessions:
+            session.closing = True
+            self._dirty.add(session)
+
+        print(f"Stopped {pooled.name}: {reason}")
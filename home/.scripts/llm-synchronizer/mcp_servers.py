@@ -0,0 +1,271 @@
+"""Local MCP servers: configuration, process handling and JSON-RPC over stdio."""
+
+import contextlib
+import json
+import os
+import re
+import select
+import signal
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+
+@dataclass
+class MCPServerConfig:
+    """Represents a single MCP server configuration.
+
+    Attributes
+    ----------
+    name : str
+        Server name (derived from config key, not from values)
+    values : dict[str, Any]
+        Arbitrary MCP server configuration values
+        (command, args, env, type, url, or any custom fields)
+    providers : dict[str, dict[str, Any]]
+        Provider-specific configuration mapping provider name to metadata
+        containing at minimum {enabled: bool}
+        Can include 'extra' key for provider-specific value overrides
+    proxy : bool
+        Whether the server may be started through the MCP proxy, if enabled
+    """
+
+    name: str
+    values: dict[str, Any]
+    providers: dict[str, dict[str, Any]]
+    proxy: bool = True
+
+
+# MCP protocol revision sent in the initialize request of `probe`
+MCP_PROTOCOL_VERSION = "2025-06-18"
+
+
+def is_local_mcp_server(server: MCPServerConfig) -> bool:
+    """Check whether a server is started as a local process over stdio."""
+    return bool(server.values.get("command")) and server.values.get(
+        "type",
+        "local",
+    ) in {"local", "stdio"}
+
+
+def process_tree_rss(pid: int) -> int | None:
+    """Return the total VmRSS in KB of pid and its descendants.
+
+    Launchers such as uvx and npx run the actual server as a child process,
+    so the whole tree is counted. Returns None where /proc is unavailable.
+    """
+    children: dict[int, list[int]] = {}
+
+    try:
+        with os.scandir("/proc") as scan:
+            entries = list(scan)
+    except OSError:
+        return None
+
+    for entry in entries:
+        if not entry.name.isdigit():
+            continue
+
+        try:
+            stat = Path(entry.path, "stat").read_text()
+        except OSError:
+            continue
+
+        # Fields after the parenthesised command name: state, ppid, ...
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    total = None
+    pending = [pid]
+
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+
+        try:
+            status = Path(f"/proc/{current}/status").read_text()
+        except OSError:
+            continue
+
+        match = re.search(r"^VmRSS:\s+(\d+) kB", status, re.MULTILINE)
+
+        if match:
+            total = (total or 0) + int(match[1])
+
+    return total
+
+
+def read_jsonrpc_response(fd: int, request_id: int, deadline: float) -> dict[str, Any]:
+    """Read newline-delimited JSON-RPC messages until the response to request_id.
+
+    Lines that are not JSON (log output some servers print to stdout) and
+    messages with other ids are skipped.
+
+    Raises
+    ------
+    TimeoutError
+        If no response arrives before deadline (a time.perf_counter() value)
+    EOFError
+        If the server closes its stdout first
+    """
+    buffer = b""
+
+    while True:
+        remaining = deadline - time.perf_counter()
+
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            raise TimeoutError
+
+        chunk = os.read(fd, 65536)
+
+        if not chunk:
+            raise EOFError
+
+        *lines, buffer = (buffer + chunk).split(b"\n")
+
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+
+            if isinstance(message, dict) and message.get("id") == request_id:
+                return message
+
+
+def stop_process_group(process: subprocess.Popen[bytes]) -> None:
+    """Terminate a process started in its own session, and all its children."""
+    with contextlib.suppress(OSError):
+        process.stdin.close()  # type: ignore[union-attr]
+
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, sig)
+
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            continue
+        else:
+            break
+
+    with contextlib.suppress(OSError):
+        process.stdout.close()  # type: ignore[union-attr]
+
+
+class MCPServerError(Exception):
+    """A local MCP server exited, timed out or answered a request with an error."""
+
+
+def mcp_server_argv(values: dict[str, Any]) -> list[str]:
+    """Return the command line of a local MCP server."""
+    return [str(values["command"]), *(str(arg) for arg in values.get("args") or [])]
+
+
+def spawn_mcp_server(values: dict[str, Any]) -> subprocess.Popen[bytes]:
+    """Start a local MCP server in its own session, talking JSON-RPC over stdio.
+
+    Raises
+    ------
+    OSError
+        If the command cannot be executed
+    """
+    env = os.environ | {
+        key: str(value) for key, value in (values.get("env") or {}).items()
+    }
+
+    return subprocess.Popen(
+        mcp_server_argv(values),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        cwd=values.get("cwd"),
+        start_new_session=True,
+    )
+
+
+def send_jsonrpc(process: subprocess.Popen[bytes], message: dict[str, Any]) -> None:
+    """Write one JSON-RPC message to a server's stdin.
+
+    Raises
+    ------
+    MCPServerError
+        If the server has closed its stdin
+    """
+    try:
+        process.stdin.write(json.dumps(message).encode() + b"\n")  # type: ignore[union-attr]
+        process.stdin.flush()  # type: ignore[union-attr]
+    except BrokenPipeError:
+        raise MCPServerError(
+            f"exited before responding (status {process.wait()})",
+        ) from None
+
+
+def mcp_request(
+    process: subprocess.Popen[bytes],
+    request_id: int,
+    method: str,
+    params: dict[str, Any],
+    deadline: float,
+) -> dict[str, Any]:
+    """Send a JSON-RPC request to a server and return the result.
+
+    Raises
+    ------
+    MCPServerError
+        If the server exits, does not respond before deadline (a
+        time.perf_counter() value) or responds with an error
+    """
+    send_jsonrpc(
+        process,
+        {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params},
+    )
+
+    try:
+        response = read_jsonrpc_response(
+            process.stdout.fileno(),  # type: ignore[union-attr]
+            request_id,
+            deadline,
+        )
+    except TimeoutError:
+        raise MCPServerError(f"no {method} response in time") from None
+    except EOFError:
+        raise MCPServerError(
+            f"exited before responding (status {process.wait()})",
+        ) from None
+
+    if "error" in response:
+        error = response["error"]
+        # JSON-RPC errors are objects, but some servers send a bare string
+        message = error.get("message") if isinstance(error, dict) else error
+        raise MCPServerError(f"{method} failed: {message}")
+
+    return response.get("result") or {}
+
+
+def initialize_params(client: str) -> dict[str, Any]:
+    """Return the params of an MCP initialize request from client."""
+    return {
+        "protocolVersion": MCP_PROTOCOL_VERSION,
+        "capabilities": {},
+        "clientInfo": {"name": client, "version": "1.0"},
+    }
+
+
+def format_server_info(initialize_result: dict[str, Any]) -> str | None:
+    """Return "<name> <version>" from an initialize result's serverInfo."""
+    info = initialize_result.get("serverInfo") or {}
+
+    fields = [str(info[key]) for key in ("name", "version") if key in info]
+
+    return " ".join(fields) or None
+
+
+def cache_dir() -> Path:
+    """Return this script's directory under the XDG cache directory."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+
+    return Path(cache_home) / "sync-agents"
@@ -0,0 +1,240 @@
+"""Tool manifests of MCP servers and the context tokens they cost."""
+
+import hashlib
+import json
+import math
+import shutil
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from mcp_probe import PROBE_TIMEOUT
+from mcp_servers import (
+    MCPServerConfig,
+    format_server_info,
+    initialize_params,
+    mcp_request,
+    mcp_server_argv,
+    send_jsonrpc,
+    spawn_mcp_server,
+    stop_process_group,
+)
+
+# Rough average for English text and JSON schemas; tokenizers differ by model
+CHARS_PER_TOKEN = 4
+
+
+class ToolManifest(NamedTuple):
+    """The tools an MCP server offers, as returned by tools/list.
+
+    Attributes
+    ----------
+    server_info : str | None
+        Name and version the server reported
+    instructions : str | None
+        Usage instructions from the server's initialize result
+    tools : list[dict[str, Any]]
+        Tool definitions (name, description, inputSchema, ...)
+    fetched : str
+        When the manifest was fetched, as an ISO 8601 UTC timestamp
+    """
+
+    server_info: str | None
+    instructions: str | None
+    tools: list[dict[str, Any]]
+    fetched: str
+
+    def estimate_tokens(self) -> int:
+        """Estimate the context tokens the manifest adds to an agent session.
+
+        Counts the tool names, descriptions and input schemas, which clients
+        pass to the model, and the server instructions, at CHARS_PER_TOKEN
+        characters per token.
+        """
+        fields = ("name", "description", "inputSchema")
+        definitions = [
+            {key: tool[key] for key in fields if key in tool} for tool in self.tools
+        ]
+        text = (
+            json.dumps(definitions, separators=(",", ":"), ensure_ascii=False)
+            if definitions
+            else ""
+        )
+
+        return math.ceil((len(text) + len(self.instructions or "")) / CHARS_PER_TOKEN)
+
+
+def fetch_tool_manifest(
+    server: MCPServerConfig,
+    *,
+    timeout: float = PROBE_TIMEOUT,
+) -> ToolManifest:
+    """Start a local MCP server, list its tools and stop it.
+
+    Parameters
+    ----------
+    server : MCPServerConfig
+        Server to query; its values must have a command
+    timeout : float, optional
+        Seconds to wait for the server to initialize and list every page of
+        tools
+
+    Returns
+    -------
+    ToolManifest
+        The server's tools
+
+    Raises
+    ------
+    OSError
+        If the server cannot be started
+    MCPServerError
+        If the server exits, times out or responds with an error
+    """
+    deadline = time.perf_counter() + timeout
+    process = spawn_mcp_server(server.values)
+    tools: list[dict[str, Any]] = []
+
+    try:
+        initialized = mcp_request(
+            process,
+            1,
+            "initialize",
+            initialize_params("sync-agents-tools"),
+            deadline,
+        )
+        send_jsonrpc(
+            process,
+            {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        )
+        # Servers without the tools capability do not implement tools/list
+        params: dict[str, Any] | None = (
+            {} if "tools" in (initialized.get("capabilities") or {}) else None
+        )
+        request_id = 2
+
+        while params is not None:
+            page = mcp_request(process, request_id, "tools/list", params, deadline)
+            tools.extend(page.get("tools") or [])
+            cursor = page.get("nextCursor")
+            params = {"cursor": cursor} if cursor else None
+            request_id += 1
+    finally:
+        stop_process_group(process)
+
+    return ToolManifest(
+        server_info=format_server_info(initialized),
+        instructions=initialized.get("instructions"),
+        tools=tools,
+        fetched=datetime.now(UTC).isoformat(timespec="seconds"),
+    )
+
+
+def _executable_version(command: str, env: dict[str, Any]) -> list[object] | None:
+    """Return the path, size and mtime of the executable command resolves to."""
+    path = shutil.which(command, path=env.get("PATH"))
+
+    if path is None:
+        return None
+
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+class ToolManifestCache:
+    """On-disk cache of the tool manifests of local MCP servers.
+
+    Each manifest is stored as <key>.json. The key hashes the server's
+    command, args, env and cwd as written in config.yml (placeholders
+    unresolved, so rotating a secret does not invalidate it) together with the
+    path, size and mtime of the executable the command resolves to, so
+    editing a server or upgrading its binary re-queries it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, root: Path) -> None:
+        """Initialize a cache; nothing is created on disk until the first put.
+
+        Parameters
+        ----------
+        root : Path
+            Directory holding the manifests
+        """
+        self.root = root
+
+    @classmethod
+    def key(cls, server: MCPServerConfig) -> str:
+        """Return the cache key of a local server."""
+        values = server.values
+        env = values.get("env") or {}
+        identity = [
+            cls.VERSION,
+            mcp_server_argv(values),
+            env,
+            values.get("cwd"),
+            _executable_version(str(values["command"]), env),
+        ]
+
+        return hashlib.sha256(
+            json.dumps(identity, sort_keys=True, default=str).encode(),
+        ).hexdigest()
+
+    def get(self, key: str) -> ToolManifest | None:
+        """Return the cached manifest for key, or None on a miss."""
+        try:
+            data = json.loads((self.root / f"{key}.json").read_text())
+        except FileNotFoundError:
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return None
+
+        return ToolManifest(**data["manifest"])
+
+    def put(self, key: str, manifest: ToolManifest) -> None:
+        """Store the manifest for key, replacing any older one."""
+        path = self.root / f"{key}.json"
+        temp_path = path.with_suffix(".tmp")
+        data = {"version": self.VERSION, "manifest": manifest._asdict()}
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        try:
+            temp_path.write_text(json.dumps(data, indent=2) + "\n")
+            temp_path.replace(path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+
+class ToolCost(NamedTuple):
+    """Context cost of one MCP server's tools.
+
+    Attributes
+    ----------
+    name : str
+        Server name
+    providers : list[str]
+        Providers whose generated MCP config includes the server
+    tools : int | None
+        Number of tools, or None if the manifest is unknown
+    tokens : int | None
+        Estimated context tokens of the manifest, or None if unknown
+    cached : bool
+        Whether the manifest came from the cache
+    error : str | None
+        Why the manifest could not be fetched. Remote servers are not
+        queried and have neither a manifest nor an error.
+    """
+
+    name: str
+    providers: list[str]
+    tools: int | None = None
+    tokens: int | None = None
+    cached: bool = False
+    error: str | None = None
@@ -11,22 +11,110 @@ Requirements
 
 Usage
 -----
-uv run python sync-agents.py [--config CONFIG_FILE]
+uv run python sync-agents.py [--config CONFIG_FILE] [--force] [--watch] [--prune]
+                             [--staged] [--check | --diff]
+                             [--timings] [--trace FILE]
+uv run python sync-agents.py probe [SERVER ...] [--json] [--jobs N]
+                                   [--timeout SECONDS] [--slow-ms MS]
+uv run python sync-agents.py tools [SERVER ...] [--refresh] [--json] [--jobs N]
+                                   [--timeout SECONDS]
+uv run python sync-agents.py proxy {serve,status,stop}
+uv run python sync-agents.py prewarm [SERVER ...] [--refresh] [--offline]
+uv run python sync-agents.py restore [SNAPSHOT] [--to FILE]
 """
 
 import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import difflib
+import errno
+import filecmp
+import functools
+import hashlib
 import json
+import os
 import re
+import select
+import shlex
 import shutil
+import struct
+import subprocess
 import sys
-from dataclasses import dataclass
-from datetime import UTC, datetime
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, Literal, NamedTuple
+from typing import (
+    Any,
+    Concatenate,
+    Literal,
+    NamedTuple,
+    ParamSpec,
+    Self,
+    TextIO,
+    TypeVar,
+)
 
 import yaml
 
+from mcp_backups import BackupSnapshot, BackupStore
+from mcp_prewarm import (
+    PrewarmError,
+    PrewarmResult,
+    PrewarmStore,
+    parse_launcher_command,
+)
+from mcp_probe import PROBE_SLOW_MS, PROBE_TIMEOUT, ProbeResult, probe_mcp_server
+from mcp_proxy import (
+    PROXY_CLIENT,
+    PROXY_SPAWN_KEYS,
+    MCPProxy,
+    MCPProxySettings,
+    proxy_request,
+)
+from mcp_servers import (
+    MCPServerConfig,
+    MCPServerError,
+    cache_dir,
+    is_local_mcp_server,
+    mcp_server_argv,
+)
+from mcp_tools import ToolCost, ToolManifest, ToolManifestCache, fetch_tool_manifest
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+# Prefer the libyaml C bindings; PyYAML builds without them use pure Python
+try:
+    from yaml import CSafeDumper as FastSafeDumper
+    from yaml import CSafeLoader as SafeLoader
+
+    YAML_BACKEND = "libyaml"
+except ImportError:  # pragma: no cover - depends on how PyYAML was built
+    from yaml import SafeDumper as FastSafeDumper
+    from yaml import SafeLoader
+
+    YAML_BACKEND = "python"
+
+# Characters libyaml's emitter escapes but the pure-Python emitter writes
+# verbatim (with allow_unicode): astral-plane code points and the NEL, LS and
+# PS line breaks. Frontmatter containing them is emitted in pure Python so
+# output is byte-identical whichever backend is installed.
+_LIBYAML_ESCAPED = re.compile("[\U00010000-\U0010ffff\x85\u2028\u2029]")
+# Mapping keys both emitters write as a plain "key:" line. They disagree on
+# when to switch to the explicit "? key" form for other keys: empty keys, keys
+# that need escapes, and long keys (Python measures the quoted key in
+# characters, libyaml the raw key in bytes). Quotes are excluded so quoting
+# adds at most two characters.
+_SIMPLE_KEY = re.compile("[ !#-&(-~\xa0-\ud7ff\ue000-\ufefe\uff00-\ufffd]+")
+_SIMPLE_KEY_BYTES = 120
+
 
 class ProviderConfig(NamedTuple):
     """Configuration for a provider.
@@ -124,58 +212,485 @@ class TemplateConfig:
     ----------
     type : Literal["agent", "command", "skill"]
         Type of template
-    body : str
-        Template body content
+    body : str | None
+        Template body content, or None if only the frontmatter was read
     shared_config : dict[str, Any]
         Configuration shared across all providers
     provider_metadata : dict[str, dict[str, Any]]
         Provider-specific metadata keyed by provider name
+    body_offset : int | None
+        Position of the body in the template file while body is None
     """
 
     type: Literal["agent", "command", "skill"]
-    body: str
+    body: str | None
     shared_config: dict[str, Any]
     provider_metadata: dict[str, dict[str, Any]]
+    body_offset: int | None = None
 
 
 @dataclass
-class MCPServerConfig:
-    """Represents a single MCP server configuration.
+class SyncStats:
+    """Counters collected during a single sync run.
 
     Attributes
     ----------
-    name : str
-        Server name (derived from config key, not from values)
-    values : dict[str, Any]
-        Arbitrary MCP server configuration values
-        (command, args, env, type, url, or any custom fields)
-    providers : dict[str, dict[str, Any]]
-        Provider-specific configuration mapping provider name to metadata
-        containing at minimum {enabled: bool}
-        Can include 'extra' key for provider-specific value overrides
+    parse_count : int
+        Number of times a template file was parsed from disk
+    parsed_files : int
+        Number of unique template files parsed
+    templates_skipped : int
+        Number of templates skipped because the build manifest shows
+        their inputs and outputs are unchanged
+    files_unchanged : int
+        Number of generated files left alone because their content was current
+    template_errors : int
+        Number of templates that could not be processed
+    frontmatter_hits : int
+        Number of outputs whose frontmatter was reused from an identical
+        provider config
+    frontmatter_misses : int
+        Number of frontmatter blocks rendered with yaml.dump
+    mcp_files_unchanged : int
+        Number of MCP config files left alone (and not backed up) because
+        their MCP servers section was already current
     """
 
-    name: str
-    values: dict[str, Any]
-    providers: dict[str, dict[str, Any]]
+    parse_count: int = 0
+    parsed_files: int = 0
+    templates_skipped: int = 0
+    files_unchanged: int = 0
+    template_errors: int = 0
+    frontmatter_hits: int = 0
+    frontmatter_misses: int = 0
+    mcp_files_unchanged: int = 0
+
+
+# Outcome of writing a single generated file
+WriteResult = Literal["written", "unchanged", "failed"]
+
+
+# Files in a skill directory that are never copied as supporting files
+SKILL_SKIP_FILES = ["SKILL.md", "skill.md", ".DS_Store", ".gitkeep"]
+# Supporting files larger than this are skipped
+MAX_SKILL_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+
+class PendingChange(NamedTuple):
+    """A change that a sync would make to a generated file.
+
+    Attributes
+    ----------
+    action : Literal["create", "update", "remove"]
+        What the sync would do to path
+    path : Path
+        Generated file or directory
+    old : str | None
+        Current text of path, if it exists and is a text output
+    new : str | None
+        Text the sync would write, if path is a text output
+    """
+
+    action: Literal["create", "update", "remove"]
+    path: Path
+    old: str | None = None
+    new: str | None = None
+
+
+class SkillCopyResult(NamedTuple):
+    """Outcome of mirroring a skill directory.
+
+    Attributes
+    ----------
+    copied : int
+        Number of files copied because they were new or changed
+    errors : int
+        Number of files that could not be copied
+    unchanged : int
+        Number of files already up to date at the destination
+    removed : int
+        Number of stale destination files pruned
+    """
+
+    copied: int
+    errors: int
+    unchanged: int = 0
+    removed: int = 0
 
 
-# 3 parts: frontmatter open delimiter, content, frontmatter close delimiter
-_FRONTMATTER_PARTS = 3
 _SKILL_PATH_DEPTH = 2  # expected path parts for a skill: [subdirectory, filename]
 
+SYNCIGNORE_FILENAME = ".syncignore"
+
+
+def _translate_ignore_glob(pattern: str) -> str:
+    """Translate the glob part of an ignore pattern into a regular expression.
+
+    ``*``, ``?`` and ``[...]`` never match ``/``; ``**`` matches across
+    directories.
+    """
+    parts = []
+    i = 0
+
+    while i < len(pattern):
+        char = pattern[i]
+
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+
+        if char == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+
+        if char == "[":
+            # A ']' straight after the opening bracket is a literal
+            end = pattern.find("]", i + 2)
+
+            if end != -1:
+                body = pattern[i + 1 : end].replace("\\", "\\\\")
+
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+
+                parts.append(f"(?!/)[{body}]")
+                i = end + 1
+                continue
+
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        else:
+            parts.append(re.escape(char))
+
+        i += 1
+
+    return "".join(parts)
+
+
+class _IgnoreRule(NamedTuple):
+    """A single compiled ignore pattern."""
+
+    regex: re.Pattern[str]
+    negate: bool
+    dir_only: bool
+
+
+class IgnoreRules:
+    """Matches relative paths against gitignore-style patterns.
+
+    Supports comments, blank lines, negation (``!``), directory-only patterns
+    (trailing ``/``), anchoring (a leading or embedded ``/``) and the ``*``,
+    ``?``, ``[...]`` and ``**`` wildcards. The last matching pattern wins.
+    """
+
+    def __init__(self, lines: list[str], *, anchored: bool = False) -> None:
+        """Compile ignore patterns.
+
+        Parameters
+        ----------
+        lines : list[str]
+            Lines of an ignore file
+        anchored : bool, optional
+            Anchor every pattern to the base directory, as .dockerignore does,
+            instead of only patterns that contain a slash
+        """
+        self._rules: list[_IgnoreRule] = []
+
+        for line in lines:
+            rule = self._compile(line, anchored=anchored)
+
+            if rule is not None:
+                self._rules.append(rule)
+
+    @staticmethod
+    def _compile(line: str, *, anchored: bool) -> _IgnoreRule | None:
+        """Compile one line of an ignore file, or return None for no pattern."""
+        pattern = line.rstrip("\r\n")
+
+        if not pattern.strip() or pattern.startswith("#"):
+            return None
+
+        # Trailing spaces are ignored unless escaped with a backslash
+        stripped = pattern.rstrip(" ")
+
+        if stripped.endswith("\\") and len(stripped) < len(pattern):
+            stripped += " "
+
+        negate = stripped.startswith("!")
+
+        # Drop the negation marker, or the backslash escaping a leading ! or #
+        if negate or stripped.startswith(("\\!", "\\#")):
+            stripped = stripped[1:]
+
+        dir_only = stripped.endswith("/")
+        stripped = stripped.rstrip("/")
+
+        if "/" in stripped:
+            anchored = True
+
+        stripped = stripped.lstrip("/")
+
+        if not stripped:
+            return None
+
+        prefix = "" if anchored else "(?:.*/)?"
+        regex = re.compile(prefix + _translate_ignore_glob(stripped), re.DOTALL)
+
+        return _IgnoreRule(regex=regex, negate=negate, dir_only=dir_only)
+
+    @classmethod
+    def from_file(cls, path: Path, *, anchored: bool = False) -> Self:
+        """Load ignore patterns from a file; a missing file ignores nothing.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the ignore file
+        anchored : bool, optional
+            Anchor every pattern to the directory containing the file
+
+        Returns
+        -------
+        IgnoreRules
+            Compiled patterns
+        """
+        try:
+            text = path.read_text(encoding="utf-8", errors="replace")
+        except (FileNotFoundError, NotADirectoryError):
+            return cls([])
+
+        return cls(text.splitlines(), anchored=anchored)
+
+    def __bool__(self) -> bool:
+        """Return whether any pattern was loaded."""
+        return bool(self._rules)
+
+    def match(self, rel_path: str, *, is_dir: bool, default: bool = False) -> bool:
+        """Return whether a path is ignored, assuming its parents are not.
+
+        Walkers call this for every entry and skip ignored directories, so
+        the parents of a path they see are never ignored.
+
+        Parameters
+        ----------
+        rel_path : str
+            Slash-separated path relative to the ignore file's directory
+        is_dir : bool
+            Whether the path is a directory
+        default : bool, optional
+            Result when no pattern matches, such as the verdict of an ignore
+            file in a parent directory
+
+        Returns
+        -------
+        bool
+            True if the last matching pattern excludes the path
+        """
+        ignored = default
+
+        for rule in self._rules:
+            if rule.dir_only and not is_dir:
+                continue
+
+            if rule.negate == ignored and rule.regex.fullmatch(rel_path):
+                ignored = not rule.negate
+
+        return ignored
+
+    def is_ignored(self, rel_path: str, *, is_dir: bool = False) -> bool:
+        """Return whether a path or any of its parent directories is ignored.
+
+        Parameters
+        ----------
+        rel_path : str
+            Slash-separated path relative to the ignore file's directory
+        is_dir : bool, optional
+            Whether the path is a directory
+
+        Returns
+        -------
+        bool
+            True if the path would be skipped by a walk honouring the patterns
+        """
+        parts = rel_path.split("/")
+
+        for depth in range(1, len(parts)):
+            if self.match("/".join(parts[:depth]), is_dir=True):
+                return True
+
+        return self.match(rel_path, is_dir=is_dir)
+
+
+def _list_directory(path: str) -> list[os.DirEntry[str]]:
+    """List a directory, treating unreadable directories as empty."""
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except OSError:
+        return []
+
+
+# .gitignore rules in effect in a directory, each with the path (relative to
+# the skill, with a trailing slash) of the directory holding the file
+_GitRules = list[tuple[IgnoreRules, str]]
+
+
+def _skill_git_rules(skill_dir: Path, directory: Path) -> _GitRules:
+    """Load the .gitignore files of a skill that apply to directory's entries.
+
+    Those are the files in directory and in each of its parents up to the
+    skill root.
+    """
+    parts = directory.relative_to(skill_dir).parts
+    git_rules: _GitRules = []
+
+    for depth in range(len(parts) + 1):
+        gitignore = skill_dir.joinpath(*parts[:depth], ".gitignore")
+
+        if gitignore.is_file():
+            rel_dir = "".join(f"{part}/" for part in parts[:depth])
+            git_rules.append((IgnoreRules.from_file(gitignore), rel_dir))
+
+    return git_rules
+
+
+def _skill_rules_match(
+    docker_rules: IgnoreRules,
+    git_rules: _GitRules,
+    rel_path: str,
+    *,
+    is_dir: bool,
+) -> bool:
+    """Return whether a skill's ignore files exclude a path.
+
+    Deeper .gitignore files take precedence, as in git. The path's parents
+    are assumed to be kept.
+    """
+    ignored = False
+
+    for rules, base in git_rules:
+        ignored = rules.match(rel_path[len(base) :], is_dir=is_dir, default=ignored)
+
+    return ignored or docker_rules.match(rel_path, is_dir=is_dir)
+
+
+def _is_skill_path_ignored(skill_dir: Path, path: Path, *, is_dir: bool) -> bool:
+    """Return whether a path below a skill is excluded by its ignore files.
+
+    The path's parent directories are assumed to be kept.
+    """
+    return _skill_rules_match(
+        IgnoreRules.from_file(skill_dir / ".dockerignore", anchored=True),
+        _skill_git_rules(skill_dir, path.parent),
+        path.relative_to(skill_dir).as_posix(),
+        is_dir=is_dir,
+    )
+
+
+def _walk_skill_files(skill_dir: Path, start: Path | None = None) -> Iterator[Path]:
+    """Yield every path below a skill directory that its ignore files keep.
+
+    A .gitignore applies to its own directory and everything below it, with
+    deeper files taking precedence; a .dockerignore applies at the skill root.
+    Ignored directories are not walked. As with rglob, symlinked directories
+    are yielded but not descended into.
+
+    Parameters
+    ----------
+    skill_dir : Path
+        Skill root directory
+    start : Path | None, optional
+        Directory of the skill to walk instead of the whole skill; it must
+        not be ignored itself
+    """
+    docker_rules = IgnoreRules.from_file(skill_dir / ".dockerignore", anchored=True)
+    start = start or skill_dir
+    rel_start = start.relative_to(skill_dir).as_posix()
+    # (directory, its path relative to skill_dir with a trailing slash,
+    # the .gitignore rules in effect in its parent)
+    pending: list[tuple[str, str, _GitRules]] = [
+        (
+            str(start),
+            "" if start == skill_dir else f"{rel_start}/",
+            [] if start == skill_dir else _skill_git_rules(skill_dir, start.parent),
+        ),
+    ]
+
+    while pending:
+        path, rel_dir, git_rules = pending.pop()
+        entries = _list_directory(path)
+
+        if any(entry.name == ".gitignore" for entry in entries):
+            git_rules = [
+                *git_rules,
+                (IgnoreRules.from_file(Path(path) / ".gitignore"), rel_dir),
+            ]
+
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+
+            if _skill_rules_match(docker_rules, git_rules, rel_path, is_dir=is_dir):
+                continue
+
+            yield Path(entry.path)
+
+            if is_dir:
+                pending.append((entry.path, f"{rel_path}/", git_rules))
+
 
 class FrontmatterParser:
     """Parses YAML frontmatter from markdown files."""
 
     @staticmethod
-    def parse_file(template_path: Path) -> TemplateConfig:
+    def _read_frontmatter(template_path: Path, file: TextIO) -> str:
+        """Read the frontmatter block, leaving file positioned at the body.
+
+        Only the lines up to the closing delimiter are read, so the cost does
+        not depend on the size of the body.
+
+        Raises
+        ------
+        ValueError
+            If the frontmatter delimiters are missing
+        """
+        line = file.readline()
+
+        while line and line.rstrip() != "---":
+            line = file.readline()
+
+        lines = []
+        line = file.readline() if line else ""
+
+        while line and line.rstrip() != "---":
+            lines.append(line)
+            line = file.readline()
+
+        if not line:
+            raise ValueError(f"No valid frontmatter in {template_path}")
+
+        return "".join(lines)
+
+    @staticmethod
+    def parse_file(template_path: Path, *, load_body: bool = True) -> TemplateConfig:
         """Parse a template file into a TemplateConfig object.
 
         Parameters
         ----------
         template_path : Path
             Path to template file
+        load_body : bool, optional
+            Read the body as well as the frontmatter. When False, the body is
+            left unread and can be loaded later with load_body().
 
         Returns
         -------
@@ -187,21 +702,20 @@ class FrontmatterParser:
         ValueError
             If frontmatter is invalid or skill validation fails
         """
-        content = template_path.read_text()
-        parts = re.split(r"^---\s*$", content, maxsplit=2, flags=re.MULTILINE)
-
-        if len(parts) < _FRONTMATTER_PARTS:
-            raise ValueError(f"No valid frontmatter in {template_path}")
+        with template_path.open() as f:
+            frontmatter_yaml = FrontmatterParser._read_frontmatter(template_path, f)
 
-        frontmatter_yaml = parts[1]
-        body = parts[2].strip()
+            if load_body:
+                body, body_offset = f.read().strip(), None
+            else:
+                body, body_offset = None, f.tell()
 
         try:
-            frontmatter = yaml.safe_load(frontmatter_yaml)
+            frontmatter = yaml.load(frontmatter_yaml, Loader=SafeLoader)
         except yaml.YAMLError as e:
             raise ValueError(f"Invalid YAML in {template_path}") from e
 
-        if "type" not in frontmatter:
+        if not isinstance(frontmatter, dict) or "type" not in frontmatter:
             raise ValueError(f"Missing 'type' field in frontmatter: {template_path}")
 
         template_type = frontmatter["type"]
@@ -216,8 +730,35 @@ class FrontmatterParser:
             body=body,
             shared_config=frontmatter.get("shared", {}) or {},
             provider_metadata=provider_metadata,
+            body_offset=body_offset,
         )
 
+    @staticmethod
+    def load_body(template_path: Path, template: TemplateConfig) -> TemplateConfig:
+        """Return template with its body loaded from template_path.
+
+        Parameters
+        ----------
+        template_path : Path
+            Path to template file
+        template : TemplateConfig
+            Template parsed with load_body=False (returned as-is if the body
+            is already loaded)
+
+        Returns
+        -------
+        TemplateConfig
+            Copy of template with body populated
+        """
+        if template.body is not None:
+            return template
+
+        with template_path.open() as f:
+            f.seek(template.body_offset or 0)
+            body = f.read().strip()
+
+        return replace(template, body=body, body_offset=None)
+
 
 class MCPGenerator:
     """Generates MCP configuration files for different providers."""
@@ -336,1081 +877,5407 @@ MCP_GENERATORS: dict[str, Any] = {
 }
 
 
-class TemplateGenerator:
-    """Generates template files for all providers using unified format."""
+# ${scheme:reference} placeholders resolved in MCP server values and extra.
+# Placeholders without a known scheme, such as ${HOME}, are left for the
+# provider to expand.
+_SECRET_PLACEHOLDER = re.compile(r"\$\{(env|pass|file):([^}]+)\}")
+SECRET_LOOKUP_TIMEOUT = 30
+# Shown by --diff in place of config values that may be resolved secrets
+SECRET_MASK = "********"
 
-    @staticmethod
-    def generate_frontmatter(template: TemplateConfig, provider: str) -> str:
-        """Generate provider-specific YAML frontmatter.
 
-        Parameters
-        ----------
-        template : TemplateConfig
-            Template configuration object
-        provider : str
-            Provider name
+def _read_env_secret(name: str) -> str:
+    """Return the value of an environment variable."""
+    try:
+        return os.environ[name]
+    except KeyError:
+        raise LookupError(f"environment variable {name} is not set") from None
 
-        Returns
-        -------
-        str
-            YAML frontmatter string
-        """
-        config = template.shared_config | template.provider_metadata.get(provider, {})
-        # Remove 'enabled' field - not part of frontmatter
-        config = {k: v for k, v in config.items() if k != "enabled"}
 
-        return yaml.dump(
-            config,
-            default_flow_style=False,
-            sort_keys=False,
-            width=999999,  # Large width to prevent wrapping
-            allow_unicode=True,
+def _read_pass_secret(entry: str) -> str:
+    """Return the first line of a pass(1) entry, by convention the secret."""
+    try:
+        result = subprocess.run(
+            ["pass", "show", entry],
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=SECRET_LOOKUP_TIMEOUT,
         )
+    except FileNotFoundError:
+        raise LookupError(f"pass is not installed (needed for {entry})") from None
+    except subprocess.TimeoutExpired:
+        raise LookupError(
+            f"pass show {entry} timed out after {SECRET_LOOKUP_TIMEOUT}s",
+        ) from None
 
-    @staticmethod
-    def generate_file_content(template: TemplateConfig, provider: str) -> str:
-        """Generate complete provider-format file.
+    if result.returncode != 0:
+        raise LookupError(result.stderr.strip() or f"pass show {entry} failed")
 
-        Parameters
-        ----------
-        template : TemplateConfig
-            Template configuration object
-        provider : str
-            Provider name
+    return result.stdout.split("\n", 1)[0]
 
-        Returns
-        -------
-        str
-            Complete file content with frontmatter and body
-        """
-        frontmatter = TemplateGenerator.generate_frontmatter(template, provider)
 
-        return f"---\n{frontmatter}---\n\n{template.body}\n"
+def _read_file_secret(path: str) -> str:
+    """Return a file's content without its trailing newline."""
+    try:
+        return Path(path).expanduser().read_text().rstrip("\n")
+    except OSError as e:
+        raise LookupError(str(e)) from None
 
 
-class AgentSyncManager:
-    """Manages the synchronization of agent and command templates.
+# Lookup function per placeholder scheme; each raises LookupError on failure
+SECRET_READERS: dict[str, Callable[[str], str]] = {
+    "env": _read_env_secret,
+    "pass": _read_pass_secret,
+    "file": _read_file_secret,
+}
 
-    The manager automatically resolves the templates directory from the config file
-    location, expecting templates to be in a 'templates/' subdirectory adjacent to
-    the config file.
+
+class SecretResolver:
+    """Resolves ${env:...}, ${pass:...} and ${file:...} placeholders.
+
+    All lookups needed by one call to resolve() run concurrently, so slow
+    ones such as pass (which decrypts with gpg) overlap. Results are cached in
+    memory only, for ttl seconds, so watch-mode re-syncs do not look them up
+    again. Nothing is written to disk.
     """
 
-    def __init__(self, config_file: Path) -> None:
-        """Initialize AgentSyncManager with config file.
+    def __init__(self, ttl: float = 300, max_workers: int = 16) -> None:
+        """Initialize SecretResolver.
 
         Parameters
         ----------
-        config_file : Path
-            Path to the YAML configuration file
+        ttl : float, optional
+            Seconds a looked-up value is reused; 0 disables the cache
+        max_workers : int, optional
+            Maximum number of concurrent lookups
+        """
+        self.ttl = ttl
+        self._max_workers = max_workers
+        self._cache: dict[tuple[str, str], tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> "SecretResolver":
+        """Create a resolver from the optional secrets section of config.yml.
 
         Raises
         ------
-        FileNotFoundError
-            If config file or templates directory doesn't exist
+        ValueError
+            If secrets.cache_ttl is not a non-negative number
         """
-        self._config = self._load_config(config_file)
-        self._config_file = config_file
-        self._generator = TemplateGenerator
-        self._templates_dir = self._resolve_templates_dir()
-        self._validate_templates_dir()
+        ttl = (config.get("secrets") or {}).get("cache_ttl", 300)
 
-    def _resolve_templates_dir(self) -> Path:
-        """Resolve templates directory from config file location.
+        if isinstance(ttl, bool) or not isinstance(ttl, int | float) or ttl < 0:
+            raise ValueError(
+                f"secrets.cache_ttl must be a non-negative number, got {ttl!r}",
+            )
 
-        Returns
-        -------
-        Path
-            Path to templates directory (config_file.parent / "templates")
-        """
-        return self._config_file.parent / "templates"
+        return cls(ttl=ttl)
 
-    def _validate_templates_dir(self) -> None:
-        """Validate that templates directory exists.
+    @classmethod
+    def _collect(cls, value: object, references: set[tuple[str, str]]) -> None:
+        """Add the (scheme, reference) of every placeholder in value."""
+        if isinstance(value, str):
+            references.update(
+                (match[1], match[2]) for match in _SECRET_PLACEHOLDER.finditer(value)
+            )
+        elif isinstance(value, dict):
+            for item in value.values():
+                cls._collect(item, references)
+        elif isinstance(value, list):
+            for item in value:
+                cls._collect(item, references)
 
-        Raises
-        ------
-        FileNotFoundError
-            If templates directory doesn't exist
-        """
-        if not self._templates_dir.exists():
-            raise FileNotFoundError(
-                f"Templates directory not found at {self._templates_dir}\n"
-                f"Expected location: {self._config_file.parent}/templates\n"
-                f"Config file: {self._config_file}",
+    @classmethod
+    def _substitute(cls, value: Any, resolved: dict[tuple[str, str], str]) -> Any:
+        """Return a copy of value with every placeholder replaced."""
+        if isinstance(value, str):
+            return _SECRET_PLACEHOLDER.sub(
+                lambda match: resolved[match[1], match[2]],
+                value,
             )
 
-    def _load_config(self, config_file: Path) -> dict[str, Any]:
-        """Load provider configuration from YAML file.
+        if isinstance(value, dict):
+            return {key: cls._substitute(item, resolved) for key, item in value.items()}
 
-        Parameters
-        ----------
-        config_file : Path
-            Path to YAML configuration file
+        if isinstance(value, list):
+            return [cls._substitute(item, resolved) for item in value]
 
-        Returns
-        -------
-        dict[str, Any]
-            Loaded configuration dictionary
+        return value
+
+    def _look_up(self, references: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """Look up references concurrently, caching the results.
 
         Raises
         ------
-        FileNotFoundError
-            If config file doesn't exist
+        ValueError
+            If any reference cannot be resolved; lists every failure
         """
-        if not config_file.exists():
-            raise FileNotFoundError(f"Config file not found: {config_file}")
+        resolved = {}
+        errors = []
+
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_workers, len(references)),
+        ) as pool:
+            futures = {
+                (scheme, reference): pool.submit(
+                    SECRET_READERS[scheme],
+                    reference.strip(),
+                )
+                for scheme, reference in references
+            }
 
-        with config_file.open() as f:
-            return yaml.safe_load(f)
+        for (scheme, reference), future in futures.items():
+            try:
+                resolved[scheme, reference] = future.result()
+            except LookupError as e:
+                errors.append(f"${{{scheme}:{reference}}}: {e}")
 
-    def discover_templates(self) -> list[Path]:
-        """Find all template markdown files.
+        if self.ttl > 0:
+            expires = time.monotonic() + self.ttl
 
-        Supports patterns:
-        - Agents: templates/agents/*.md (flat files or subdirectories)
-        - Commands: templates/commands/*.md (flat files or subdirectories)
-        - Skills: templates/skills/*/SKILL.md (must be in subdirectories)
+            with self._lock:
+                self._cache.update(
+                    (key, (value, expires)) for key, value in resolved.items()
+                )
 
-        Returns
-        -------
-        list[Path]
-            Deduplicated sorted list of template file paths
+        if errors:
+            raise ValueError(
+                "Could not resolve MCP server placeholders:\n\n"
+                + "\n".join(f"  • {error}" for error in errors),
+            )
+
+        return resolved
+
+    @classmethod
+    def contains_placeholders(cls, value: object) -> bool:
+        """Check whether value holds any placeholder."""
+        references: set[tuple[str, str]] = set()
+        cls._collect(value, references)
+
+        return bool(references)
+
+    @classmethod
+    def matches(cls, template: object, value: object) -> bool:
+        """Check whether value is what template could have resolved to.
+
+        Each placeholder matches any text, so no lookups are needed, but a
+        secret that changed since value was written goes unnoticed. Other
+        values must match in type as well (true is not 1).
         """
-        templates = set()
+        if isinstance(template, str):
+            if not isinstance(value, str):
+                return False
 
-        # Find all markdown files (flat files and files in subdirectories)
-        for md_file in self._templates_dir.rglob("*.md"):
-            templates.add(md_file)
+            # Literal text between placeholders; split also returns the groups
+            literals = _SECRET_PLACEHOLDER.split(template)[::3]
+            pattern = ".*".join(re.escape(literal) for literal in literals)
 
-        return sorted(templates)
+            return re.fullmatch(pattern, value, re.DOTALL) is not None
 
-    def get_output_path(
-        self,
-        *,
-        config: dict,
-        provider: str,
-        template_path: Path,
-        template_type: str,
-    ) -> Path:
-        """Calculate output path for a generated file.
+        if isinstance(template, dict):
+            return (
+                isinstance(value, dict)
+                and template.keys() == value.keys()
+                and all(cls.matches(item, value[key]) for key, item in template.items())
+            )
+
+        if isinstance(template, list):
+            return (
+                isinstance(value, list)
+                and len(template) == len(value)
+                and all(map(cls.matches, template, value))
+            )
+
+        return _same_json(template, value)
+
+    @classmethod
+    def mask(cls, template: object, value: Any) -> Any:
+        """Return a copy of value with every string that may be a secret hidden.
+
+        A string that template, at the same position, could have resolved to
+        is shown as template, with its placeholders unresolved. Any other
+        string, such as one left from a server that was removed, is replaced
+        with SECRET_MASK.
+        """
+        if isinstance(value, str):
+            if isinstance(template, str) and cls.matches(template, value):
+                return template
+
+            return SECRET_MASK
+
+        if isinstance(value, dict):
+            items = template if isinstance(template, dict) else {}
+
+            return {key: cls.mask(items.get(key), item) for key, item in value.items()}
+
+        if isinstance(value, list):
+            items = template if isinstance(template, list) else []
+
+            return [
+                cls.mask(items[index] if index < len(items) else None, item)
+                for index, item in enumerate(value)
+            ]
+
+        return value
+
+    def resolve(self, value: Any) -> Any:
+        """Return a copy of value with every placeholder resolved.
 
         Parameters
         ----------
-        config :dict
-            Configuration dictionary
-        provider : str
-            Provider name
-        template_path : Path
-            Path to the template file
-        template_type : str
-            Type of template (agent, command, skill)
+        value : Any
+            Strings, lists and dicts, nested to any depth
 
         Returns
         -------
-        Path
-            Output path for the generated file
+        Any
+            value itself if it holds no placeholders, otherwise a copy with
+            each placeholder replaced by its value
 
         Raises
         ------
         ValueError
-            If templates_dir is not configured, template type is unknown,
-            or provider doesn't support the template type
+            If a placeholder cannot be resolved
         """
-        # Get provider configuration
-        provider_cfg = get_provider_config(provider)
+        references: set[tuple[str, str]] = set()
+        self._collect(value, references)
 
-        # Get relative path from templates/{type}s/ directory
-        type_dir = self._templates_dir / (template_type + "s")
-        rel_path = template_path.relative_to(type_dir)
+        if not references:
+            return value
 
-        # Provider base paths from config
-        provider_config = config["providers"][provider]
-        templates_dir = provider_config.get("templates_dir")
+        now = time.monotonic()
 
-        if not templates_dir:
-            raise ValueError(f"No templates_dir configured for provider: {provider}")
+        with self._lock:
+            resolved = {
+                key: cached
+                for key, (cached, expires) in self._cache.items()
+                if key in references and expires > now
+            }
 
-        provider_base = Path(templates_dir).expanduser()
+        missing = sorted(references - resolved.keys())
 
-        # Get subdirectory based on template type
-        if template_type == "agent":
-            subdir = provider_cfg.agent_dir
-        elif template_type == "command":
-            subdir = provider_cfg.command_dir
-        elif template_type == "skill":
-            subdir = provider_cfg.skill_dir
-        else:
-            raise ValueError(f"Unknown template type: {template_type}")
+        if missing:
+            resolved |= self._look_up(missing)
 
-        if subdir is None:
-            raise ValueError(
-                f"Provider {provider} does not support template type {template_type}",
-            )
+        return self._substitute(value, resolved)
 
-        # Build full path: base / subdir / relative_path
-        base_dir = provider_base / subdir
+    def resolve_servers(self, servers: list[MCPServerConfig]) -> list[MCPServerConfig]:
+        """Resolve the placeholders in the values and providers of servers.
 
-        # For skills, create nested directory structure
-        if template_type == "skill":
-            skill_name = rel_path.parts[0]
-            return base_dir / skill_name / "SKILL.md"
+        Lookups for all servers run concurrently.
 
-        return base_dir / rel_path
+        Raises
+        ------
+        ValueError
+            If a placeholder cannot be resolved
+        """
+        resolved = self.resolve(
+            [[server.values, server.providers] for server in servers],
+        )
 
-    def write_generated_file(self, output_path: Path, content: str) -> bool:
-        """Write generated content to output file.
+        return [
+            replace(server, values=values, providers=providers)
+            for server, (values, providers) in zip(servers, resolved, strict=True)
+        ]
 
-        Parameters
-        ----------
-        output_path : Path
-            Path to the output file
-        content : str
-            Content to write
 
-        Returns
-        -------
-        bool
-            True if write was successful, False otherwise
-        """
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+class MCPTarget(NamedTuple):
+    """A provider MCP config file and the section to sync into it.
 
-        try:
-            output_path.write_text(content)
-            print(f"Generated: {output_path}")
-        except PermissionError as e:
-            print(f"Permission denied writing {output_path}: {e}", file=sys.stderr)
-            return False
-        except OSError as e:
-            # Covers: disk full, I/O errors, IsADirectoryError, etc.
-            print(f"Error writing {output_path}: {e}", file=sys.stderr)
-            return False
-        else:
-            return True
+    Attributes
+    ----------
+    provider : str
+        Provider name
+    path : Path
+        Path to the provider's JSON config file
+    data : dict[str, Any]
+        Generated configuration, keyed by mcp_key
+    mcp_key : str
+        Key used in the provider's MCP config JSON
+    private : bool
+        Whether data holds resolved placeholders, so a new file must only be
+        readable by its owner
+    """
 
-    def _copy_skill_file(
-        self,
-        item: Path,
-        rel_path: Path,
-        dest_path: Path,
-        max_file_size: int,
-    ) -> bool:
-        """Copy a single skill file to its destination.
+    provider: str
+    path: Path
+    data: dict[str, Any]
+    mcp_key: str
+    private: bool = False
 
-        Returns True on success, False on any error (with warning printed).
-        """
-        try:
-            file_size = item.stat().st_size
-            if file_size > max_file_size:
-                print(
-                    f"Warning: Skipping large file "
-                    f"({file_size / 1024 / 1024:.1f}MB): {rel_path}",
-                    file=sys.stderr,
-                )
-                # Return inside try: intentionally bypasses the else clause below.
-                return False
 
-            dest_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(item, dest_path)
+class TargetChangedError(Exception):
+    """Raised when a file changes between being read and being replaced."""
 
-        except PermissionError as e:
-            print(
-                f"Warning: Permission denied copying {rel_path}: {e}",
-                file=sys.stderr,
-            )
-            return False
-        except OSError as e:
-            print(
-                f"Warning: Failed to copy {rel_path}: {e}",
-                file=sys.stderr,
-            )
-            return False
-        else:
-            return True
 
-    def copy_skill_directory(  # noqa: C901 — inherent traversal complexity: 2 guard clauses + rglob loop with skip/symlink/is_file checks + 2 outer OSError handlers; per-file logic already extracted into _copy_skill_file
-        self,
-        skill_dir: Path,
-        output_dir: Path,
-        skip_files: list[str] | None = None,
-    ) -> tuple[int, int]:
-        """Copy all files from skill directory to output, excluding specified files.
+# Attempts to merge into an MCP config file that other programs keep changing
+MCP_MERGE_ATTEMPTS = 5
+MCP_MERGE_RETRY_DELAY = 0.05
 
-        Parameters
-        ----------
-        skill_dir : Path
-            Source skill directory
-        output_dir : Path
-            Destination directory
-        skip_files : Optional[list[str]], optional
-            list of filenames to skip (defaults to template files)
 
-        Returns
-        -------
-        tuple[int, int]
-            Tuple of (files_copied, errors_encountered)
+def _file_version(path: Path) -> tuple[int, int, int] | None:
+    """Return (inode, mtime, size) of path, or None if it does not exist.
 
-        Notes
-        -----
-        - Symlinks are followed (not preserved as symlinks)
-        - Broken symlinks are skipped with warning
-        - Existing files are overwritten
-        - Empty directories are not created
-        - Files larger than 10MB are skipped with warning
-        """
-        if skip_files is None:
-            skip_files = ["SKILL.md", "skill.md", ".DS_Store", ".gitkeep"]
+    Replacing a file by rename changes its inode; rewriting it in place
+    changes its mtime or size.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
 
-        # Convert to set for O(1) lookups and normalize case for macOS
-        skip_files_set = {name.upper() for name in skip_files}
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
 
-        if not skill_dir.exists():
-            print(f"Warning: Source directory not found: {skill_dir}", file=sys.stderr)
-            return (0, 0)
 
-        if not skill_dir.is_dir():
+SYNC_LOCK_FILENAME = "sync.lock"
+
+
+@contextlib.contextmanager
+def sync_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive advisory lock on path, waiting for other holders.
+
+    Serializes syncs run by different processes, such as a git hook and watch
+    mode. The lock is released when the process exits, even if it crashes.
+    Without fcntl (on Windows) no lock is taken.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with path.open("a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
             print(
-                f"Warning: Source path is not a directory: {skill_dir}",
+                f"Waiting for another sync to finish (lock: {path})",
                 file=sys.stderr,
             )
-            return (0, 0)
-
-        copied_count = 0
-        error_count = 0
-        max_file_size = 10 * 1024 * 1024  # 10MB
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
 
         try:
-            for item in skill_dir.rglob("*"):
-                if item.name.upper() in skip_files_set:
-                    continue
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
-                # Skip broken symlinks
-                if item.is_symlink() and not item.exists():
-                    print(
-                        f"Warning: Skipping broken symlink: "
-                        f"{item.relative_to(skill_dir)}",
-                        file=sys.stderr,
-                    )
-                    error_count += 1
-                    continue
 
-                if not item.is_file():
-                    continue
+def _is_simple_key(key: object) -> bool:
+    """Check whether both emitters write a mapping key as a plain "key:" line."""
+    if not isinstance(key, str):
+        return not isinstance(key, dict | list | tuple)
 
-                rel_path = item.relative_to(skill_dir)
-                dest_path = output_dir / rel_path
+    return (
+        len(key.encode()) <= _SIMPLE_KEY_BYTES
+        and _SIMPLE_KEY.fullmatch(key) is not None
+    )
 
-                if self._copy_skill_file(item, rel_path, dest_path, max_file_size):
-                    copied_count += 1
-                else:
-                    error_count += 1
 
-        except PermissionError as e:
-            print(
-                f"Error: Permission denied traversing directory {skill_dir}: {e}",
-                file=sys.stderr,
-            )
-            return (copied_count, error_count + 1)
-        except OSError as e:
-            print(
-                f"Error: Failed to traverse directory {skill_dir}: {e}",
-                file=sys.stderr,
-            )
-            return (copied_count, error_count + 1)
+def _contains_libyaml_escapes(value: object) -> bool:
+    """Check whether value would be emitted differently by libyaml.
 
-        return (copied_count, error_count)
+    That is the case for strings with characters libyaml escapes and for
+    mappings with keys that are not simple (see _is_simple_key).
+    """
+    if isinstance(value, str):
+        return _LIBYAML_ESCAPED.search(value) is not None
+
+    if isinstance(value, dict):
+        return any(
+            not _is_simple_key(k)
+            or _contains_libyaml_escapes(k)
+            or _contains_libyaml_escapes(v)
+            for k, v in value.items()
+        )
 
-    def _deep_merge_mcp_servers(
-        self,
-        existing: dict[str, Any],
-        new: dict[str, Any],
-        mcp_key: str,
-    ) -> dict[str, Any]:
-        """Merge MCP server configurations, replacing the entire MCP servers section.
+    if isinstance(value, list | tuple):
+        return any(_contains_libyaml_escapes(item) for item in value)
 
-        This method treats config.yml as the source of truth for MCP servers.
-        All servers in the JSON file are replaced with those from config.yml.
-        Other top-level keys in the JSON file are preserved.
+    return False
 
-        Parameters
-        ----------
-        existing : dict[str, Any]
-            Existing configuration dictionary
-        new : dict[str, Any]
-            New configuration dictionary
-        mcp_key : str
-            Key for MCP servers ("mcpServers" or "mcp")
 
-        Returns
-        -------
-        dict[str, Any]
-            Merged configuration dictionary
-        """
-        result = existing.copy()
+# Tokens of a JSON document that matter for finding value boundaries: strings
+# (which may contain brackets) and brackets. Everything else is skipped in C.
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r"[ \t\r\n]*")
 
-        # Replace the entire MCP servers section with what's in config.yml
-        # This makes config.yml the source of truth for server configurations
-        if mcp_key in new:
-            result[mcp_key] = new[mcp_key]
 
-        # Add any other top-level keys from new config
-        for key, value in new.items():
-            if key != mcp_key:
-                result[key] = value
+class JsonObjectLayout(NamedTuple):
+    """Byte offsets of the top-level members of a JSON object.
 
-        return result
+    Attributes
+    ----------
+    members : dict[str, tuple[int, int, int]]
+        Key name to (key start, value start, value end) offsets
+    end : int
+        Offset of the object's closing brace
+    """
 
-    def _create_backup(self, target_path: Path) -> Path | None:
-        """Create a timestamped backup of target_path.
+    members: dict[str, tuple[int, int, int]]
+    end: int
 
-        Returns the backup path on success, or None if backup failed or was not needed.
-        """
-        if not target_path.exists():
-            return None
 
-        timestamp = datetime.now(tz=UTC).strftime("%Y%m%d_%H%M%S")
-        backup_path = target_path.with_suffix(f".backup.{timestamp}")
+def _same_json(first: object, second: object) -> bool:
+    """Compare decoded JSON values, ignoring key order but not type (true != 1)."""
+    return first == second and json.dumps(first, sort_keys=True) == json.dumps(
+        second,
+        sort_keys=True,
+    )
 
-        try:
-            shutil.copy2(target_path, backup_path)
-            print(f"Created backup: {backup_path}")
-        except (OSError, PermissionError) as e:
-            # Backup is optional - log warning but continue
-            print(f"Warning: Could not create backup: {e}", file=sys.stderr)
-            return None
-        else:
-            return backup_path
 
-    def _write_json_atomic(
-        self,
-        target_path: Path,
-        data: dict[str, Any],
-    ) -> bool:
-        """Write data as JSON to target_path via a temp file for atomicity.
+def _member_indent(data: bytes, key_start: int) -> bytes | None:
+    """Return the indentation of an object member that starts its own line.
 
-        Returns True on success, False on I/O error.
-        Re-raises on JSON serialization errors (programming bugs).
-        """
-        temp_path = target_path.with_suffix(target_path.suffix + ".tmp")
+    Returns None for members that share a line with other tokens, as in
+    compact JSON.
+    """
+    line_start = data.rfind(b"\n", 0, key_start) + 1
+    indent = data[line_start:key_start]
 
-        try:
-            temp_path.write_text(json.dumps(data, indent=2) + "\n")
-            temp_path.replace(target_path)
-            print(f"Updated MCP config: {target_path}")
-        except (TypeError, ValueError) as e:
-            # JSON serialization errors indicate programming bugs
-            print(f"Error serializing config data: {e}", file=sys.stderr)
-            if temp_path.exists():
-                temp_path.unlink()
-            raise  # Re-raise to expose programming errors
-        except (OSError, PermissionError) as e:
-            print(f"Error writing {target_path}: {e}", file=sys.stderr)
-            if temp_path.exists():
-                temp_path.unlink()
-            return False
-        else:
-            return True
+    return indent if line_start > 0 and not indent.strip() else None
 
-    def merge_json_file(
-        self,
-        target_path: Path,
-        new_data: dict[str, Any],
-        mcp_key: str,
-    ) -> tuple[bool, Path | None]:
-        """Merge new configuration data into existing JSON file.
 
-        Parameters
-        ----------
-        target_path : Path
-            Path to target JSON file
-        new_data : dict[str, Any]
-            New configuration data to merge
-        mcp_key : str
-            MCP configuration key format for this provider (e.g., "mcpServers", "mcp")
+def _dump_json_member(value: object, indent: bytes | None) -> bytes:
+    """Serialize a member value to match its surroundings.
 
-        Returns
-        -------
-        tuple[bool, Path | None]
-            Tuple of (success, backup_path)
-            - success: True if merge was successful, False otherwise
-            - backup_path: Path to backup file created, or None if no backup was created
-        """
-        target_path.parent.mkdir(parents=True, exist_ok=True)
-        backup_path = self._create_backup(target_path)
+    Indented members are dumped with indent=2, as a full rewrite would; members
+    of compact documents are dumped compactly.
+    """
+    if indent is None:
+        return json.dumps(value, separators=(",", ":")).encode()
 
-        # Load existing config or start with empty dict
-        existing_config = {}
-        if target_path.exists():
-            try:
-                existing_config = json.loads(target_path.read_text())
-            except json.JSONDecodeError as e:
-                print(f"Warning: Could not parse {target_path}: {e}", file=sys.stderr)
-                print(f"Creating new file at {target_path}", file=sys.stderr)
+    return json.dumps(value, indent=2).replace("\n", "\n" + indent.decode()).encode()
 
-        # Get all possible MCP keys from provider configs
-        all_mcp_keys = {cfg.mcp_key for cfg in PROVIDERS.values()}
-        other_mcp_keys = all_mcp_keys - {mcp_key}
 
-        # Normalize existing config by migrating from any other MCP key format
-        for other_key in other_mcp_keys:
-            if other_key in existing_config:
-                if mcp_key in existing_config:
-                    # Both keys exist - warn and prefer provider's key
-                    print(
-                        f"Warning: {target_path} has both "
-                        f"'{mcp_key}' and '{other_key}'. "
-                        f"Using '{mcp_key}' and discarding '{other_key}'.",
-                        file=sys.stderr,
-                    )
-                # Migrate from other key format to provider's expected key format
-                existing_config[mcp_key] = existing_config.pop(other_key)
+def _skip_json_whitespace(text: str, pos: int) -> int:
+    """Return the offset of the first non-whitespace character at or after pos."""
+    return _JSON_WHITESPACE.match(text, pos).end()  # type: ignore[union-attr]
 
-        # Deep merge MCP servers to preserve existing servers
-        merged_config = self._deep_merge_mcp_servers(existing_config, new_data, mcp_key)
 
-        if not self._write_json_atomic(target_path, merged_config):
-            return (False, None)
+def _scan_json_member(text: str, pos: int) -> tuple[str, int, int, int] | None:
+    """Locate the object member whose key starts at pos.
 
-        return (True, backup_path)
+    Values are skipped with the C JSON decoder, which also validates them.
+    Returns (key, key start, value start, value end), or None if no
+    well-formed member starts at pos.
+    """
+    if text[pos : pos + 1] != '"':
+        return None
 
-    def _validate_skill_template(self, template_path: Path) -> None:
-        """Validate skill template requirements.
+    try:
+        key, key_end = _JSON_DECODER.raw_decode(text, pos)
+        colon = _skip_json_whitespace(text, key_end)
 
-        Skills must follow the pattern: templates/skills/<skill-name>/SKILL.md
-        where <skill-name> is exactly one directory level deep.
+        if text[colon : colon + 1] != ":":
+            return None
 
-        Parameters
-        ----------
-        template_path : Path
-            Path to skill template file
+        value_start = _skip_json_whitespace(text, colon + 1)
+        _, value_end = _JSON_DECODER.raw_decode(text, value_start)
+    except json.JSONDecodeError:
+        return None
 
-        Raises
-        ------
-        ValueError
-            If skill validation fails
-        """
-        skills_dir = self._templates_dir / "skills"
+    return (key, pos, value_start, value_end)
 
-        # Check that skill is in a subdirectory of skills/
-        try:
-            rel_path = template_path.relative_to(skills_dir)
-        except ValueError as e:
-            raise ValueError(
-                f"Skill template must be in subdirectory of skills/: {template_path}",
-            ) from e
 
-        # Skills must be exactly one directory level deep (not flat, not nested deeper)
-        if len(rel_path.parts) != _SKILL_PATH_DEPTH:
-            if len(rel_path.parts) == 1:
-                raise ValueError(
-                    f"Skill template must be in a subdirectory of skills/ "
-                    f"(e.g., skills/my-skill/SKILL.md), "
-                    f"not directly in skills/: {template_path}",
-                )
-            raise ValueError(
-                f"Skill template must be exactly one directory deep "
-                f"(e.g., skills/my-skill/SKILL.md), "
-                f"not nested deeper: {template_path}",
-            )
+def _encoded_offsets(text: str, offsets: list[int]) -> list[int]:
+    """Convert ascending character offsets into text to UTF-8 byte offsets."""
+    byte_offsets = []
+    position = byte_position = 0
 
-        # Filename must be exactly SKILL.md (case-sensitive)
-        if template_path.name != "SKILL.md":
-            raise ValueError(
-                f"Skill template filename must be exactly 'SKILL.md' (case-sensitive), "
-                f"found '{template_path.name}'. Please rename: {template_path}",
-            )
+    for offset in offsets:
+        byte_position += len(text[position:offset].encode())
+        position = offset
+        byte_offsets.append(byte_position)
 
-    def validate_template(
-        self,
-        template: TemplateConfig,
-        template_path: Path,
-    ) -> list[str]:
-        """Validate template configuration and return warnings.
+    return byte_offsets
 
-        Parameters
-        ----------
-        template : TemplateConfig
-            Parsed template configuration
-        template_path : Path
-            Path to template file
 
-        Returns
-        -------
-        list[str]
-            list of warning messages
+def scan_json_object(data: bytes) -> JsonObjectLayout | None:
+    """Locate the top-level members of a JSON object.
 
-        Raises
-        ------
-        ValueError
-            If skill validation fails
-        """
-        # Validate skills have correct structure
-        if template.type == "skill":
-            self._validate_skill_template(template_path)
+    Member values are validated but not kept, so only the bytes of a member
+    that is about to change need to be decoded again.
 
-        warnings = []
-        enabled_providers = [
-            p
-            for p, cfg in template.provider_metadata.items()
-            if cfg.get("enabled", False)
-        ]
+    Parameters
+    ----------
+    data : bytes
+        UTF-8 encoded JSON document
 
-        if not enabled_providers:
-            warnings.append(
-                f"{template_path.name}: No providers enabled. "
-                f"This template will not generate any files.",
-            )
+    Returns
+    -------
+    JsonObjectLayout | None
+        Offsets of each top-level member, or None if the document is not a
+        single valid object with unique keys
+    """
+    try:
+        text = data.decode()
+    except UnicodeDecodeError:
+        return None
 
-        return warnings
+    pos = _skip_json_whitespace(text, 0)
 
-    def _cleanup_backups(self, backup_paths: list[Path]) -> None:
-        """Delete backup files after successful sync.
+    if text[pos : pos + 1] != "{":
+        return None
 
-        Parameters
-        ----------
-        backup_paths : list[Path]
-            list of backup file paths to delete
-        """
-        if not backup_paths:
-            return
+    members: dict[str, tuple[int, int, int]] = {}
+    pos = _skip_json_whitespace(text, pos + 1)
+    separator = text[pos : pos + 1]
 
-        for backup_path in backup_paths:
-            try:
-                if backup_path.exists():
-                    backup_path.unlink()
-                    print(f"Deleted backup: {backup_path}")
-            except (OSError, PermissionError) as e:  # noqa: PERF203 - per-item error handling keeps cleanup loop running on individual failures
-                # Log error but don't fail the sync
-                print(
-                    f"Warning: Could not delete backup {backup_path}: {e}",
-                    file=sys.stderr,
-                )
+    while separator != "}":
+        member = _scan_json_member(text, pos)
 
-    def load_mcp_servers(self) -> list[MCPServerConfig]:
-        """Load MCP servers from the config loaded during initialization.
+        if member is None or member[0] in members:
+            return None
 
-        Returns
-        -------
-        list[MCPServerConfig]
-            list of MCP server configuration objects
-        """
-        servers_dict = self._config.get("mcp_servers", {})
-        servers = []
+        key, key_start, value_start, value_end = member
+        members[key] = (key_start, value_start, value_end)
+        pos = _skip_json_whitespace(text, value_end)
+        separator = text[pos : pos + 1]
 
-        for name, server_data in servers_dict.items():
-            # Extract values and providers from server config
-            values = server_data.get("values", {})
-            providers = server_data.get("providers", {})
+        if separator == ",":
+            pos = _skip_json_whitespace(text, pos + 1)
+        elif separator != "}":
+            return None
 
-            # Validation warnings
-            if "name" in values:
-                print(
-                    f"Warning: MCP server '{name}' has 'name' in values. "
-                    f"Server name should be the config key, not in values.",
-                    file=sys.stderr,
-                )
+    if _skip_json_whitespace(text, pos + 1) != len(text):
+        return None
 
-            # Warn if command is empty for local servers (best effort check)
-            if not values.get("command") and values.get("type", "local") == "local":
-                print(
-                    f"Warning: MCP server '{name}' has empty 'command' "
-                    f"for local server",
-                    file=sys.stderr,
-                )
+    if not text.isascii():
+        spans = [offset for span in members.values() for offset in span]
+        offsets = iter(_encoded_offsets(text, [*spans, pos]))
+        members = {
+            key: (next(offsets), next(offsets), next(offsets)) for key in members
+        }
+        pos = next(offsets)
 
-            # Default args to empty list if missing or explicitly null in YAML
-            if not values.get("args"):
-                values["args"] = []
+    return JsonObjectLayout(members=members, end=pos)
 
-            servers.append(
-                MCPServerConfig(
-                    name=name,
-                    values=values,
-                    providers=providers,
-                ),
-            )
 
-        return servers
+def _canonical_key(value: object) -> object:
+    """Return a hashable form of a YAML value for use as a cache key.
 
-    def sync_mcp_servers(self) -> int:  # noqa: C901 — inherent orchestration complexity: validation loop (2 branches) + provider loop (skip/empty-guard/success/failure branches); already clean and well-structured
-        """Synchronize MCP server configurations to provider files.
+    Key order and scalar types are preserved, so two values share a key only
+    if yaml.dump renders them identically.
+    """
+    value_type = type(value)
 
-        Returns
-        -------
-        int
-            Number of successfully updated files
+    # Strings dominate frontmatter and cannot collide with the tuples below
+    if value_type is str:
+        return value
 
-        Raises
-        ------
-        ValueError
-            If validation of provider configurations fails
-        """
-        servers = self.load_mcp_servers()
+    if value_type is dict:
+        return (
+            dict,
+            *[(_canonical_key(k), _canonical_key(v)) for k, v in value.items()],
+        )
 
-        if not servers:
-            print("No MCP servers configured")
+    if value_type is list or value_type is tuple:
+        return (value_type, *[_canonical_key(item) for item in value])
 
-            return 0
+    if value_type is set:
+        return (set, frozenset(_canonical_key(item) for item in value))
 
-        providers_config = self._config.get("providers", {})
-        backup_files: list[Path] = []
+    if value_type is float:
+        # repr distinguishes -0.0 from 0.0, which compare equal
+        return (float, repr(value))
 
-        # Collect the unique set of provider names enabled across all servers
-        enabled_providers = {
-            provider_name
-            for server in servers
-            for provider_name, cfg in server.providers.items()
-            if cfg.get("enabled", False)
-        }
+    return (value_type, value)
 
-        # Validate that all enabled providers exist and have mcp_config paths
-        validation_errors = []
 
-        for provider_name in sorted(enabled_providers):
-            if provider_name not in providers_config:
-                validation_errors.append(
-                    f"Provider '{provider_name}' is not defined in config.yml. "
-                    f"Add '{provider_name}:' to the 'providers:' section in config.yml",
-                )
+class TemplateGenerator:
+    """Generates template files for all providers using unified format."""
+
+    @staticmethod
+    def frontmatter_config(template: TemplateConfig, provider: str) -> dict[str, Any]:
+        """Merge shared and provider-specific config into frontmatter fields.
+
+        Parameters
+        ----------
+        template : TemplateConfig
+            Template configuration object
+        provider : str
+            Provider name
+
+        Returns
+        -------
+        dict[str, Any]
+            Frontmatter fields, without the 'enabled' flag
+        """
+        config = template.shared_config | template.provider_metadata.get(provider, {})
+        # Remove 'enabled' field - not part of frontmatter
+        return {k: v for k, v in config.items() if k != "enabled"}
+
+    @staticmethod
+    def generate_frontmatter(template: TemplateConfig, provider: str) -> str:
+        """Generate provider-specific YAML frontmatter.
+
+        Parameters
+        ----------
+        template : TemplateConfig
+            Template configuration object
+        provider : str
+            Provider name
+
+        Returns
+        -------
+        str
+            YAML frontmatter string
+        """
+        return TemplateGenerator.render_frontmatter(
+            TemplateGenerator.frontmatter_config(template, provider),
+        )
+
+    @staticmethod
+    def render_frontmatter(config: dict[str, Any]) -> str:
+        """Render frontmatter fields as YAML.
+
+        Parameters
+        ----------
+        config : dict[str, Any]
+            Frontmatter fields from frontmatter_config
+
+        Returns
+        -------
+        str
+            YAML frontmatter string
+        """
+        dumper = (
+            yaml.SafeDumper if _contains_libyaml_escapes(config) else FastSafeDumper
+        )
+
+        return yaml.dump(
+            config,
+            Dumper=dumper,
+            default_flow_style=False,
+            sort_keys=False,
+            width=999999,  # Large width to prevent wrapping
+            allow_unicode=True,
+        )
+
+    @staticmethod
+    def generate_file_content(template: TemplateConfig, provider: str) -> str:
+        """Generate complete provider-format file.
+
+        Parameters
+        ----------
+        template : TemplateConfig
+            Template configuration object
+        provider : str
+            Provider name
+
+        Returns
+        -------
+        str
+            Complete file content with frontmatter and body
+        """
+        frontmatter = TemplateGenerator.generate_frontmatter(template, provider)
+
+        return f"---\n{frontmatter}---\n\n{template.body}\n"
+
+    @staticmethod
+    def assemble_file_content(frontmatter: bytes, body: bytes) -> bytes:
+        """Join encoded frontmatter and body into a complete file.
+
+        Produces the same bytes as generate_file_content().encode(), copying
+        the body once instead of into an intermediate string.
+
+        Parameters
+        ----------
+        frontmatter : bytes
+            Encoded YAML frontmatter
+        body : bytes
+            Encoded template body
+
+        Returns
+        -------
+        bytes
+            Complete file content
+        """
+        return b"".join((b"---\n", frontmatter, b"---\n\n", body, b"\n"))
+
+
+MANIFEST_FILENAME = ".sync-manifest.json"
+
+
+def _hash_file(path: Path) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@functools.cache
+def _renderer_hash() -> str:
+    """Return the digest of this script, which renders every output."""
+    return _hash_file(Path(__file__))
+
+
+def _hash_skill_assets(skill_dir: Path) -> str:
+    """Return a digest of the name, size and mtime of every file in a skill.
+
+    This is a stat-only signature; it changes whenever a supporting file is
+    added, removed or modified. Files excluded by the skill's ignore files
+    are not part of it.
+    """
+    digest = hashlib.sha256()
+
+    for item in sorted(_walk_skill_files(skill_dir)):
+        if not item.is_file():
+            continue
+
+        stat = item.stat()
+        digest.update(
+            f"{item.relative_to(skill_dir)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode(),
+        )
+
+    return digest.hexdigest()
+
+
+def _hash_output_tree(directory: Path) -> str:
+    """Return a digest of the name, size and mtime of every file below directory.
+
+    Unlike _hash_skill_assets, no ignore files apply: every file in a
+    generated skill directory counts.
+    """
+    digest = hashlib.sha256()
+
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            stat = Path(root, name).stat()
+            rel_path = Path(root, name).relative_to(directory)
+            digest.update(f"{rel_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+
+    return digest.hexdigest()
+
+
+def fingerprint_output(output_path: Path, template_type: str) -> dict[str, Any]:
+    """Collect the stat-level fingerprint of a generated file.
+
+    For skills, the files copied next to SKILL.md are part of it.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be stat'ed
+    """
+    stat = output_path.stat()
+    fingerprint: dict[str, Any] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    if template_type == "skill":
+        fingerprint["assets"] = _hash_output_tree(output_path.parent)
+
+    return fingerprint
+
+
+class BuildManifest:
+    """Persistent record of the inputs and outputs of previous syncs.
+
+    Each entry records a template's size, mtime and content hash, the size and
+    mtime of the files it produced for enabled providers and the files it maps
+    to for disabled providers. Entries are only valid for the config inputs
+    and renderer they were built with; a change to the providers section,
+    PROVIDERS or this script invalidates all of them.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: Path, config_hash: str) -> None:
+        """Initialize an empty manifest.
+
+        Parameters
+        ----------
+        path : Path
+            Location of the manifest file
+        config_hash : str
+            Digest of the config inputs that generated outputs depend on
+        """
+        self._path = path
+        self._config_hash = config_hash
+        self._entries: dict[str, dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: Path, config_hash: str) -> "BuildManifest":
+        """Load a manifest from disk, discarding it if stale or unreadable.
+
+        Parameters
+        ----------
+        path : Path
+            Location of the manifest file
+        config_hash : str
+            Digest of the current config inputs
+
+        Returns
+        -------
+        BuildManifest
+            Manifest with entries from disk, or an empty manifest
+        """
+        manifest = cls(path, config_hash)
+
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return manifest
+        except (OSError, ValueError) as e:
+            print(
+                f"Warning: Ignoring unreadable manifest {path}: {e}",
+                file=sys.stderr,
+            )
+            return manifest
+
+        if (
+            isinstance(data, dict)
+            and data.get("version") == cls.VERSION
+            and data.get("config_hash") == config_hash
+        ):
+            manifest._entries = data.get("templates", {})
+
+        return manifest
+
+    @staticmethod
+    def _stat_inputs(template_path: Path, template_type: str | None) -> dict[str, Any]:
+        """Collect the stat-level fingerprint of a template's inputs."""
+        stat = template_path.stat()
+        inputs: dict[str, Any] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        if template_type == "skill":
+            inputs["assets"] = _hash_skill_assets(template_path.parent)
+
+        return inputs
+
+    def lookup(
+        self,
+        template_path: Path,
+        *,
+        prune: bool = False,
+    ) -> dict[str, Any] | None:
+        """Return the entry for a template if it is still up to date.
+
+        Size and mtime are compared first; the content hash is only computed
+        when they differ. Every recorded output must still exist with the size
+        and mtime it was written with, so edited or overwritten outputs are
+        rebuilt.
+
+        Parameters
+        ----------
+        template_path : Path
+            Path to template file
+        prune : bool, optional
+            Whether skills must have been synced with pruning
+
+        Returns
+        -------
+        dict[str, Any] | None
+            The manifest entry, or None if the template must be rebuilt
+        """
+        entry = self._entries.get(str(template_path))
+
+        if entry is None:
+            return None
+
+        try:
+            inputs = self._stat_inputs(template_path, entry["type"])
+            fresh = (
+                inputs.get("assets") == entry.get("assets")
+                and inputs["size"] == entry["size"]
+                and (
+                    inputs["mtime_ns"] == entry["mtime_ns"]
+                    or _hash_file(template_path) == entry["sha256"]
+                )
+            )
+        except OSError:
+            return None
+
+        if not fresh or (prune and entry["type"] == "skill" and not entry["pruned"]):
+            return None
+
+        try:
+            if any(
+                fingerprint_output(Path(output), entry["type"])
+                != entry["outputs"][output]
+                for output in entry["enabled"].values()
+            ):
+                return None
+        except OSError:
+            return None
+
+        # A touched but unchanged template refreshes the stat fast path
+        entry["mtime_ns"] = inputs["mtime_ns"]
+
+        return entry
+
+    def record(
+        self,
+        template_path: Path,
+        template_type: str,
+        outputs: dict[str, dict[str, Path]],
+        fingerprints: dict[str, dict[str, Any]],
+        *,
+        pruned: bool = False,
+    ) -> None:
+        """Record a successfully built template.
+
+        Parameters
+        ----------
+        template_path : Path
+            Path to template file
+        template_type : str
+            Type of template (agent, command, skill)
+        outputs : dict[str, dict[str, Path]]
+            Output paths keyed by "enabled"/"disabled" and then provider
+        fingerprints : dict[str, dict[str, Any]]
+            fingerprint_output of each enabled output, keyed by its path
+        pruned : bool, optional
+            Whether stale files were pruned from the skill's output
+        """
+        try:
+            inputs = self._stat_inputs(template_path, template_type)
+            inputs["sha256"] = _hash_file(template_path)
+        except OSError:
+            self._entries.pop(str(template_path), None)
+            return
+
+        self._entries[str(template_path)] = {
+            "type": template_type,
+            **inputs,
+            "enabled": {p: str(path) for p, path in outputs["enabled"].items()},
+            "disabled": {p: str(path) for p, path in outputs["disabled"].items()},
+            "outputs": fingerprints,
+            "pruned": pruned,
+        }
+
+    def discard(self, template_path: Path) -> None:
+        """Forget a template so it is rebuilt on the next sync."""
+        self._entries.pop(str(template_path), None)
+
+    def prune(self, template_paths: list[Path]) -> None:
+        """Drop entries for templates that no longer exist."""
+        keep = {str(path) for path in template_paths}
+        self._entries = {k: v for k, v in self._entries.items() if k in keep}
+
+    def save(self) -> None:
+        """Write the manifest to disk via a temp file for atomicity."""
+        data = {
+            "version": self.VERSION,
+            "config_hash": self._config_hash,
+            "templates": self._entries,
+        }
+        temp_path = self._path.with_suffix(self._path.suffix + ".tmp")
+
+        try:
+            temp_path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+            temp_path.replace(self._path)
+        except OSError as e:
+            # The manifest is an optimisation; losing it only costs a full rebuild
+            print(
+                f"Warning: Could not write manifest {self._path}: {e}",
+                file=sys.stderr,
+            )
+            temp_path.unlink(missing_ok=True)
+
+
+# renameat(2) constants for atomically exchanging two directories on Linux
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+@functools.cache
+def _load_libc() -> ctypes.CDLL | None:
+    """Load the C library through ctypes, or return None if unavailable."""
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+
+
+@functools.cache
+def _load_renameat2() -> Callable[..., int] | None:
+    """Return the C library's renameat2(2), or None if it has none."""
+    renameat2 = getattr(_load_libc(), "renameat2", None)
+
+    if renameat2 is not None:
+        renameat2.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint,
+        ]
+        renameat2.restype = ctypes.c_int
+
+    return renameat2
+
+
+def _exchange_paths(first: Path, second: Path) -> None:
+    """Atomically swap two paths with renameat2(RENAME_EXCHANGE).
+
+    Raises
+    ------
+    OSError
+        If the swap failed, for example because the filesystem does not
+        support it (EINVAL) or renameat2 is unavailable (ENOSYS)
+    """
+    renameat2 = _load_renameat2()
+
+    if renameat2 is None:
+        raise OSError(errno.ENOSYS, "renameat2 is not available", str(first))
+
+    if renameat2(
+        _AT_FDCWD,
+        os.fsencode(first),
+        _AT_FDCWD,
+        os.fsencode(second),
+        _RENAME_EXCHANGE,
+    ):
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), str(first), None, str(second))
+
+
+def _flush_filesystem(path: Path) -> None:
+    """Flush every pending write on the filesystem containing path.
+
+    Uses syncfs(2) where available, so a single call covers all staged files;
+    falls back to sync(2).
+    """
+    syncfs = getattr(_load_libc(), "syncfs", None)
+
+    if syncfs is not None:
+        fd = os.open(path, os.O_RDONLY)
+
+        try:
+            if syncfs(fd) == 0:
+                return
+        finally:
+            os.close(fd)
+
+    os.sync()
+
+
+def _fsync_directory(path: Path) -> None:
+    """Persist the entries of a directory, such as a completed rename."""
+    fd = os.open(path, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StagedOutputTree:
+    """Stages changes to managed output directories and applies them at once.
+
+    The first change to a managed directory (such as ~/.claude/agents) mirrors
+    it into a hidden sibling with hard links, so files the sync leaves alone
+    cost a link rather than a copy, and files it did not create are
+    preserved. Changes then go to the mirror (replacing, never modifying,
+    linked files); commit() carries over files other programs changed in the
+    live directory meanwhile, flushes the filesystem once and swaps each
+    mirror with its live directory with renameat2(RENAME_EXCHANGE).
+    Directories without changes are never mirrored. A sync that fails or is
+    interrupted before commit() leaves the live directories as they were.
+    """
+
+    STAGING_SUFFIX = ".sync-staging"
+
+    def __init__(self, roots: list[Path]) -> None:
+        """Initialize StagedOutputTree.
+
+        Parameters
+        ----------
+        roots : list[Path]
+            Managed output directories; a symlinked directory is staged and
+            swapped at its target, leaving the symlink in place
+        """
+        self._roots: dict[Path, tuple[Path, Path]] = {}
+
+        for root in roots:
+            real = root.resolve()
+            staged = real.with_name(f".{real.name}{self.STAGING_SUFFIX}")
+            self._roots[root] = (real, staged)
+
+        self._staged_roots: set[Path] = set()
+        # Version of each file of a mirrored directory when it was mirrored
+        self._mirrored: dict[Path, dict[Path, tuple[int, int, int]]] = {}
+        self._lock = threading.Lock()
+        self.files_linked = 0
+
+    @staticmethod
+    def supported() -> bool:
+        """Check whether directories can be swapped atomically on this system."""
+        return _load_renameat2() is not None
+
+    @staticmethod
+    def _version(path: Path) -> tuple[int, int, int] | None:
+        """Return (inode, mtime, size) of path itself, or None if it is missing."""
+        try:
+            stat = path.lstat()
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _copy_entry(source: Path, target: Path) -> None:
+        """Recreate a file or symlink at target, hard linking where possible."""
+        if source.is_symlink():
+            target.symlink_to(source.readlink())
+            return
+
+        try:
+            os.link(source, target)
+        except OSError:
+            # Filesystem without hard links
+            shutil.copy2(source, target)
+
+    def _mirror(
+        self,
+        source: Path,
+        destination: Path,
+        versions: dict[Path, tuple[int, int, int]],
+        relative: Path = Path(),
+    ) -> None:
+        """Recreate source at destination and record each file's version."""
+        destination.mkdir(parents=True)
+        shutil.copymode(source, destination)
+
+        for entry in _list_directory(str(source)):
+            path = Path(entry.path)
+
+            if entry.is_dir(follow_symlinks=False):
+                self._mirror(
+                    path,
+                    destination / entry.name,
+                    versions,
+                    relative / entry.name,
+                )
+                continue
+
+            stat = entry.stat(follow_symlinks=False)
+            versions[relative / entry.name] = (
+                stat.st_ino,
+                stat.st_mtime_ns,
+                stat.st_size,
+            )
+            self._copy_entry(path, destination / entry.name)
+            self.files_linked += 1
+
+    def _stage_root(self, root: Path) -> None:
+        """Mirror a managed directory, discarding any leftover mirror."""
+        real, staged = self._roots[root]
+
+        if staged.exists():
+            shutil.rmtree(staged)
+
+        versions: dict[Path, tuple[int, int, int]] = {}
+
+        if real.is_dir():
+            self._mirror(real, staged, versions)
+        else:
+            staged.mkdir(parents=True)
+
+        self._mirrored[root] = versions
+        self._staged_roots.add(root)
+
+    def path(self, live_path: Path, *, write: bool = False) -> Path:
+        """Return where a path inside a managed directory should be accessed.
+
+        Parameters
+        ----------
+        live_path : Path
+            Path of an output file or directory
+        write : bool, optional
+            The caller is about to change the path; its managed directory is
+            mirrored first if this is its first change
+
+        Returns
+        -------
+        Path
+            The staged path if its managed directory has been mirrored,
+            otherwise live_path
+        """
+        root = next((r for r in self._roots if live_path.is_relative_to(r)), None)
+
+        if root is None:
+            return live_path
+
+        if write:
+            with self._lock:
+                if root not in self._staged_roots:
+                    self._stage_root(root)
+        elif root not in self._staged_roots:
+            return live_path
+
+        return self._roots[root][1] / live_path.relative_to(root)
+
+    def _carry_over(self, root: Path) -> None:
+        """Apply changes other programs made to a live directory to its mirror.
+
+        Files that were added, replaced or removed in the live directory since
+        it was mirrored are added, replaced or removed in the mirror too,
+        unless the sync changed the same file; the sync's version wins then.
+        """
+        real, staged = self._roots[root]
+        versions = self._mirrored[root]
+        seen: set[Path] = set()
+
+        for directory, dirnames, filenames in os.walk(real):
+            relative_dir = Path(directory).relative_to(real)
+            # Symlinked directories are entries, like files
+            names = filenames + [
+                name for name in dirnames if Path(directory, name).is_symlink()
+            ]
+
+            for name in names:
+                relative = relative_dir / name
+                seen.add(relative)
+                mirrored = versions.get(relative)
+                target = staged / relative
+
+                if self._version(real / relative) == mirrored:
+                    continue
+
+                if self._version(target) != mirrored:
+                    # Changed by the sync as well
+                    continue
+
+                if mirrored is not None:
+                    target.unlink()
+
+                target.parent.mkdir(parents=True, exist_ok=True)
+                self._copy_entry(real / relative, target)
+
+        for relative, mirrored in versions.items():
+            target = staged / relative
+
+            if relative not in seen and self._version(target) == mirrored:
+                target.unlink()
+
+    def commit(self) -> None:
+        """Carry over concurrent changes, flush the staged files and swap them in.
+
+        Raises
+        ------
+        OSError
+            If a mirror cannot be swapped in; the live directory is left as
+            it was. Directories swapped before it stay swapped.
+        """
+        staged_roots = sorted(self._staged_roots)
+        flushed: set[int] = set()
+
+        for root in staged_roots:
+            real, staged = self._roots[root]
+            # The sync may have removed a mirror that became empty
+            staged.mkdir(parents=True, exist_ok=True)
+
+            if real.is_dir():
+                self._carry_over(root)
+
+            device = staged.stat().st_dev
+
+            if device not in flushed:
+                _flush_filesystem(staged)
+                flushed.add(device)
+
+        for root in staged_roots:
+            real, staged = self._roots[root]
+
+            if not real.exists():
+                if not any(staged.iterdir()):
+                    staged.rmdir()
+                    continue
+
+                staged.rename(real)
+            else:
+                _exchange_paths(staged, real)
+                shutil.rmtree(staged)
+
+            _fsync_directory(real.parent)
+            self._staged_roots.discard(root)
+
+    def abort(self) -> None:
+        """Discard every staging mirror, leaving the live directories as-is."""
+        for root in self._staged_roots:
+            shutil.rmtree(self._roots[root][1], ignore_errors=True)
+
+        self._staged_roots.clear()
+        self._mirrored.clear()
+
+
+@dataclass
+class TraceSpan:
+    """A timed call of one instrumented sync phase.
+
+    Attributes
+    ----------
+    name : str
+        Phase (method) name
+    start : float
+        perf_counter() value when the call started
+    thread_id : int
+        Identifier of the thread that made the call
+    args : dict[str, Any]
+        Call details shown in trace viewers (such as the template path)
+    duration : float
+        Wall time in seconds
+    bytes_read : int
+        File content read directly by this call (not by nested spans)
+    bytes_written : int
+        File content written directly by this call (not by nested spans)
+    files : int
+        Files found, written, copied or removed directly by this call
+    """
+
+    name: str
+    start: float
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+    duration: float = 0.0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    files: int = 0
+
+
+class SyncTracer:
+    """Records spans of instrumented sync phases with I/O counters.
+
+    Spans nest per thread. I/O is attributed to the innermost open span, so
+    counters are exclusive while wall times are inclusive.
+    """
+
+    def __init__(self) -> None:
+        """Initialize SyncTracer."""
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.spans: list[TraceSpan] = []
+
+    def _stack(self) -> list[TraceSpan]:
+        """Return the current thread's stack of open spans."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[TraceSpan]:
+        """Time a block as a span called name."""
+        span = TraceSpan(
+            name=name,
+            start=time.perf_counter(),
+            thread_id=threading.get_ident(),
+            args=args,
+        )
+        stack = self._stack()
+        stack.append(span)
+
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.duration = time.perf_counter() - span.start
+
+            with self._lock:
+                self.spans.append(span)
+
+    def add(
+        self,
+        *,
+        bytes_read: int = 0,
+        bytes_written: int = 0,
+        files: int = 0,
+    ) -> None:
+        """Add I/O counters to the innermost open span of this thread."""
+        stack = self._stack()
+
+        if stack:
+            stack[-1].bytes_read += bytes_read
+            stack[-1].bytes_written += bytes_written
+            stack[-1].files += files
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Aggregate spans by phase name, in order of first appearance."""
+        totals: dict[str, dict[str, float]] = {}
+
+        for span in sorted(self.spans, key=lambda s: s.start):
+            total = totals.setdefault(
+                span.name,
+                {"calls": 0, "wall": 0.0, "read": 0, "written": 0, "files": 0},
+            )
+            total["calls"] += 1
+            total["wall"] += span.duration
+            total["read"] += span.bytes_read
+            total["written"] += span.bytes_written
+            total["files"] += span.files
+
+        return totals
+
+    def print_summary(self) -> None:
+        """Print a compact table of per-phase totals."""
+        print(
+            f"{'Phase':<30}{'Calls':>7}{'Wall (ms)':>12}"
+            f"{'Read (KB)':>12}{'Written (KB)':>14}{'Files':>8}",
+        )
+
+        for name, total in self.summary().items():
+            print(
+                f"{name:<30}{total['calls']:>7}{total['wall'] * 1000:>12.1f}"
+                f"{total['read'] / 1024:>12.1f}{total['written'] / 1024:>14.1f}"
+                f"{total['files']:>8}",
+            )
+
+    def write_chrome_trace(self, path: Path) -> None:
+        """Write spans as Chrome trace-event JSON (chrome://tracing, Perfetto).
+
+        Parameters
+        ----------
+        path : Path
+            Destination file
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": "sync",
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {
+                    **span.args,
+                    "bytes_read": span.bytes_read,
+                    "bytes_written": span.bytes_written,
+                    "files": span.files,
+                },
+            }
+            for span in sorted(self.spans, key=lambda s: s.start)
+        ]
+        path.write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}) + "\n",
+        )
+
+
+_P = ParamSpec("_P")
+_R = TypeVar("_R")
+
+
+def traced(
+    method: Callable[Concatenate["AgentSyncManager", _P], _R],
+) -> Callable[Concatenate["AgentSyncManager", _P], _R]:
+    """Record calls of an AgentSyncManager method as spans on its tracer.
+
+    The first Path argument, if any, is attached to the span.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self: "AgentSyncManager", *args: _P.args, **kwargs: _P.kwargs) -> _R:
+        if self.tracer is None:
+            return method(self, *args, **kwargs)
+
+        path = next((arg for arg in args if isinstance(arg, Path)), None)
+        span_args = {"path": str(path)} if path is not None else {}
+
+        with self.tracer.span(method.__name__, **span_args):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class AgentSyncManager:
+    """Manages the synchronization of agent and command templates.
+
+    The manager automatically resolves the templates directory from the config file
+    location, expecting templates to be in a 'templates/' subdirectory adjacent to
+    the config file.
+    """
+
+    def __init__(
+        self,
+        config_file: Path,
+        *,
+        prune_skills: bool = False,
+        tracer: SyncTracer | None = None,
+        staged: bool = False,
+    ) -> None:
+        """Initialize AgentSyncManager with config file.
+
+        Parameters
+        ----------
+        config_file : Path
+            Path to the YAML configuration file
+        prune_skills : bool, optional
+            Remove files from generated skill directories that no longer
+            exist in the skill template
+        tracer : SyncTracer | None, optional
+            Records timings and I/O of each sync phase when given
+        staged : bool, optional
+            Make syncs write to a staging copy of each managed output
+            directory and swap it in once the sync completes
+
+        Raises
+        ------
+        FileNotFoundError
+            If config file or templates directory doesn't exist
+        ValueError
+            If staged is set but directories cannot be swapped atomically
+        """
+        if staged and not StagedOutputTree.supported():
+            msg = "--staged needs renameat2(2), which this system does not provide"
+            raise ValueError(msg)
+
+        self._config = self._load_config(config_file)
+        self._config_file = config_file
+        self._backups = BackupStore.from_config(self._config)
+        # Kept for the life of the manager so watch-mode re-syncs reuse lookups
+        self._secrets = SecretResolver.from_config(self._config)
+        self._proxy = MCPProxySettings.from_config(self._config, config_file)
+        # Config version the proxy last looked servers up in
+        self._proxy_config_version = _file_version(config_file)
+        self._tool_manifests = ToolManifestCache(cache_dir() / "tool-manifests")
+        self._prewarm = PrewarmStore(cache_dir() / "prewarm")
+        self._generator = TemplateGenerator
+        self._prune_skills = prune_skills
+        self.tracer = tracer
+        self._staged = staged
+        # Active only while a sync runs in staged mode
+        self._staging: StagedOutputTree | None = None
+        self._templates_dir = self._resolve_templates_dir()
+        self._validate_templates_dir()
+        # Parsed templates (or the parse error) keyed by path, shared by all phases
+        self._parsed_templates: dict[Path, TemplateConfig | Exception] = {}
+        self._manifest: BuildManifest | None = None
+        self._unchanged_templates: dict[Path, dict[str, Any]] = {}
+        self._ignore_rules = IgnoreRules([])
+        # Encoded frontmatter keyed by the canonical form of its fields
+        self._frontmatter_cache: dict[object, bytes] = {}
+        self.stats = SyncStats()
+        self._stats_lock = threading.Lock()
+
+    def _resolve_templates_dir(self) -> Path:
+        """Resolve templates directory from config file location.
+
+        Returns
+        -------
+        Path
+            Path to templates directory (config_file.parent / "templates")
+        """
+        return self._config_file.parent / "templates"
+
+    def _validate_templates_dir(self) -> None:
+        """Validate that templates directory exists.
+
+        Raises
+        ------
+        FileNotFoundError
+            If templates directory doesn't exist
+        """
+        if not self._templates_dir.exists():
+            raise FileNotFoundError(
+                f"Templates directory not found at {self._templates_dir}\n"
+                f"Expected location: {self._config_file.parent}/templates\n"
+                f"Config file: {self._config_file}",
+            )
+
+    def _load_config(self, config_file: Path) -> dict[str, Any]:
+        """Load provider configuration from YAML file.
+
+        Parameters
+        ----------
+        config_file : Path
+            Path to YAML configuration file
+
+        Returns
+        -------
+        dict[str, Any]
+            Loaded configuration dictionary
+
+        Raises
+        ------
+        FileNotFoundError
+            If config file doesn't exist
+        """
+        if not config_file.exists():
+            raise FileNotFoundError(f"Config file not found: {config_file}")
+
+        with config_file.open() as f:
+            return yaml.load(f, Loader=SafeLoader)
+
+    def _record_io(
+        self,
+        *,
+        bytes_read: int = 0,
+        bytes_written: int = 0,
+        files: int = 0,
+    ) -> None:
+        """Attribute I/O to the current phase when tracing is enabled."""
+        if self.tracer is not None:
+            self.tracer.add(
+                bytes_read=bytes_read,
+                bytes_written=bytes_written,
+                files=files,
+            )
+
+    @property
+    def config_file(self) -> Path:
+        """Path to the YAML configuration file."""
+        return self._config_file
+
+    def lock(self) -> contextlib.AbstractContextManager[None]:
+        """Return the advisory lock that serializes syncs of this user's files."""
+        return sync_lock(cache_dir() / SYNC_LOCK_FILENAME)
+
+    @property
+    def backups(self) -> BackupStore:
+        """Store holding backups of the MCP config files this script updates."""
+        return self._backups
+
+    @property
+    def proxy_settings(self) -> MCPProxySettings:
+        """Settings of the MCP multiplexing proxy."""
+        return self._proxy
+
+    @property
+    def templates_dir(self) -> Path:
+        """Path to the templates directory."""
+        return self._templates_dir
+
+    def reload_config(self) -> None:
+        """Re-read the config file, keeping parsed templates warm."""
+        self._config = self._load_config(self._config_file)
+        self._backups = BackupStore.from_config(self._config)
+        self._secrets.ttl = SecretResolver.from_config(self._config).ttl
+        self._proxy = MCPProxySettings.from_config(self._config, self._config_file)
+
+    def parse_template(self, template_path: Path) -> TemplateConfig:
+        """Parse a template's frontmatter, reusing the result within this run.
+
+        Only the frontmatter is read; use FrontmatterParser.load_body() to get
+        the body of a template that is being rendered.
+
+        Parse errors are cached too, so a broken template is read only once and
+        reported by every phase that asks for it.
+
+        Parameters
+        ----------
+        template_path : Path
+            Path to template file
+
+        Returns
+        -------
+        TemplateConfig
+            Parsed template configuration object
+
+        Raises
+        ------
+        ValueError
+            If frontmatter is invalid (see FrontmatterParser.parse_file)
+        """
+        cached = self._parsed_templates.get(template_path)
+
+        if cached is None:
+            try:
+                cached = FrontmatterParser.parse_file(template_path, load_body=False)
+                self._record_io(bytes_read=cached.body_offset or 0)
+            except Exception as e:  # noqa: BLE001 - cached and re-raised below
+                cached = e
+
+            with self._stats_lock:
+                self._parsed_templates[template_path] = cached
+                self.stats.parse_count += 1
+                self.stats.parsed_files = len(self._parsed_templates)
+
+        if isinstance(cached, Exception):
+            raise cached
+
+        return cached
+
+    def _scan_entries(
+        self,
+        path: str,
+        rel_dir: str,
+    ) -> Iterator[tuple[os.DirEntry[str], str, bool]]:
+        """Yield (entry, relative path, is_dir) for entries not in .syncignore."""
+        for entry in _list_directory(path):
+            rel_path = f"{rel_dir}/{entry.name}"
+            is_dir = entry.is_dir(follow_symlinks=False)
+
+            if not self._ignore_rules.match(rel_path, is_dir=is_dir):
+                yield entry, rel_path, is_dir
+
+    def _discover_markdown(self, type_dir: str) -> list[Path]:
+        """Find markdown files anywhere below agents/ or commands/."""
+        found = []
+        pending = [(str(self._templates_dir / type_dir), type_dir)]
+
+        while pending:
+            path, rel_dir = pending.pop()
+
+            for entry, rel_path, is_dir in self._scan_entries(path, rel_dir):
+                if is_dir:
+                    pending.append((entry.path, rel_path))
+                elif entry.name.endswith(".md") and entry.is_file():
+                    found.append(Path(entry.path))
+
+        return found
+
+    def _discover_skills(self) -> list[Path]:
+        """Find skill templates without walking skill asset trees.
+
+        A directory is not descended into once it contains a SKILL.md, so
+        reference docs and scripts shipped with a skill are never visited.
+        Misplaced skill files (directly in skills/, nested deeper, or with the
+        wrong case) are still returned so validation can report them.
+        """
+        found = []
+        pending = [(str(self._templates_dir / "skills"), "skills", 0)]
+
+        while pending:
+            path, rel_dir, depth = pending.pop()
+            entries = list(self._scan_entries(path, rel_dir))
+            skill_files = [
+                entry
+                for entry, _, is_dir in entries
+                if not is_dir
+                and (
+                    entry.name.lower() == "skill.md"
+                    if depth
+                    else entry.name.endswith(".md")
+                )
+                and entry.is_file()
+            ]
+            found.extend(Path(entry.path) for entry in skill_files)
+
+            if depth and skill_files:
+                continue
+
+            pending.extend(
+                (entry.path, rel_path, depth + 1)
+                for entry, rel_path, is_dir in entries
+                if is_dir
+            )
+
+        return found
+
+    @traced
+    def discover_templates(self) -> list[Path]:
+        """Find all template markdown files.
+
+        Only the template layout is walked:
+        - Agents: templates/agents/*.md (flat files or subdirectories)
+        - Commands: templates/commands/*.md (flat files or subdirectories)
+        - Skills: templates/skills/*/SKILL.md (must be in subdirectories)
+
+        Paths matched by templates/.syncignore (gitignore syntax) are skipped,
+        and ignored directories are not walked.
+
+        Returns
+        -------
+        list[Path]
+            Deduplicated sorted list of template file paths
+        """
+        self._ignore_rules = IgnoreRules.from_file(
+            self._templates_dir / SYNCIGNORE_FILENAME,
+        )
+        templates = {
+            *self._discover_markdown("agents"),
+            *self._discover_markdown("commands"),
+            *self._discover_skills(),
+        }
+
+        self._record_io(files=len(templates))
+
+        return sorted(templates)
+
+    def get_output_path(
+        self,
+        *,
+        config: dict,
+        provider: str,
+        template_path: Path,
+        template_type: str,
+    ) -> Path:
+        """Calculate output path for a generated file.
+
+        Parameters
+        ----------
+        config :dict
+            Configuration dictionary
+        provider : str
+            Provider name
+        template_path : Path
+            Path to the template file
+        template_type : str
+            Type of template (agent, command, skill)
+
+        Returns
+        -------
+        Path
+            Output path for the generated file
+
+        Raises
+        ------
+        ValueError
+            If templates_dir is not configured, template type is unknown,
+            or provider doesn't support the template type
+        """
+        # Get provider configuration
+        provider_cfg = get_provider_config(provider)
+
+        # Get relative path from templates/{type}s/ directory
+        type_dir = self._templates_dir / (template_type + "s")
+        rel_path = template_path.relative_to(type_dir)
+
+        # Provider base paths from config
+        provider_config = config["providers"][provider]
+        templates_dir = provider_config.get("templates_dir")
+
+        if not templates_dir:
+            raise ValueError(f"No templates_dir configured for provider: {provider}")
+
+        provider_base = Path(templates_dir).expanduser()
+
+        # Get subdirectory based on template type
+        if template_type == "agent":
+            subdir = provider_cfg.agent_dir
+        elif template_type == "command":
+            subdir = provider_cfg.command_dir
+        elif template_type == "skill":
+            subdir = provider_cfg.skill_dir
+        else:
+            raise ValueError(f"Unknown template type: {template_type}")
+
+        if subdir is None:
+            raise ValueError(
+                f"Provider {provider} does not support template type {template_type}",
+            )
+
+        # Build full path: base / subdir / relative_path
+        base_dir = provider_base / subdir
+
+        # For skills, create nested directory structure
+        if template_type == "skill":
+            skill_name = rel_path.parts[0]
+            return base_dir / skill_name / "SKILL.md"
+
+        return base_dir / rel_path
+
+    def _managed_output_roots(self) -> list[Path]:
+        """Return every output directory templates are generated into."""
+        roots = []
+
+        for provider in get_template_providers():
+            provider_config = self._config["providers"].get(provider) or {}
+            templates_dir = provider_config.get("templates_dir")
+
+            if not templates_dir:
+                continue
+
+            provider_cfg = PROVIDERS[provider]
+            provider_base = Path(templates_dir).expanduser()
+            roots.extend(
+                provider_base / subdir
+                for subdir in (
+                    provider_cfg.agent_dir,
+                    provider_cfg.command_dir,
+                    provider_cfg.skill_dir,
+                )
+                if subdir is not None
+            )
+
+        return list(dict.fromkeys(roots))
+
+    def _output_path(self, path: Path, *, write: bool = False) -> Path:
+        """Return where an output path is accessed: its staged copy, if any.
+
+        Pass write=True before changing the path, so its directory is staged.
+        """
+        if self._staging is None:
+            return path
+
+        return self._staging.path(path, write=write)
+
+    @traced
+    def _commit_staged_outputs(self, staging: StagedOutputTree) -> None:
+        """Flush staged outputs and swap them into place."""
+        self._record_io(files=staging.files_linked)
+        staging.commit()
+
+    @contextlib.contextmanager
+    def _staged_outputs(self) -> Iterator[None]:
+        """Redirect output changes to staging directories when staging is on.
+
+        The staged directories replace the live ones when the block completes;
+        if it raises (including on Ctrl-C) they are discarded instead.
+        """
+        if not self._staged:
+            yield
+            return
+
+        self._staging = StagedOutputTree(self._managed_output_roots())
+
+        try:
+            yield
+            self._commit_staged_outputs(self._staging)
+        except BaseException:
+            self._staging.abort()
+            raise
+        finally:
+            self._staging = None
+
+    def _render_file(
+        self,
+        template: TemplateConfig,
+        provider: str,
+        body: bytes,
+    ) -> bytes:
+        """Render a provider's output file, reusing identical frontmatter.
+
+        Providers that only differ in their 'enabled' flag, and templates with
+        identical fields, share one yaml.dump.
+
+        Parameters
+        ----------
+        template : TemplateConfig
+            Template configuration object
+        provider : str
+            Provider name
+        body : bytes
+            Encoded template body
+
+        Returns
+        -------
+        bytes
+            Complete file content
+        """
+        config = self._generator.frontmatter_config(template, provider)
+        key = _canonical_key(config)
+
+        with self._stats_lock:
+            frontmatter = self._frontmatter_cache.get(key)
+
+            if frontmatter is None:
+                self.stats.frontmatter_misses += 1
+            else:
+                self.stats.frontmatter_hits += 1
+
+        if frontmatter is None:
+            frontmatter = self._generator.render_frontmatter(config).encode()
+
+            with self._stats_lock:
+                self._frontmatter_cache[key] = frontmatter
+
+        return self._generator.assemble_file_content(frontmatter, body)
+
+    def write_generated_file(
+        self,
+        output_path: Path,
+        content: str | bytes,
+    ) -> WriteResult:
+        """Write generated content to output file, unless it is already current.
+
+        The existing file's size is compared before its bytes, so most changed
+        files are detected from a single stat. Unchanged files are not touched,
+        which keeps their mtime stable for editors and file watchers.
+
+        Parameters
+        ----------
+        output_path : Path
+            Path to the output file
+        content : str | bytes
+            Content to write (str is encoded as UTF-8)
+
+        Returns
+        -------
+        WriteResult
+            "written" if the file was written, "unchanged" if it already held
+            the content, or "failed" on error
+        """
+        data = content.encode() if isinstance(content, str) else content
+        current = self._output_path(output_path)
+
+        try:
+            if current.stat().st_size == len(data):
+                self._record_io(bytes_read=len(data))
+
+                if current.read_bytes() == data:
+                    return "unchanged"
+        except OSError:
+            # Missing or unreadable; fall through and (re)write it
+            pass
+
+        target = self._output_path(output_path, write=True)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            if self._staging is not None:
+                # Staged files may be hard links to the live ones
+                target.unlink(missing_ok=True)
+
+            target.write_bytes(data)
+            self._record_io(bytes_written=len(data), files=1)
+            print(f"Generated: {output_path}")
+        except PermissionError as e:
+            print(f"Permission denied writing {output_path}: {e}", file=sys.stderr)
+            return "failed"
+        except OSError as e:
+            # Covers: disk full, I/O errors, IsADirectoryError, etc.
+            print(f"Error writing {output_path}: {e}", file=sys.stderr)
+            return "failed"
+        else:
+            return "written"
+
+    def _copy_skill_file(
+        self,
+        item: Path,
+        rel_path: Path,
+        dest_path: Path,
+        max_file_size: int,
+    ) -> WriteResult:
+        """Copy a single skill file to its destination if it differs.
+
+        Size and mtime are compared first; contents are only compared when the
+        sizes match but the mtimes differ. Identical files get their mtime
+        synced so the next check is stat-only, except when staging: a staged
+        file may be a hard link to the live one, which must not change before
+        the swap.
+
+        Returns "written" on copy, "unchanged" if the destination is current,
+        or "failed" on any error (with warning printed).
+        """
+        try:
+            source_stat = item.stat()
+            if source_stat.st_size > max_file_size:
+                print(
+                    f"Warning: Skipping large file "
+                    f"({source_stat.st_size / 1024 / 1024:.1f}MB): {rel_path}",
+                    file=sys.stderr,
+                )
+                # Return inside try: intentionally bypasses the else clause below.
+                return "failed"
+
+            if self._skill_file_is_current(
+                item,
+                source_stat,
+                self._output_path(dest_path),
+                sync_mtime=self._staging is None,
+            ):
+                return "unchanged"
+
+            dest_path = self._output_path(dest_path, write=True)
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+            if self._staging is not None:
+                # Staged files may be hard links to the live ones
+                dest_path.unlink(missing_ok=True)
+
+            shutil.copy2(item, dest_path)
+            self._record_io(
+                bytes_read=source_stat.st_size,
+                bytes_written=source_stat.st_size,
+                files=1,
+            )
+
+        except PermissionError as e:
+            print(
+                f"Warning: Permission denied copying {rel_path}: {e}",
+                file=sys.stderr,
+            )
+            return "failed"
+        except OSError as e:
+            print(
+                f"Warning: Failed to copy {rel_path}: {e}",
+                file=sys.stderr,
+            )
+            return "failed"
+        else:
+            return "written"
+
+    def _skill_file_is_current(
+        self,
+        item: Path,
+        source_stat: os.stat_result,
+        dest_path: Path,
+        *,
+        sync_mtime: bool = True,
+    ) -> bool:
+        """Check whether dest_path already mirrors item.
+
+        With sync_mtime, an identical file whose mtime differs gets the source
+        mtime so the next check is stat-only.
+        """
+        try:
+            dest_stat = dest_path.stat()
+        except OSError:
+            return False
+
+        if dest_stat.st_size != source_stat.st_size:
+            return False
+
+        if dest_stat.st_mtime_ns == source_stat.st_mtime_ns:
+            return True
+
+        self._record_io(bytes_read=2 * source_stat.st_size)
+
+        if not filecmp.cmp(item, dest_path, shallow=False):
+            return False
+
+        if sync_mtime:
+            shutil.copystat(item, dest_path)
+
+        return True
+
+    def _prune_skill_directory(
+        self,
+        output_dir: Path,
+        keep: set[Path],
+        skip_files_set: set[str],
+    ) -> int:
+        """Remove files from output_dir that are not in keep.
+
+        Files matching skip_files (such as the generated SKILL.md) are never
+        removed.
+
+        Returns the number of files removed.
+        """
+        removed_count = 0
+        current_dir = self._output_path(output_dir)
+
+        for item in sorted(current_dir.rglob("*"), reverse=True):
+            if item.name.upper() in skip_files_set or item.is_dir():
+                continue
+
+            rel_path = item.relative_to(current_dir)
+
+            if rel_path in keep:
+                continue
+
+            try:
+                target = self._output_path(output_dir / rel_path, write=True)
+                target.unlink()
+                print(f"  Removed stale file: {rel_path}")
+                removed_count += 1
+                self._record_io(files=1)
+            except OSError as e:
+                print(
+                    f"Warning: Failed to remove {rel_path}: {e}",
+                    file=sys.stderr,
+                )
+                continue
+
+            self._cleanup_empty_directories(
+                target.parent,
+                self._output_path(output_dir),
+            )
+
+        return removed_count
+
+    @traced
+    def copy_skill_directory(  # noqa: C901 — inherent traversal complexity: 2 guard clauses + walk loop with skip/symlink/is_file checks + 2 outer OSError handlers; per-file logic already extracted into _copy_skill_file
+        self,
+        skill_dir: Path,
+        output_dir: Path,
+        skip_files: list[str] | None = None,
+        *,
+        prune: bool | None = None,
+    ) -> SkillCopyResult:
+        """Mirror files from skill directory to output, excluding specified files.
+
+        Parameters
+        ----------
+        skill_dir : Path
+            Source skill directory
+        output_dir : Path
+            Destination directory
+        skip_files : Optional[list[str]], optional
+            list of filenames to skip (defaults to template files)
+        prune : bool | None, optional
+            Remove destination files that no longer exist in the source
+            (defaults to the manager's prune_skills setting)
+
+        Returns
+        -------
+        SkillCopyResult
+            Counts of files copied, failed, already current and removed
+
+        Notes
+        -----
+        - Symlinks are followed (not preserved as symlinks)
+        - Broken symlinks are skipped with warning
+        - Files are only copied when their size, mtime or content differs
+        - Paths excluded by .gitignore/.dockerignore files in the skill are
+          skipped, and ignored directories are not walked
+        - Empty directories are not created
+        - Files larger than 10MB are skipped with warning
+        """
+        if skip_files is None:
+            skip_files = SKILL_SKIP_FILES
+
+        if prune is None:
+            prune = self._prune_skills
+
+        # Convert to set for O(1) lookups and normalize case for macOS
+        skip_files_set = {name.upper() for name in skip_files}
+
+        if not skill_dir.exists():
+            print(f"Warning: Source directory not found: {skill_dir}", file=sys.stderr)
+            return SkillCopyResult(0, 0)
+
+        if not skill_dir.is_dir():
+            print(
+                f"Warning: Source path is not a directory: {skill_dir}",
+                file=sys.stderr,
+            )
+            return SkillCopyResult(0, 0)
+
+        counts = {"written": 0, "unchanged": 0, "failed": 0}
+        max_file_size = MAX_SKILL_FILE_SIZE
+        # Every source path, so pruning never removes a file that failed to copy
+        source_files: set[Path] = set()
+
+        try:
+            for item in _walk_skill_files(skill_dir):
+                if item.name.upper() in skip_files_set:
+                    continue
+
+                rel_path = item.relative_to(skill_dir)
+                source_files.add(rel_path)
+
+                # Skip broken symlinks
+                if item.is_symlink() and not item.exists():
+                    print(
+                        f"Warning: Skipping broken symlink: {rel_path}",
+                        file=sys.stderr,
+                    )
+                    counts["failed"] += 1
+                    continue
+
+                if not item.is_file():
+                    continue
+
+                dest_path = output_dir / rel_path
+                counts[
+                    self._copy_skill_file(item, rel_path, dest_path, max_file_size)
+                ] += 1
+
+        except PermissionError as e:
+            print(
+                f"Error: Permission denied traversing directory {skill_dir}: {e}",
+                file=sys.stderr,
+            )
+            return SkillCopyResult(counts["written"], counts["failed"] + 1)
+        except OSError as e:
+            print(
+                f"Error: Failed to traverse directory {skill_dir}: {e}",
+                file=sys.stderr,
+            )
+            return SkillCopyResult(counts["written"], counts["failed"] + 1)
+
+        removed_count = (
+            self._prune_skill_directory(output_dir, source_files, skip_files_set)
+            if prune and self._output_path(output_dir).is_dir()
+            else 0
+        )
+
+        return SkillCopyResult(
+            copied=counts["written"],
+            errors=counts["failed"],
+            unchanged=counts["unchanged"],
+            removed=removed_count,
+        )
+
+    def _deep_merge_mcp_servers(
+        self,
+        existing: dict[str, Any],
+        new: dict[str, Any],
+        mcp_key: str,
+    ) -> dict[str, Any]:
+        """Merge MCP server configurations, replacing the entire MCP servers section.
+
+        This method treats config.yml as the source of truth for MCP servers.
+        All servers in the JSON file are replaced with those from config.yml.
+        Other top-level keys in the JSON file are preserved.
+
+        Parameters
+        ----------
+        existing : dict[str, Any]
+            Existing configuration dictionary
+        new : dict[str, Any]
+            New configuration dictionary
+        mcp_key : str
+            Key for MCP servers ("mcpServers" or "mcp")
+
+        Returns
+        -------
+        dict[str, Any]
+            Merged configuration dictionary
+        """
+        result = existing.copy()
+
+        # Replace the entire MCP servers section with what's in config.yml
+        # This makes config.yml the source of truth for server configurations
+        if mcp_key in new:
+            result[mcp_key] = new[mcp_key]
+
+        # Add any other top-level keys from new config
+        for key, value in new.items():
+            if key != mcp_key:
+                result[key] = value
+
+        return result
+
+    def _create_backup(
+        self,
+        target_path: Path,
+        existing: bytes,
+        log: Callable[..., object] = print,
+    ) -> BackupSnapshot | None:
+        """Store the current content of target_path in the backup store.
+
+        Returns the snapshot on success, or None if the backup failed.
+        """
+        try:
+            snapshot = self._backups.save(target_path, existing)
+        except (OSError, ValueError) as e:
+            # Backup is optional - log warning but continue
+            log(f"Warning: Could not create backup: {e}", file=sys.stderr)
+            return None
+
+        self._record_io(bytes_written=snapshot.size, files=1)
+        log(f"Backed up {target_path} as snapshot {snapshot.id}")
+
+        return snapshot
+
+    def _write_json_atomic(
+        self,
+        target_path: Path,
+        data: dict[str, Any] | bytes,
+        *,
+        expected: tuple[int, int, int] | None,
+        private: bool = False,
+        log: Callable[..., object] = print,
+    ) -> bool:
+        """Write data as JSON to target_path via a temp file for atomicity.
+
+        data is serialized with indent=2, or written as-is if already encoded.
+        target_path is only replaced if its _file_version() is still expected
+        (None: the file must still be missing) once the temp file is written.
+        An existing file keeps its mode; a new one is created 0600 if private.
+
+        Returns True on success, False on I/O error.
+        Re-raises on JSON serialization errors (programming bugs).
+
+        Raises
+        ------
+        TargetChangedError
+            If target_path no longer matches expected
+        """
+        temp_path = target_path.with_suffix(target_path.suffix + ".tmp")
+
+        try:
+            content = (
+                data
+                if isinstance(data, bytes)
+                else (json.dumps(data, indent=2) + "\n").encode()
+            )
+            # Private from the start, so secrets are never readable by others
+            temp_path.unlink(missing_ok=True)
+            fd = os.open(
+                temp_path,
+                os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                0o600 if private else 0o666,
+            )
+
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+
+            # Keep e.g. 0600 on files that hold resolved secrets
+            with contextlib.suppress(FileNotFoundError):
+                shutil.copymode(target_path, temp_path)
+
+            if _file_version(target_path) != expected:
+                temp_path.unlink()
+                raise TargetChangedError(target_path)
+
+            temp_path.replace(target_path)
+            self._record_io(bytes_written=len(content), files=1)
+            log(f"Updated MCP config: {target_path}")
+        except (TypeError, ValueError) as e:
+            # JSON serialization errors indicate programming bugs
+            log(f"Error serializing config data: {e}", file=sys.stderr)
+            if temp_path.exists():
+                temp_path.unlink()
+            raise  # Re-raise to expose programming errors
+        except (OSError, PermissionError) as e:
+            log(f"Error writing {target_path}: {e}", file=sys.stderr)
+            if temp_path.exists():
+                temp_path.unlink()
+            return False
+        else:
+            return True
+
+    @traced
+    def merge_json_file(
+        self,
+        target_path: Path,
+        new_data: dict[str, Any],
+        mcp_key: str,
+        *,
+        private: bool = False,
+        log: Callable[..., object] = print,
+    ) -> tuple[bool, BackupSnapshot | None]:
+        """Merge new configuration data into existing JSON file.
+
+        Parameters
+        ----------
+        target_path : Path
+            Path to target JSON file
+        new_data : dict[str, Any]
+            New configuration data to merge
+        mcp_key : str
+            MCP configuration key format for this provider (e.g., "mcpServers", "mcp")
+        private : bool, optional
+            Create a missing file readable only by its owner, as new_data holds
+            resolved secrets
+        log : Callable[..., object], optional
+            Called like print() with each message (default: print)
+
+        Returns
+        -------
+        tuple[bool, BackupSnapshot | None]
+            Tuple of (success, snapshot)
+            - success: True if merge was successful, False otherwise
+            - snapshot: Backup of the previous content, or None if no backup was
+              created
+
+        Notes
+        -----
+        The MCP section is spliced into the existing bytes, leaving the rest of
+        the file untouched; the whole document is only parsed and re-dumped if
+        the splice is not possible (see _splice_mcp_section). If the merge
+        would not change the file's MCP servers section, the file is neither
+        backed up nor rewritten, and stats.mcp_files_unchanged is incremented.
+
+        Provider CLIs rewrite their config files while they run. If the file
+        changes between being read and being replaced, the merge is redone on
+        the new content, up to MCP_MERGE_ATTEMPTS times.
+        """
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+
+        for attempt in range(MCP_MERGE_ATTEMPTS):
+            try:
+                return self._merge_json_attempt(
+                    target_path,
+                    new_data,
+                    mcp_key,
+                    private=private,
+                    log=log,
+                )
+            except TargetChangedError:
+                log(f"{target_path} changed while merging, retrying")
+                time.sleep(MCP_MERGE_RETRY_DELAY * 2**attempt)
+
+        log(
+            f"Error: {target_path} kept changing; gave up after "
+            f"{MCP_MERGE_ATTEMPTS} attempts",
+            file=sys.stderr,
+        )
+
+        return (False, None)
+
+    def _merge_json_attempt(
+        self,
+        target_path: Path,
+        new_data: dict[str, Any],
+        mcp_key: str,
+        *,
+        private: bool = False,
+        log: Callable[..., object] = print,
+    ) -> tuple[bool, BackupSnapshot | None]:
+        """Read, merge and replace target_path once (see merge_json_file).
+
+        Raises
+        ------
+        TargetChangedError
+            If target_path changed after it was read
+        """
+        try:
+            with target_path.open("rb") as f:
+                stat = os.fstat(f.fileno())
+                existing = f.read()
+
+            version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._record_io(bytes_read=len(existing))
+        except FileNotFoundError:
+            existing = version = None
+
+        update: bytes | dict[str, Any] | None = (
+            self._splice_mcp_section(existing, new_data, mcp_key)
+            if existing is not None
+            else None
+        )
+
+        if update is None:
+            update = self._merge_json_document(
+                target_path,
+                existing,
+                new_data,
+                mcp_key,
+                log=log,
+            )
+
+        if update is existing:
+            with self._stats_lock:
+                self.stats.mcp_files_unchanged += 1
+
+            return (True, None)
+
+        snapshot = (
+            self._create_backup(target_path, existing, log=log)
+            if existing is not None
+            else None
+        )
+
+        if not self._write_json_atomic(
+            target_path,
+            update,
+            expected=version,
+            private=private,
+            log=log,
+        ):
+            return (False, None)
+
+        return (True, snapshot)
+
+    def _splice_mcp_section(
+        self,
+        existing: bytes,
+        new_data: dict[str, Any],
+        mcp_key: str,
+    ) -> bytes | None:
+        """Replace the MCP section of a JSON document without parsing the rest.
+
+        The byte span of the top-level mcp_key member is found with
+        scan_json_object and only the new value is serialized; everything
+        else is kept byte for byte. A missing section is appended as the last
+        member, where a full rewrite would put it.
+
+        Returns
+        -------
+        bytes | None
+            The updated document (existing itself if the section is already
+            current), or None if the document must be merged in full: it is
+            malformed or empty, holds another provider's MCP key that needs
+            migrating, or new_data has keys besides mcp_key
+        """
+        layout = scan_json_object(existing) if new_data.keys() == {mcp_key} else None
+        other_mcp_keys = {cfg.mcp_key for cfg in PROVIDERS.values()} - {mcp_key}
+
+        if (
+            layout is None
+            or not layout.members
+            or other_mcp_keys & layout.members.keys()
+        ):
+            return None
+
+        new_section = new_data[mcp_key]
+        span = layout.members.get(mcp_key)
+
+        if span is None:
+            last_key_start, _, last_value_end = list(layout.members.values())[-1]
+            indent = _member_indent(existing, last_key_start)
+            key = json.dumps(mcp_key).encode()
+            member = (
+                b"," + key + b":" if indent is None else b",\n" + indent + key + b": "
+            ) + _dump_json_member(new_section, indent)
+
+            return b"".join(
+                (existing[:last_value_end], member, existing[last_value_end:]),
+            )
+
+        key_start, value_start, value_end = span
+
+        try:
+            current = json.loads(existing[value_start:value_end])
+        except json.JSONDecodeError:
+            return None
+
+        if _same_json(current, new_section):
+            return existing
+
+        value = _dump_json_member(new_section, _member_indent(existing, key_start))
+
+        return b"".join((existing[:value_start], value, existing[value_end:]))
+
+    def _merge_json_document(
+        self,
+        target_path: Path,
+        existing: bytes | None,
+        new_data: dict[str, Any],
+        mcp_key: str,
+        log: Callable[..., object] = print,
+    ) -> bytes | dict[str, Any]:
+        """Parse a whole JSON document and merge the MCP section into it.
+
+        Returns
+        -------
+        bytes | dict[str, Any]
+            existing itself if the MCP section is already current, otherwise
+            the merged config to write
+        """
+        existing_text = None if existing is None else existing.decode()
+        existing_config = self._parse_json_config(
+            target_path,
+            existing_text,
+            log=log,
+        )
+        merged_config = self._merge_mcp_config(
+            target_path,
+            existing_config,
+            new_data,
+            mcp_key,
+            log=log,
+        )
+
+        if existing is not None and self._mcp_config_unchanged(
+            existing_text,
+            existing_config,
+            merged_config,
+            mcp_key,
+        ):
+            return existing
+
+        return merged_config
+
+    def _load_json_config(self, target_path: Path) -> tuple[str | None, dict[str, Any]]:
+        """Read a provider's JSON config file.
+
+        Returns
+        -------
+        tuple[str | None, dict[str, Any]]
+            Tuple of (file text or None if missing, parsed config or {} if the
+            file is missing or invalid)
+        """
+        if not target_path.exists():
+            return (None, {})
+
+        existing_text = target_path.read_text()
+        self._record_io(bytes_read=len(existing_text.encode()))
+
+        return (existing_text, self._parse_json_config(target_path, existing_text))
+
+    def _parse_json_config(
+        self,
+        target_path: Path,
+        existing_text: str | None,
+        log: Callable[..., object] = print,
+    ) -> dict[str, Any]:
+        """Parse a provider's JSON config, or return {} if missing or invalid."""
+        if existing_text is None:
+            return {}
+
+        try:
+            return json.loads(existing_text)
+        except json.JSONDecodeError as e:
+            log(f"Warning: Could not parse {target_path}: {e}", file=sys.stderr)
+            log(f"Creating new file at {target_path}", file=sys.stderr)
+
+            return {}
+
+    @staticmethod
+    def _mcp_config_unchanged(
+        existing_text: str | None,
+        existing_config: dict[str, Any],
+        merged_config: dict[str, Any],
+        mcp_key: str,
+    ) -> bool:
+        """Check whether writing merged_config would leave a file unchanged.
+
+        The comparison is semantic, so formatting and key order in the file do
+        not matter, but values in the MCP section must also match in type
+        (true is not 1). Other keys are untouched by the merge, so they are
+        the same objects on both sides and compare without being walked.
+        """
+        if existing_text is None or merged_config != existing_config:
+            return False
+
+        return _same_json(merged_config.get(mcp_key), existing_config.get(mcp_key))
+
+    def _merge_mcp_config(
+        self,
+        target_path: Path,
+        existing_config: dict[str, Any],
+        new_data: dict[str, Any],
+        mcp_key: str,
+        log: Callable[..., object] = print,
+    ) -> dict[str, Any]:
+        """Build the config a sync would write, without modifying existing_config.
+
+        Returns
+        -------
+        dict[str, Any]
+            Existing config with the MCP servers section replaced
+        """
+        existing_config = existing_config.copy()
+
+        # Get all possible MCP keys from provider configs
+        all_mcp_keys = {cfg.mcp_key for cfg in PROVIDERS.values()}
+        other_mcp_keys = all_mcp_keys - {mcp_key}
+
+        # Normalize existing config by migrating from any other MCP key format
+        for other_key in other_mcp_keys:
+            if other_key in existing_config:
+                if mcp_key in existing_config:
+                    # Both keys exist - warn and prefer provider's key
+                    log(
+                        f"Warning: {target_path} has both "
+                        f"'{mcp_key}' and '{other_key}'. "
+                        f"Using '{mcp_key}' and discarding '{other_key}'.",
+                        file=sys.stderr,
+                    )
+                # Migrate from other key format to provider's expected key format
+                existing_config[mcp_key] = existing_config.pop(other_key)
+
+        # Deep merge MCP servers to preserve existing servers
+        return self._deep_merge_mcp_servers(existing_config, new_data, mcp_key)
+
+    def _validate_skill_template(self, template_path: Path) -> None:
+        """Validate skill template requirements.
+
+        Skills must follow the pattern: templates/skills/<skill-name>/SKILL.md
+        where <skill-name> is exactly one directory level deep.
+
+        Parameters
+        ----------
+        template_path : Path
+            Path to skill template file
+
+        Raises
+        ------
+        ValueError
+            If skill validation fails
+        """
+        skills_dir = self._templates_dir / "skills"
+
+        # Check that skill is in a subdirectory of skills/
+        try:
+            rel_path = template_path.relative_to(skills_dir)
+        except ValueError as e:
+            raise ValueError(
+                f"Skill template must be in subdirectory of skills/: {template_path}",
+            ) from e
+
+        # Skills must be exactly one directory level deep (not flat, not nested deeper)
+        if len(rel_path.parts) != _SKILL_PATH_DEPTH:
+            if len(rel_path.parts) == 1:
+                raise ValueError(
+                    f"Skill template must be in a subdirectory of skills/ "
+                    f"(e.g., skills/my-skill/SKILL.md), "
+                    f"not directly in skills/: {template_path}",
+                )
+            raise ValueError(
+                f"Skill template must be exactly one directory deep "
+                f"(e.g., skills/my-skill/SKILL.md), "
+                f"not nested deeper: {template_path}",
+            )
+
+        # Filename must be exactly SKILL.md (case-sensitive)
+        if template_path.name != "SKILL.md":
+            raise ValueError(
+                f"Skill template filename must be exactly 'SKILL.md' (case-sensitive), "
+                f"found '{template_path.name}'. Please rename: {template_path}",
+            )
+
+    def validate_template(
+        self,
+        template: TemplateConfig,
+        template_path: Path,
+    ) -> list[str]:
+        """Validate template configuration and return warnings.
+
+        Parameters
+        ----------
+        template : TemplateConfig
+            Parsed template configuration
+        template_path : Path
+            Path to template file
+
+        Returns
+        -------
+        list[str]
+            list of warning messages
+
+        Raises
+        ------
+        ValueError
+            If skill validation fails
+        """
+        # Validate skills have correct structure
+        if template.type == "skill":
+            self._validate_skill_template(template_path)
+
+        warnings = []
+        enabled_providers = [
+            p
+            for p, cfg in template.provider_metadata.items()
+            if cfg.get("enabled", False)
+        ]
+
+        if not enabled_providers:
+            warnings.append(
+                f"{template_path.name}: No providers enabled. "
+                f"This template will not generate any files.",
+            )
+
+        return warnings
+
+    def _prune_backups(self) -> None:
+        """Apply the backup retention policy after an MCP sync."""
+        try:
+            evicted = self._backups.prune()
+        except (OSError, ValueError) as e:
+            # Log error but don't fail the sync
+            print(f"Warning: Could not prune backups: {e}", file=sys.stderr)
+            return
+
+        if evicted:
+            print(f"Evicted {evicted} old backup snapshot(s)")
+
+    def load_mcp_servers(self, *, prewarmed: bool = True) -> list[MCPServerConfig]:
+        """Load MCP servers from the config loaded during initialization.
+
+        Parameters
+        ----------
+        prewarmed : bool, optional
+            Start prewarmed servers with their installed executable instead of
+            their uvx or npx command line
+
+        Returns
+        -------
+        list[MCPServerConfig]
+            list of MCP server configuration objects
+        """
+        servers_dict = self._config.get("mcp_servers", {})
+        servers = []
+
+        for name, server_data in servers_dict.items():
+            # Extract values and providers from server config
+            values = server_data.get("values", {})
+            providers = server_data.get("providers", {})
+
+            # Validation warnings
+            if "name" in values:
+                print(
+                    f"Warning: MCP server '{name}' has 'name' in values. "
+                    f"Server name should be the config key, not in values.",
+                    file=sys.stderr,
+                )
+
+            # Warn if command is empty for local servers (best effort check)
+            if not values.get("command") and values.get("type", "local") == "local":
+                print(
+                    f"Warning: MCP server '{name}' has empty 'command' "
+                    f"for local server",
+                    file=sys.stderr,
+                )
+
+            # Default args to empty list if missing or explicitly null in YAML
+            if not values.get("args"):
+                values["args"] = []
+
+            servers.append(
+                MCPServerConfig(
+                    name=name,
+                    values=values,
+                    providers=providers,
+                    proxy=bool(server_data.get("proxy", True)),
+                ),
+            )
+
+        return self._apply_prewarmed(servers) if prewarmed else servers
+
+    def _apply_prewarmed(
+        self,
+        servers: list[MCPServerConfig],
+    ) -> list[MCPServerConfig]:
+        """Point prewarmed servers at their installed executable.
+
+        An environment only applies while the server's command line matches
+        the one it was installed from; stale ones are reported and skipped.
+        """
+        try:
+            entries = self._prewarm.entries()
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read prewarmed servers: {e}", file=sys.stderr)
+            return servers
+
+        result = []
+
+        for server in servers:
+            entry = entries.get(server.name)
+
+            if entry is None or not server.values.get("command"):
+                result.append(server)
+            elif entry.source != mcp_server_argv(server.values):
+                print(
+                    f"Warning: MCP server '{server.name}' changed since it was "
+                    f"prewarmed; run: prewarm {server.name}",
+                    file=sys.stderr,
+                )
+                result.append(server)
+            elif not Path(entry.executable).exists():
+                print(
+                    f"Warning: Prewarmed executable of MCP server '{server.name}' "
+                    f"is missing; run: prewarm --refresh {server.name}",
+                    file=sys.stderr,
+                )
+                result.append(server)
+            else:
+                values = {
+                    **server.values,
+                    "command": entry.executable,
+                    "args": list(entry.args),
+                }
+                result.append(replace(server, values=values))
+
+        return result
+
+    @traced
+    def sync_mcp_servers(self) -> int:
+        """Synchronize MCP server configurations to provider files.
+
+        Returns
+        -------
+        int
+            Number of successfully updated files
+
+        Raises
+        ------
+        ValueError
+            If validation of provider configurations fails
+        """
+        servers = self.load_mcp_servers()
+
+        if not servers:
+            print("No MCP servers configured")
+
+            return 0
+
+        snapshots: list[BackupSnapshot] = []
+        failed: list[str] = []
+        success_count = 0
+        unchanged_before = self.stats.mcp_files_unchanged
+
+        for target, (success, snapshot) in self._merge_mcp_targets(
+            self._get_mcp_targets(servers),
+        ):
+            if success:
+                success_count += 1
+
+                if snapshot:
+                    snapshots.append(snapshot)
+            else:
+                failed.append(target.provider)
+
+        if failed:
+            print(f"Sync failed for {', '.join(failed)}")
+
+            for saved in snapshots:
+                print(f"  Roll back {saved.path} with: restore {saved.id}")
+
+        self._prune_backups()
+
+        # Files that were already current count as unchanged, not updated
+        return success_count - (self.stats.mcp_files_unchanged - unchanged_before)
+
+    def probe_mcp_servers(
+        self,
+        names: list[str] | None = None,
+        *,
+        timeout: float = PROBE_TIMEOUT,
+        jobs: int | None = None,
+    ) -> list[ProbeResult]:
+        """Start enabled local MCP servers concurrently and time their startup.
+
+        Parameters
+        ----------
+        names : list[str] | None, optional
+            Servers to probe (default: every local server enabled for at
+            least one provider)
+        timeout : float, optional
+            Seconds to wait for each server's initialize response
+        jobs : int | None, optional
+            Servers to start at a time (default: all at once). Servers
+            started together compete for CPU, which inflates their timings
+            on machines with few cores.
+
+        Returns
+        -------
+        list[ProbeResult]
+            One result per server, in config order
+
+        Raises
+        ------
+        ValueError
+            If a named server does not exist or is not a local server, or a
+            placeholder cannot be resolved
+        """
+        selected = self._secrets.resolve_servers(
+            self._select_mcp_servers(names, local=True),
+        )
+
+        with ThreadPoolExecutor(max_workers=jobs or max(1, len(selected))) as pool:
+            return list(
+                pool.map(
+                    lambda server: probe_mcp_server(server, timeout=timeout),
+                    selected,
+                ),
+            )
+
+    def _select_mcp_servers(
+        self,
+        names: list[str] | None,
+        *,
+        local: bool,
+        prewarmed: bool = True,
+    ) -> list[MCPServerConfig]:
+        """Return the named servers, or every server enabled for a provider.
+
+        Parameters
+        ----------
+        names : list[str] | None
+            Servers to select, in the order given
+        local : bool
+            Only select local (stdio) servers
+        prewarmed : bool, optional
+            Start prewarmed servers with their installed executable
+
+        Raises
+        ------
+        ValueError
+            If a named server does not exist, or with local, is not local
+        """
+        servers = {
+            server.name: server for server in self.load_mcp_servers(prewarmed=prewarmed)
+        }
+
+        if names:
+            unknown = [
+                name
+                for name in names
+                if name not in servers
+                or (local and not is_local_mcp_server(servers[name]))
+            ]
+
+            if unknown:
+                kind = "Not local MCP servers" if local else "Unknown MCP servers"
+                raise ValueError(f"{kind}: {', '.join(unknown)}")
+
+            return [servers[name] for name in names]
+
+        return [
+            server
+            for server in servers.values()
+            if (not local or is_local_mcp_server(server))
+            and any(cfg.get("enabled", False) for cfg in server.providers.values())
+        ]
+
+    def measure_tool_costs(
+        self,
+        names: list[str] | None = None,
+        *,
+        refresh: bool = False,
+        timeout: float = PROBE_TIMEOUT,
+        jobs: int | None = None,
+    ) -> list[ToolCost]:
+        """Estimate the context tokens each MCP server's tools add to a session.
+
+        Manifests are read from the tool manifest cache. Local servers that
+        miss it are started concurrently, queried with tools/list and cached.
+        Servers with the same command line are queried once.
+
+        Parameters
+        ----------
+        names : list[str] | None, optional
+            Servers to measure (default: every server enabled for at least one
+            provider)
+        refresh : bool, optional
+            Query every local server, ignoring cached manifests
+        timeout : float, optional
+            Seconds to wait for each server's tool manifest
+        jobs : int | None, optional
+            Servers to start at a time (default: all at once)
+
+        Returns
+        -------
+        list[ToolCost]
+            One result per server, in config order, with the providers whose
+            generated MCP config includes it
+
+        Raises
+        ------
+        ValueError
+            If a named server does not exist, or a placeholder cannot be
+            resolved
+        """
+        selected = self._select_mcp_servers(names, local=False)
+        providers_config = self._config.get("providers", {})
+        sections = {
+            name: generator_func(selected)
+            for name, generator_func in MCP_GENERATORS.items()
+            if "mcp_config" in (providers_config.get(name) or {})
+        }
+        keys = {
+            server.name: ToolManifestCache.key(server)
+            for server in selected
+            if is_local_mcp_server(server)
+        }
+        manifests: dict[str, ToolManifest | str] = {}
+
+        if not refresh:
+            for key in set(keys.values()):
+                try:
+                    manifest = self._tool_manifests.get(key)
+                except (OSError, ValueError, TypeError) as e:
+                    print(
+                        f"Warning: Ignoring cached tool manifest: {e}",
+                        file=sys.stderr,
+                    )
+                    manifest = None
+
+                if manifest is not None:
+                    manifests[key] = manifest
+
+        cached = set(manifests)
+        # One server per uncached key; its placeholders are resolved to start it
+        pending = {
+            key: server
+            for server in selected
+            if (key := keys.get(server.name)) is not None and key not in cached
+        }
+        fetched = self._fetch_tool_manifests(
+            dict(
+                zip(
+                    pending,
+                    self._secrets.resolve_servers(list(pending.values())),
+                    strict=True,
+                ),
+            ),
+            timeout=timeout,
+            jobs=jobs,
+        )
+        manifests.update(fetched)
+        costs = []
+
+        for server in selected:
+            providers = [
+                name
+                for name in sections
+                if server.name in sections[name][PROVIDERS[name].mcp_key]
+            ]
+            key = keys.get(server.name)
+            manifest = manifests.get(key) if key is not None else None
+
+            if isinstance(manifest, ToolManifest):
+                costs.append(
+                    ToolCost(
+                        name=server.name,
+                        providers=providers,
+                        tools=len(manifest.tools),
+                        tokens=manifest.estimate_tokens(),
+                        cached=key in cached,
+                    ),
+                )
+            else:
+                costs.append(ToolCost(server.name, providers, error=manifest))
+
+        return costs
+
+    def _fetch_tool_manifests(
+        self,
+        servers: dict[str, MCPServerConfig],
+        *,
+        timeout: float,
+        jobs: int | None,
+    ) -> dict[str, ToolManifest | str]:
+        """Query servers for their tool manifests and cache the results.
+
+        Parameters
+        ----------
+        servers : dict[str, MCPServerConfig]
+            Servers with resolved placeholders, keyed by cache key
+        timeout : float
+            Seconds to wait for each server's tool manifest
+        jobs : int | None
+            Servers to start at a time (default: all at once)
+
+        Returns
+        -------
+        dict[str, ToolManifest | str]
+            Each key's manifest, or the error that prevented fetching it
+        """
+
+        def fetch(server: MCPServerConfig) -> ToolManifest | str:
+            try:
+                return fetch_tool_manifest(server, timeout=timeout)
+            except (OSError, MCPServerError) as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=jobs or max(1, len(servers))) as pool:
+            results = dict(zip(servers, pool.map(fetch, servers.values()), strict=True))
+
+        for key, manifest in results.items():
+            if not isinstance(manifest, ToolManifest):
+                continue
+
+            try:
+                self._tool_manifests.put(key, manifest)
+            except OSError as e:
+                print(f"Warning: Could not cache tool manifest: {e}", file=sys.stderr)
+
+        return results
+
+    def prewarm_mcp_servers(
+        self,
+        names: list[str] | None = None,
+        *,
+        refresh: bool = False,
+        offline: bool = False,
+    ) -> list[PrewarmResult]:
+        """Install the packages of uvx and npx servers into pinned environments.
+
+        Servers then start their installed executable directly, instead of
+        having the launcher resolve and install the package on every start.
+        Environments are only reinstalled when the server's command line
+        changed, and without names, environments of servers that are gone
+        from config.yml are deleted.
+
+        Parameters
+        ----------
+        names : list[str] | None, optional
+            Servers to prewarm (default: every server enabled for at least one
+            provider that is started through uvx or npx)
+        refresh : bool, optional
+            Reinstall environments that are current, picking up new releases
+        offline : bool, optional
+            Install from the launchers' local caches only
+
+        Returns
+        -------
+        list[PrewarmResult]
+            One result per server, in config order
+
+        Raises
+        ------
+        ValueError
+            If a named server does not exist or is not a local server, or the
+            prewarm index cannot be read
+        """
+        selected = self._select_mcp_servers(names, local=True, prewarmed=False)
+        entries = self._prewarm.entries()
+        results = []
+        # Servers that no longer need their environment, if they had one
+        unlaunched = set()
+
+        for server in selected:
+            source = mcp_server_argv(server.values)
+            entry = entries.get(server.name)
+
+            try:
+                command = parse_launcher_command(
+                    self._secrets.resolve_servers([server])[0].values,
+                )
+            except (PrewarmError, ValueError) as e:
+                results.append(PrewarmResult(server.name, error=str(e)))
+                continue
+
+            if command is None:
+                unlaunched.add(server.name)
+
+                # Only servers asked for by name are worth reporting
+                if names:
+                    results.append(
+                        PrewarmResult(
+                            server.name,
+                            error="not started through uvx or npx",
+                        ),
+                    )
+
+                continue
+
+            if (
+                not refresh
+                and entry is not None
+                and entry.source == source
+                and Path(entry.executable).exists()
+            ):
+                results.append(PrewarmResult(server.name, entry))
+                continue
+
+            print(f"Installing {server.name} ({shlex.join(source)})")
+
+            try:
+                entry = self._prewarm.install(
+                    server.name,
+                    source,
+                    # Placeholders are recorded unresolved, like in config.yml
+                    command._replace(args=source[len(source) - len(command.args) :]),
+                    offline=offline,
+                )
+            except (PrewarmError, OSError) as e:
+                results.append(PrewarmResult(server.name, error=str(e)))
+            else:
+                results.append(PrewarmResult(server.name, entry, installed=True))
+
+        if not names:
+            configured = {server.name for server in selected}
+            removed = self._prewarm.remove(
+                name for name in entries if name not in configured or name in unlaunched
+            )
+
+            for name in removed:
+                print(f"Removed prewarmed environment of {name}")
+
+        return results
+
+    def _merge_mcp_targets(
+        self,
+        targets: list[MCPTarget],
+    ) -> list[tuple[MCPTarget, tuple[bool, BackupSnapshot | None]]]:
+        """Merge every target, with one worker thread per config file.
+
+        Targets sharing a file are merged one after another. Each worker
+        returns its messages, which are printed in target order, so the log
+        matches a serial run.
+
+        Returns
+        -------
+        list[tuple[MCPTarget, tuple[bool, BackupSnapshot | None]]]
+            Each target with the result of merge_json_file
+        """
+        by_path: dict[Path, list[MCPTarget]] = {}
+
+        for target in targets:
+            by_path.setdefault(target.path, []).append(target)
+
+        def merge_group(
+            group: list[MCPTarget],
+        ) -> tuple[list[tuple[bool, Any]], list[tuple[str, bool]]]:
+            # Messages are returned with the results, as (text, is_error)
+            messages: list[tuple[str, bool]] = []
+
+            def log(text: str, *, file: TextIO | None = None) -> None:
+                messages.append((text, file is sys.stderr))
+
+            merged = [
+                self.merge_json_file(
+                    target.path,
+                    target.data,
+                    target.mcp_key,
+                    private=target.private,
+                    log=log,
+                )
+                for target in group
+            ]
+
+            return merged, messages
+
+        results = []
+
+        with ThreadPoolExecutor(max_workers=max(1, len(by_path))) as pool:
+            futures = [pool.submit(merge_group, group) for group in by_path.values()]
+
+            for group, future in zip(by_path.values(), futures, strict=True):
+                merged, messages = future.result()
+
+                for text, is_error in messages:
+                    print(text, file=sys.stderr if is_error else sys.stdout)
+
+                results.extend(zip(group, merged, strict=True))
+
+        return results
+
+    def _get_mcp_targets(
+        self,
+        servers: list[MCPServerConfig],
+        *,
+        resolve: bool = True,
+    ) -> list[MCPTarget]:
+        """Validate provider configs and generate each provider's MCP section.
+
+        Parameters
+        ----------
+        servers : list[MCPServerConfig]
+            MCP servers from the config
+        resolve : bool, optional
+            Resolve secret placeholders; without, they are left in the sections
+
+        Returns
+        -------
+        list[MCPTarget]
+            One target per provider whose MCP config this script manages
+
+        Raises
+        ------
+        ValueError
+            If validation of provider configurations fails
+        """
+        providers_config = self._config.get("providers", {})
+
+        # Collect the providers any server references (regardless of enabled
+        # state) and those enabled for at least one server. Referenced is used
+        # to distinguish:
+        #   - No servers reference provider → skip to preserve any
+        #     manually-added servers
+        #   - Servers reference provider but all disabled → sync empty dict to
+        #     remove them
+        referenced: set[str] = set()
+        enabled_providers: set[str] = set()
+
+        for server in servers:
+            for provider_name, cfg in server.providers.items():
+                referenced.add(provider_name)
+
+                if cfg.get("enabled", False):
+                    enabled_providers.add(provider_name)
+
+        # Validate that all enabled providers exist and have mcp_config paths
+        validation_errors = []
+
+        for provider_name in sorted(enabled_providers):
+            if provider_name not in providers_config:
+                validation_errors.append(
+                    f"Provider '{provider_name}' is not defined in config.yml. "
+                    f"Add '{provider_name}:' to the 'providers:' section in config.yml",
+                )
+            else:
+                mcp_config = providers_config[provider_name].get("mcp_config")
+
+                if not (isinstance(mcp_config, str) and mcp_config.strip()):
+                    validation_errors.append(
+                        f"Provider '{provider_name}' has no valid "
+                        f"'mcp_config' path configured. "
+                        f"Add 'mcp_config: <path>' to "
+                        f"providers.{provider_name} in config.yml "
+                        f"(current value: {mcp_config!r})",
+                    )
+
+        if validation_errors:
+            raise ValueError(
+                "MCP server configuration validation failed:\n\n"
+                + "\n\n".join(f"  • {error}" for error in validation_errors),
+            )
+
+        provider_names = [
+            provider_name
+            for provider_name in MCP_GENERATORS
+            if "mcp_config" in (providers_config.get(provider_name) or {})
+            and provider_name in referenced
+        ]
+        # Only servers that end up in a target need their placeholders
+        # resolved; proxied servers are resolved by the proxy when it starts them
+        servers = [
+            server
+            for server in servers
+            if any(
+                server.providers.get(name, {}).get("enabled", False)
+                for name in provider_names
+            )
+        ]
+        proxied = {server.name for server in servers if self._is_proxied(server)}
+        private = {
+            provider_name
+            for server in servers
+            if resolve
+            and server.name not in proxied
+            and SecretResolver.contains_placeholders([server.values, server.providers])
+            for provider_name, cfg in server.providers.items()
+            if cfg.get("enabled", False)
+        }
+        unproxied = [server for server in servers if server.name not in proxied]
+        resolved = iter(
+            self._secrets.resolve_servers(unproxied) if resolve else unproxied,
+        )
+        servers = [
+            self._proxy_client_config(server)
+            if server.name in proxied
+            else next(resolved)
+            for server in servers
+        ]
+        return [
+            MCPTarget(
+                provider=provider_name,
+                path=Path(providers_config[provider_name]["mcp_config"]).expanduser(),
+                data=MCP_GENERATORS[provider_name](servers),
+                mcp_key=get_provider_config(provider_name).mcp_key,
+                private=provider_name in private,
+            )
+            for provider_name in provider_names
+        ]
+
+    def _is_proxied(self, server: MCPServerConfig) -> bool:
+        """Check whether provider configs start a server through the MCP proxy.
+
+        Local servers are proxied when the proxy is enabled, unless they opt
+        out with proxy: false or a provider's extra overrides how they are
+        started, which the shared process could not honor.
+        """
+        return (
+            self._proxy.enabled
+            and server.proxy
+            and is_local_mcp_server(server)
+            and not any(
+                key in (cfg.get("extra") or {})
+                for cfg in server.providers.values()
+                for key in PROXY_SPAWN_KEYS
+            )
+        )
+
+    def _proxy_client_config(self, server: MCPServerConfig) -> MCPServerConfig:
+        """Replace how a server is started with the MCP proxy client.
+
+        The client connects to the proxy socket, starting the proxy with this
+        script if it is not running.
+        """
+        script = Path(__file__).resolve()
+        client = {
+            "command": sys.executable,
+            "args": [
+                str(PROXY_CLIENT),
+                str(self._proxy.socket),
+                server.name,
+                sys.executable,
+                str(script),
+                "--config",
+                str(self._config_file.resolve()),
+                "proxy",
+                "serve",
+            ],
+        }
+
+        return replace(
+            server,
+            values=client
+            | {
+                key: value
+                for key, value in server.values.items()
+                if key not in PROXY_SPAWN_KEYS
+            },
+        )
+
+    def proxied_server(self, name: str) -> MCPServerConfig:
+        """Return the server the MCP proxy should start for a name.
+
+        config.yml is re-read first if it changed, so a running proxy follows
+        edits without a restart.
+
+        Parameters
+        ----------
+        name : str
+            Server name in config.yml
+
+        Returns
+        -------
+        MCPServerConfig
+            The server, with placeholders resolved
+
+        Raises
+        ------
+        ValueError
+            If config.yml is invalid, the server is not a local server, or a
+            placeholder cannot be resolved
+        """
+        version = _file_version(self._config_file)
+
+        if version != self._proxy_config_version:
+            try:
+                self.reload_config()
+            except (OSError, yaml.YAMLError) as e:
+                raise ValueError(f"Could not reload {self._config_file}: {e}") from e
+
+            self._proxy_config_version = version
+
+        servers = {server.name: server for server in self.load_mcp_servers()}
+        server = servers.get(name)
+
+        if server is None or not is_local_mcp_server(server):
+            raise ValueError(f"Not a local MCP server: {name}")
+
+        return self._secrets.resolve_servers([server])[0]
+
+    def _check_output(
+        self,
+        output_path: Path,
+        data: bytes,
+        *,
+        diff: bool = False,
+    ) -> PendingChange | None:
+        """Compare rendered content with a generated file, without writing.
+
+        The sizes are compared first; the file is only read when they match,
+        or with diff, to show its current text.
+
+        Returns
+        -------
+        PendingChange | None
+            The change a sync would make (with the old and new text only with
+            diff), or None if the file is current
+        """
+        try:
+            size = output_path.stat().st_size
+        except OSError:
+            return PendingChange(
+                "create",
+                output_path,
+                None,
+                data.decode() if diff else None,
+            )
+
+        if size != len(data) and not diff:
+            return PendingChange("update", output_path)
+
+        existing = output_path.read_bytes()
+        self._record_io(bytes_read=len(existing))
+
+        if existing == data:
+            return None
+
+        if not diff:
+            return PendingChange("update", output_path)
+
+        return PendingChange(
+            "update",
+            output_path,
+            existing.decode(errors="replace"),
+            data.decode(),
+        )
+
+    def _check_skill_directory(
+        self,
+        skill_dir: Path,
+        output_dir: Path,
+    ) -> list[PendingChange]:
+        """List the supporting files copy_skill_directory would copy or prune.
+
+        Returns
+        -------
+        list[PendingChange]
+            Changes to supporting files (without text, as they may be binary)
+        """
+        skip_files_set = {name.upper() for name in SKILL_SKIP_FILES}
+        source_files: set[Path] = set()
+        changes = []
+
+        for item in sorted(_walk_skill_files(skill_dir)):
+            if item.name.upper() in skip_files_set:
+                continue
+
+            rel_path = item.relative_to(skill_dir)
+            source_files.add(rel_path)
+
+            if not item.is_file():
+                continue
+
+            source_stat = item.stat()
+            dest_path = output_dir / rel_path
+
+            if source_stat.st_size > MAX_SKILL_FILE_SIZE:
+                continue
+
+            if not self._skill_file_is_current(
+                item,
+                source_stat,
+                dest_path,
+                sync_mtime=False,
+            ):
+                action = "update" if dest_path.exists() else "create"
+                changes.append(PendingChange(action, dest_path))
+
+        if self._prune_skills and output_dir.is_dir():
+            changes.extend(
+                PendingChange("remove", item)
+                for item in sorted(output_dir.rglob("*"))
+                if item.is_file()
+                and item.name.upper() not in skip_files_set
+                and item.relative_to(output_dir) not in source_files
+            )
+
+        return changes
+
+    def _check_template(
+        self,
+        template_path: Path,
+        *,
+        diff: bool = False,
+    ) -> list[PendingChange]:
+        """Render a template in memory and compare it with its outputs."""
+        template = self.parse_template(template_path)
+        self.validate_template(template, template_path)
+        template = FrontmatterParser.load_body(template_path, template)
+        body = template.body.encode()
+        outputs = self._get_template_outputs(template_path, template)
+        changes = []
+
+        for provider, output_path in outputs["enabled"].items():
+            content = self._render_file(template, provider, body)
+            change = self._check_output(output_path, content, diff=diff)
+
+            if change is not None:
+                changes.append(change)
+
+            if template.type == "skill":
+                changes.extend(
+                    self._check_skill_directory(
+                        template_path.parent,
+                        output_path.parent,
+                    ),
+                )
+
+        return changes
+
+    def check_templates(self, *, diff: bool = False) -> list[PendingChange]:
+        """Report what sync_all would change, without writing anything.
+
+        Templates the build manifest shows as unchanged, with outputs whose
+        size and mtime are still those they were written with, are trusted
+        from their stat fingerprints; everything else is rendered in memory
+        and compared with the existing outputs. Templates that fail to parse
+        are counted in stats.template_errors.
+
+        Parameters
+        ----------
+        diff : bool, optional
+            Include the old and new text of changed files
+
+        Returns
+        -------
+        list[PendingChange]
+            Changes to generated template files, in template order
+        """
+        templates = self.discover_templates()
+        self._manifest = BuildManifest.load(
+            self._config_file.with_name(MANIFEST_FILENAME),
+            self._config_hash(),
+        )
+        self._unchanged_templates = self._find_unchanged_templates(templates)
+        mappings = self._get_template_mappings(templates)
+        changes = []
+
+        for template_path in templates:
+            if (
+                template_path.name == "README.md"
+                or template_path in self._unchanged_templates
+            ):
+                continue
+
+            try:
+                changes.extend(self._check_template(template_path, diff=diff))
+            except Exception as e:  # noqa: BLE001 - report every broken template
+                print(f"Error processing {template_path}: {e}", file=sys.stderr)
+                self.stats.template_errors += 1
+
+        for provider in get_template_providers():
+            changes.extend(
+                PendingChange("remove", path)
+                for path in sorted(mappings["disabled"].get(provider, set()))
+                if path.exists()
+            )
+
+        return changes
+
+    def check_mcp_servers(self, *, diff: bool = False) -> list[PendingChange]:
+        """Report which MCP config files sync_mcp_servers would change.
+
+        The merged config is compared with the existing file semantically, so
+        formatting differences alone do not count as changes. Secret
+        placeholders are not looked up: each matches whatever value the file
+        holds in its place (see SecretResolver.matches), and diffs show them
+        unresolved, with other values that may be secrets masked.
+
+        Parameters
+        ----------
+        diff : bool, optional
+            Include the old and new text of changed files
+
+        Returns
+        -------
+        list[PendingChange]
+            Changes to provider MCP config files
+
+        Raises
+        ------
+        ValueError
+            If validation of provider configurations fails
+        """
+        servers = self.load_mcp_servers()
+
+        if not servers:
+            return []
+
+        changes = []
+
+        for target in self._get_mcp_targets(servers, resolve=False):
+            text, existing = self._load_json_config(target.path)
+            merged = self._merge_mcp_config(
+                target.path,
+                existing,
+                target.data,
+                target.mcp_key,
+            )
+            section = merged.get(target.mcp_key)
+
+            if SecretResolver.matches(section, existing.get(target.mcp_key)):
+                # What the placeholders resolved to when the file was written
+                merged[target.mcp_key] = existing[target.mcp_key]
+
+            if self._mcp_config_unchanged(text, existing, merged, target.mcp_key):
+                continue
+
+            action = "create" if text is None else "update"
+
+            if not diff:
+                changes.append(PendingChange(action, target.path))
+                continue
+
+            mcp_keys = {cfg.mcp_key for cfg in PROVIDERS.values()}
+            masked = {
+                key: SecretResolver.mask(section, value) if key in mcp_keys else value
+                for key, value in existing.items()
+            }
+            changes.append(
+                PendingChange(
+                    action,
+                    target.path,
+                    None if text is None else json.dumps(masked, indent=2) + "\n",
+                    json.dumps(merged | {target.mcp_key: section}, indent=2) + "\n",
+                ),
+            )
+
+        return changes
+
+    def _get_template_outputs(
+        self,
+        template_path: Path,
+        template: TemplateConfig,
+    ) -> dict[str, dict[str, Path]]:
+        """Calculate the output path of a template for every provider.
+
+        Parameters
+        ----------
+        template_path : Path
+            Path to the template file
+        template : TemplateConfig
+            Parsed template configuration
+
+        Returns
+        -------
+        dict[str, dict[str, Path]]
+            Nested dictionary: {"enabled": {provider: Path},
+            "disabled": {provider: Path}}
+        """
+        outputs: dict[str, dict[str, Path]] = {"enabled": {}, "disabled": {}}
+
+        for provider, provider_config in template.provider_metadata.items():
+            enabled = provider_config.get("enabled", False)
+
+            try:
+                output_path = self.get_output_path(
+                    config=self._config,
+                    provider=provider,
+                    template_path=template_path,
+                    template_type=template.type,
+                )
+            except (KeyError, ValueError):
+                # A disabled provider without a templates_dir has nothing to clean up
+                if enabled:
+                    raise
+                continue
+
+            outputs["enabled" if enabled else "disabled"][provider] = output_path
+
+        return outputs
+
+    @traced
+    def _get_template_mappings(
+        self,
+        templates: list[Path] | None = None,
+    ) -> dict[str, dict[str, set[Path]]]:
+        """Calculate file mappings for all templates (enabled and disabled).
+
+        Templates that are unchanged according to the build manifest are mapped
+        from their manifest entry without being parsed.
+
+        Parameters
+        ----------
+        templates : list[Path] | None, optional
+            Template paths to map (defaults to discover_templates())
+
+        Returns
+        -------
+        dict[str, dict[str, set[Path]]]
+            Nested dictionary: {"enabled": {provider: set[Path]},
+            "disabled": {provider: set[Path]}}
+        """
+        if templates is None:
+            templates = self.discover_templates()
+
+        mappings: dict[str, dict[str, set[Path]]] = {
+            status: {provider: set() for provider in get_template_providers()}
+            for status in ("enabled", "disabled")
+        }
+
+        for template_path in templates:
+            try:
+                # Skip README files
+                if template_path.name == "README.md":
+                    continue
+
+                entry = self._unchanged_templates.get(template_path)
+
+                if entry is not None:
+                    template_type = entry["type"]
+                    outputs = {
+                        status: {p: Path(path) for p, path in entry[status].items()}
+                        for status in ("enabled", "disabled")
+                    }
+                else:
+                    template = self.parse_template(template_path)
+                    template_type = template.type
+                    outputs = self._get_template_outputs(template_path, template)
+
+                # Track files for each provider (enabled or disabled)
+                for status, provider_outputs in outputs.items():
+                    for provider, output_path in provider_outputs.items():
+                        # For skills, track the entire directory
+                        if template_type == "skill":
+                            mappings[status][provider].add(output_path.parent)
+                        else:
+                            mappings[status][provider].add(output_path)
+
+            except Exception:
+                # Silently ignoring errors here allows discovery to continue for
+                # valid templates.
+                pass
+
+        return mappings
+
+    @traced
+    def _cleanup_disabled_templates(self, disabled_files: dict[str, set[Path]]) -> int:
+        """Remove files/directories for disabled templates only.
+
+        Only removes files that correspond to templates that exist but are disabled.
+        This prevents removal of manually created files.
+
+        Parameters
+        ----------
+        disabled_files : dict[str, set[Path]]
+            Dictionary mapping provider name to set of disabled file/directory paths
+
+        Returns
+        -------
+        int
+            Number of files/directories removed
+        """
+        removed_count = 0
+
+        for provider in get_template_providers():
+            disabled = disabled_files.get(provider, set())
+
+            for path in disabled:
+                if not self._output_path(path).exists():
+                    continue
+
+                try:
+                    target = self._output_path(path, write=True)
+
+                    if target.is_dir():
+                        shutil.rmtree(target)
+                        print(f"Removed disabled skill: {path}")
+                        removed_count += 1
+                    else:
+                        target.unlink()
+                        path_type = "agent" if "agent" in str(path) else "command"
+                        print(f"Removed disabled {path_type}: {path}")
+                        removed_count += 1
+
+                        # Clean up empty parent directories
+                        provider_config = self._config["providers"][provider]
+                        templates_dir = provider_config.get("templates_dir")
+                        if templates_dir:
+                            provider_base = Path(templates_dir).expanduser()
+                            provider_cfg = PROVIDERS[provider]
+                            # Determine stop directory based on path
+                            if "agent" in str(path) and provider_cfg.agent_dir:
+                                stop_dir = provider_base / provider_cfg.agent_dir
+                            elif "command" in str(path) and provider_cfg.command_dir:
+                                stop_dir = provider_base / provider_cfg.command_dir
+                            else:
+                                stop_dir = provider_base
+                            self._cleanup_empty_directories(
+                                target.parent,
+                                self._output_path(stop_dir),
+                            )
+
+                except PermissionError as e:
+                    print(
+                        f"Warning: Permission denied removing {path}: {e}",
+                        file=sys.stderr,
+                    )
+                except OSError as e:
+                    # Covers: FileNotFoundError, IsADirectoryError, etc.
+                    print(
+                        f"Warning: Failed to remove {path}: {e}",
+                        file=sys.stderr,
+                    )
+
+        self._record_io(files=removed_count)
+
+        return removed_count
+
+    def _cleanup_empty_directories(self, directory: Path, stop_at: Path) -> None:
+        """Recursively remove empty directories up to stop_at directory.
+
+        Parameters
+        ----------
+        directory : Path
+            Directory to start cleanup from
+        stop_at : Path
+            Directory to stop at (not removed even if empty)
+        """
+        try:
+            # Don't remove the base directory
+            if not directory.exists():
+                return
+
+            if directory == stop_at or not directory.is_relative_to(stop_at):
+                return
+
+            # Only remove if empty
+            if directory.is_dir() and not any(directory.iterdir()):
+                directory.rmdir()
+                print(f"Removed empty directory: {directory}")
+
+                # Try to remove parent if it's now empty
+                self._cleanup_empty_directories(directory.parent, stop_at)
+
+        except Exception:  # noqa: BLE001, S110  # intentional catch-all; empty-dir cleanup is non-critical and must never abort the caller
+            # This is best-effort cleanup that should never fail the main
+            # operation. Possible errors include PermissionError, OSError
+            # (directory not empty), and filesystem errors.
+            pass
+
+    def _sync_skill_assets(self, skill_dir: Path, output_dir: Path) -> bool:
+        """Copy a skill's supporting files and report the outcome.
+
+        Returns True if every file was copied, False if any copy failed.
+        """
+        result = self.copy_skill_directory(skill_dir, output_dir)
+
+        if result.copied > 0:
+            print(f"  Copied {result.copied} additional file(s)")
+        if result.removed > 0:
+            print(f"  Removed {result.removed} stale file(s)")
+        if result.errors > 0:
+            print(
+                f"  Warning: {result.errors} file(s) failed to copy",
+                file=sys.stderr,
+            )
+
+        return result.errors == 0
+
+    @traced
+    def _process_template(self, template_path: Path) -> int:
+        """Parse and generate output files for a single template.
+
+        The template is recorded in the build manifest only when every output
+        was written, so failures are retried on the next sync.
+
+        Returns the number of files written for this template; files whose
+        content was already current are counted in stats.files_unchanged.
+        """
+        if template_path.name == "README.md":
+            return 0
+
+        template = self.parse_template(template_path)
+        warnings = self.validate_template(template, template_path)
+        # Bodies are only read for templates that are rendered, and are not
+        # kept in the parse cache
+        template = FrontmatterParser.load_body(template_path, template)
+        # Encoded once; every provider's output shares it
+        body = template.body.encode()
+        self._record_io(bytes_read=len(body))
+
+        for warning in warnings:
+            print(f"Warning: {warning}")
+
+        outputs = self._get_template_outputs(template_path, template)
+        success_count = 0
+        failed = False
+
+        for provider, output_path in outputs["enabled"].items():
+            content = self._render_file(template, provider, body)
+
+            result = self.write_generated_file(output_path, content)
+
+            if result == "failed":
+                failed = True
+                continue
+
+            if result == "unchanged":
+                with self._stats_lock:
+                    self.stats.files_unchanged += 1
+            else:
+                success_count += 1
+
+            if template.type == "skill" and not self._sync_skill_assets(
+                template_path.parent,
+                output_path.parent,
+            ):
+                failed = True
+
+        self._record_template(template_path, template.type, outputs, failed=failed)
+
+        return success_count
+
+    def _record_template(
+        self,
+        template_path: Path,
+        template_type: str,
+        outputs: dict[str, dict[str, Path]],
+        *,
+        failed: bool,
+    ) -> None:
+        """Record a built template in the manifest, or discard it on failure.
+
+        Outputs are fingerprinted where they were written, which in staged
+        mode is the staged copy that is later renamed into place.
+        """
+        if self._manifest is None:
+            return
+
+        fingerprints: dict[str, dict[str, Any]] = {}
+
+        for path in outputs["enabled"].values():
+            if failed:
+                break
+
+            try:
+                fingerprints[str(path)] = fingerprint_output(
+                    self._output_path(path),
+                    template_type,
+                )
+            except OSError:
+                failed = True
+
+        if failed:
+            self._manifest.discard(template_path)
+            return
+
+        self._manifest.record(
+            template_path,
+            template_type,
+            outputs,
+            fingerprints,
+            pruned=self._prune_skills,
+        )
+
+    def _config_hash(self) -> str:
+        """Return a digest of the inputs besides templates that outputs depend on.
+
+        These are the providers section, PROVIDERS and this script itself, so
+        upgrading the renderer rebuilds every template.
+        """
+        inputs = {
+            "providers": self._config.get("providers", {}),
+            "PROVIDERS": {name: cfg._asdict() for name, cfg in PROVIDERS.items()},
+            "renderer": _renderer_hash(),
+        }
+
+        return hashlib.sha256(
+            json.dumps(inputs, sort_keys=True, default=str).encode(),
+        ).hexdigest()
+
+    def _find_unchanged_templates(
+        self,
+        templates: list[Path],
+    ) -> dict[Path, dict[str, Any]]:
+        """Look up every template in the build manifest.
+
+        Returns
+        -------
+        dict[Path, dict[str, Any]]
+            Manifest entries of templates that do not need rebuilding
+        """
+        if self._manifest is None:
+            return {}
+
+        unchanged = {}
+
+        for template_path in templates:
+            entry = self._manifest.lookup(template_path, prune=self._prune_skills)
+
+            if entry is not None:
+                unchanged[template_path] = entry
+
+        return unchanged
+
+    def _process_template_safely(self, template_path: Path) -> int:
+        """Process a single template, logging instead of raising on failure.
+
+        Returns the number of files written, or 0 if processing failed.
+        """
+        try:
+            return self._process_template(template_path)
+        except Exception as e:  # noqa: BLE001 - one bad template must not stop the batch
+            # This is a batch processing loop where one bad template should
+            # not stop processing of other templates. Errors are logged with the
+            # specific template path to aid debugging. Possible errors
+            # include YAML parsing, validation failures, file I/O errors,
+            # and more.
+            print(f"Error processing {template_path}: {e}", file=sys.stderr)
+
+            with self._stats_lock:
+                self.stats.template_errors += 1
+
+            if self._manifest is not None:
+                self._manifest.discard(template_path)
+
+            return 0
+
+    def template_for_path(self, path: Path) -> Path | None:
+        """Map a changed file under templates/ to the template it belongs to.
+
+        Any file inside a skill directory maps to that skill's SKILL.md, so
+        editing a supporting file re-syncs the whole skill. Files matched by
+        .syncignore belong to no template.
+
+        Parameters
+        ----------
+        path : Path
+            Changed file path
+
+        Returns
+        -------
+        Path | None
+            Template path, or None if the file does not belong to a template
+        """
+        try:
+            rel_path = path.relative_to(self._templates_dir)
+        except ValueError:
+            return None
+
+        if self._ignore_rules.is_ignored(rel_path.as_posix()):
+            return None
+
+        if rel_path.parts[:1] == ("skills",):
+            if len(rel_path.parts) < _SKILL_PATH_DEPTH + 1:
+                return None
+
+            return self._templates_dir / "skills" / rel_path.parts[1] / "SKILL.md"
+
+        if rel_path.parts[:1] in {("agents",), ("commands",)} and path.suffix == ".md":
+            return path
+
+        return None
+
+    def sync_templates(self, template_paths: list[Path]) -> int:
+        """Re-sync specific templates after they changed on disk.
+
+        Cached parses of the templates are discarded; everything else stays
+        warm. Outputs of providers that a template no longer enables are
+        removed, as they would be by sync_all.
+
+        Parameters
+        ----------
+        template_paths : list[Path]
+            Templates to re-sync
+
+        Returns
+        -------
+        int
+            Number of successfully generated files
+        """
+        if self._manifest is None:
+            self._manifest = BuildManifest.load(
+                self._config_file.with_name(MANIFEST_FILENAME),
+                self._config_hash(),
+            )
+
+        success_count = 0
+        disabled_files: dict[str, set[Path]] = {
+            provider: set() for provider in get_template_providers()
+        }
+
+        with self._staged_outputs():
+            for template_path in template_paths:
+                self._parsed_templates.pop(template_path, None)
+                self._unchanged_templates.pop(template_path, None)
+
+                if not template_path.exists():
+                    self._manifest.discard(template_path)
+                    continue
+
+                success_count += self._process_template_safely(template_path)
+
+                mappings = self._get_template_mappings([template_path])
+
+                for provider, paths in mappings["disabled"].items():
+                    disabled_files[provider] |= paths
+
+            self._cleanup_disabled_templates(disabled_files)
+
+        self._manifest.save()
+
+        return success_count
+
+    def sync_all(self, *, force: bool = False) -> int:
+        """Process all templates and generate provider configs.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Rebuild every template, ignoring the build manifest
+
+        Returns
+        -------
+        int
+            Number of successfully generated files
+        """
+        templates = self.discover_templates()
+        print(f"Found {len(templates)} templates")
+
+        manifest_path = self._config_file.with_name(MANIFEST_FILENAME)
+        self._manifest = (
+            BuildManifest(manifest_path, self._config_hash())
+            if force
+            else BuildManifest.load(manifest_path, self._config_hash())
+        )
+        self._unchanged_templates = self._find_unchanged_templates(templates)
+        pending = [t for t in templates if t not in self._unchanged_templates]
+
+        # Track enabled and disabled files before generation
+        mappings = self._get_template_mappings(templates)
+        disabled_files = mappings["disabled"]
+
+        self.stats.templates_skipped = len(templates) - len(pending)
+
+        # In staged mode nothing reaches the live directories (and the
+        # manifest is not saved) unless the whole batch completes
+        with self._staged_outputs():
+            success_count = sum(
+                self._process_template_safely(template_path)
+                for template_path in pending
+            )
+
+            if self.stats.templates_skipped > 0:
+                print(f"Skipped {self.stats.templates_skipped} unchanged template(s)")
+
+            # Clean up disabled templates (not manually created files)
+            removed_count = self._cleanup_disabled_templates(disabled_files)
+
+            if removed_count > 0:
+                print(f"Cleaned up {removed_count} disabled/removed template(s)")
+
+        self._manifest.prune(templates)
+        self._manifest.save()
+
+        return success_count
+
+
+# inotify(7) event masks
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class WatchedTree:
+    """The paths below the templates directory that watchers follow.
+
+    Discovery and skill copies never look at paths matched by .syncignore or,
+    inside a skill, by the skill's .gitignore/.dockerignore files, so those
+    are neither watched nor walked (a skill's node_modules/ can hold more
+    directories than inotify allows watches).
+    """
+
+    def __init__(self, templates_dir: Path) -> None:
+        """Load templates_dir's .syncignore."""
+        self._templates_dir = templates_dir
+        self._rules = IgnoreRules.from_file(templates_dir / SYNCIGNORE_FILENAME)
+
+    def _skill_dir(self, rel_path: Path) -> Path | None:
+        """Return the skill directory a relative path is, or lies inside."""
+        if rel_path.parts[:1] != ("skills",) or len(rel_path.parts) < _SKILL_PATH_DEPTH:
+            return None
+
+        return self._templates_dir.joinpath(*rel_path.parts[:_SKILL_PATH_DEPTH])
+
+    def is_ignored(self, path: Path, *, is_dir: bool) -> bool:
+        """Return whether changes to a path can be ignored.
+
+        Paths outside the templates directory, such as the config file, are
+        never ignored.
+        """
+        try:
+            rel_path = path.relative_to(self._templates_dir)
+        except ValueError:
+            return False
+
+        if not rel_path.parts:
+            return False
+
+        if self._rules.is_ignored(rel_path.as_posix(), is_dir=is_dir):
+            return True
+
+        skill_dir = self._skill_dir(rel_path)
+
+        return skill_dir not in {None, path} and _is_skill_path_ignored(
+            skill_dir,
+            path,
+            is_dir=is_dir,
+        )
+
+    def walk(self, root: Path) -> Iterator[tuple[Path, bool]]:
+        """Yield (path, is_dir) for every followed path below root.
+
+        root must be followed itself. Symlinked directories are yielded as
+        files and not descended into.
+        """
+        skill_dir = self._skill_dir(root.relative_to(self._templates_dir))
+
+        if skill_dir is not None:
+            for path in _walk_skill_files(skill_dir, root):
+                yield path, path.is_dir() and not path.is_symlink()
+
+            return
+
+        for entry in _list_directory(str(root)):
+            path = Path(entry.path)
+            is_dir = entry.is_dir(follow_symlinks=False)
+
+            if self.is_ignored(path, is_dir=is_dir):
+                continue
+
+            yield path, is_dir
+
+            if is_dir:
+                yield from self.walk(path)
+
+
+class InotifyWatcher:
+    """Linux inotify event source, loaded from libc through ctypes.
+
+    inotify is not recursive, so every followed directory under the
+    templates tree (see WatchedTree) gets its own watch, and directories
+    created later are added as they appear.
+    """
+
+    _MASK = (
+        _IN_MODIFY
+        | _IN_ATTRIB
+        | _IN_CLOSE_WRITE
+        | _IN_MOVED_FROM
+        | _IN_MOVED_TO
+        | _IN_CREATE
+        | _IN_DELETE
+        | _IN_DELETE_SELF
+    )
+
+    def __init__(self, templates_dir: Path, config_file: Path) -> None:
+        """Start watching templates_dir recursively and config_file.
+
+        Raises
+        ------
+        OSError
+            If inotify is unavailable on this platform, or a watch cannot be
+            added (for example past fs.inotify.max_user_watches)
+        """
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        except (AttributeError, OSError) as e:
+            raise OSError(f"inotify is not available: {e}") from e
+
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._dirs: dict[int, Path] = {}
+        self._tree = WatchedTree(templates_dir)
+
+        try:
+            # Watch the config file's directory: editors replace files via rename
+            self._add_watch(config_file.parent)
+            self._add_tree(templates_dir)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """Release the inotify file descriptor and its watches."""
+        os.close(self._fd)
+
+    def _add_watch(self, directory: Path) -> None:
+        """Add a watch for a single directory."""
+        wd = self._libc.inotify_add_watch(
+            self._fd,
+            os.fsencode(directory),
+            self._MASK,
+        )
+
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+
+        self._dirs[wd] = directory
+
+    def _add_tree(self, root: Path) -> set[Path]:
+        """Watch root and every followed directory below it.
+
+        Returns the files found, so files moved in with a directory are seen.
+        """
+        self._add_watch(root)
+        files = set()
+
+        for path, is_dir in self._tree.walk(root):
+            if is_dir:
+                self._add_watch(path)
             else:
-                mcp_config = providers_config[provider_name].get("mcp_config")
+                files.add(path)
 
-                if not (isinstance(mcp_config, str) and mcp_config.strip()):
-                    validation_errors.append(
-                        f"Provider '{provider_name}' has no valid "
-                        f"'mcp_config' path configured. "
-                        f"Add 'mcp_config: <path>' to "
-                        f"providers.{provider_name} in config.yml "
-                        f"(current value: {mcp_config!r})",
-                    )
+        return files
 
-        if validation_errors:
-            raise ValueError(
-                "MCP server configuration validation failed:\n\n"
-                + "\n\n".join(f"  • {error}" for error in validation_errors),
+    def read(self, timeout: float | None) -> set[Path] | None:
+        """Wait up to timeout seconds for events.
+
+        Returns
+        -------
+        set[Path] | None
+            Changed paths (empty on timeout), or None if the kernel queue
+            overflowed and events were lost
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+
+        if not ready:
+            return set()
+
+        data = os.read(self._fd, 64 * 1024)
+        changed: set[Path] = set()
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                return None
+
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+
+            directory = self._dirs.get(wd)
+
+            if directory is None:
+                continue
+
+            path = directory / os.fsdecode(name) if name else directory
+
+            if self._tree.is_ignored(path, is_dir=bool(mask & _IN_ISDIR)):
+                continue
+
+            changed.add(path)
+
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                with contextlib.suppress(OSError):
+                    changed |= self._add_tree(path)
+
+        return changed
+
+
+class PollingWatcher:
+    """Portable event source that compares stat snapshots at an interval."""
+
+    def __init__(
+        self,
+        templates_dir: Path,
+        config_file: Path,
+        interval: float = 0.5,
+    ) -> None:
+        """Take the initial snapshot of templates_dir and config_file."""
+        self._templates_dir = templates_dir
+        self._config_file = config_file
+        self._interval = interval
+        self._tree = WatchedTree(templates_dir)
+        self._snapshot = self._take_snapshot()
+
+    def close(self) -> None:
+        """Stop watching; polling holds no resources."""
+
+    def _take_snapshot(self) -> dict[Path, tuple[int, int]]:
+        """Return the (mtime_ns, size) of every watched file."""
+        snapshot = {}
+        paths = [
+            self._config_file,
+            *(path for path, _ in self._tree.walk(self._templates_dir)),
+        ]
+
+        for path in paths:
+            with contextlib.suppress(OSError):
+                stat = path.stat()
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
+
+    def read(self, timeout: float | None) -> set[Path] | None:
+        """Poll until something changes or timeout seconds pass.
+
+        Returns
+        -------
+        set[Path] | None
+            Changed paths (empty on timeout)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            delay = self._interval
+
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0))
+
+            time.sleep(delay)
+            snapshot = self._take_snapshot()
+            changed = {
+                path
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+class TemplateWatcher:
+    """Re-sync templates as they change, keeping parsed state warm.
+
+    Bursts of events (editors often write, rename and chmod in quick
+    succession) are collected until the tree has been quiet for the debounce
+    interval. Only the affected agents, commands and skills are re-synced; a
+    change to the config file or .syncignore, or lost events, triggers a full
+    sync.
+    """
+
+    def __init__(
+        self,
+        manager: AgentSyncManager,
+        *,
+        debounce: float = 0.05,
+    ) -> None:
+        """Initialize TemplateWatcher.
+
+        Parameters
+        ----------
+        manager : AgentSyncManager
+            Manager that has already run an initial sync
+        debounce : float, optional
+            Seconds without events before a batch of changes is synced
+        """
+        self._manager = manager
+        self._debounce = debounce
+        self._events = self._open_events()
+
+    def _open_events(self) -> InotifyWatcher | PollingWatcher:
+        """Start an event source for the tree as its ignore files are now."""
+        try:
+            events: InotifyWatcher | PollingWatcher = InotifyWatcher(
+                self._manager.templates_dir,
+                self._manager.config_file,
+            )
+            self.backend = "inotify"
+        except OSError:
+            events = PollingWatcher(
+                self._manager.templates_dir,
+                self._manager.config_file,
+            )
+            self.backend = "polling"
+
+        return events
+
+    def _wait_for_changes(self) -> set[Path] | None:
+        """Block until a debounced batch of changes is available."""
+        changed = self._events.read(None)
+
+        while changed is not None:
+            more = self._events.read(self._debounce)
+
+            if more is None:
+                return None
+
+            if not more:
+                break
+
+            changed |= more
+
+        return changed
+
+    def _sync_changes(self, changed: set[Path] | None) -> None:
+        """Re-sync whatever a batch of changes affects."""
+        start = time.perf_counter()
+
+        syncignore = self._manager.templates_dir / SYNCIGNORE_FILENAME
+
+        # Ignore files decide what is watched; start over with the new rules
+        # before syncing, so changes made during the sync are not lost
+        if changed is None or any(
+            path.name in {SYNCIGNORE_FILENAME, ".gitignore", ".dockerignore"}
+            for path in changed
+        ):
+            self._events.close()
+            self._events = self._open_events()
+
+        if changed is None or {self._manager.config_file, syncignore} & changed:
+            print("Config changed, running full sync")
+
+            with self._manager.lock():
+                self._manager.reload_config()
+                self._manager.sync_all()
+                self._manager.sync_mcp_servers()
+        else:
+            templates = sorted(
+                {self._manager.template_for_path(path) for path in changed} - {None},
             )
 
-        success_count = 0
+            if not templates:
+                return
+
+            with self._manager.lock():
+                self._manager.sync_templates(templates)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Re-synced in {elapsed_ms:.1f}ms")
+
+    def run(self) -> None:
+        """Watch for changes until interrupted."""
+        print(
+            f"Watching {self._manager.templates_dir} and "
+            f"{self._manager.config_file.name} ({self.backend}). "
+            f"Press Ctrl-C to stop.",
+        )
+
+        try:
+            while True:
+                changed = self._wait_for_changes()
+
+                try:
+                    self._sync_changes(changed)
+                except Exception as e:  # noqa: BLE001 - keep watching after a failed sync
+                    print(f"Error: {e}", file=sys.stderr)
+        finally:
+            self._events.close()
+
+
+def _positive_int(value: str) -> int:
+    """Parse a positive integer command-line value."""
+    number = int(value)
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+
+    return number
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse command-line arguments.
+
+    Returns
+    -------
+    argparse.Namespace
+        Parsed command-line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "Synchronize agent, command, and skill templates to provider configurations"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Use config.yml in script directory (default)
+  %(prog)s
+
+  # Use custom config file
+  %(prog)s --config /path/to/my-config.yml
+  %(prog)s -c ~/my-project/config.yml
+
+  # Regenerate everything, ignoring the build manifest
+  %(prog)s --force
+
+  # Re-sync templates as they are edited
+  %(prog)s --watch
+
+  # Apply all generated files at once, or not at all
+  %(prog)s --staged
+
+  # Fail (e.g. in a git hook) if generated files are stale
+  %(prog)s --check
+  %(prog)s --diff
+
+  # Show where a sync spends its time
+  %(prog)s --timings --trace sync-trace.json
+
+  # Time the startup of every enabled local MCP server
+  %(prog)s probe
+  %(prog)s probe dash-api --json
+
+  # Estimate the context tokens each provider's MCP tools cost per session
+  %(prog)s tools
+  %(prog)s tools --refresh --json
+
+  # Show the servers pooled by the MCP proxy (mcp_proxy.enabled in config.yml)
+  %(prog)s proxy status
+
+  # Install uvx/npx servers once and start their executables directly
+  %(prog)s prewarm
+  %(prog)s prewarm --offline
+
+  # List backups of MCP config files, then roll one back
+  %(prog)s restore
+  %(prog)s restore 20260101-120000-1a2b3c4d
+        """,
+    )
+
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="Path to config file (default: config.yml in script directory)",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Ignore the build manifest and regenerate every template",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep running and re-sync templates as they change",
+    )
+
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Remove files from generated skill directories that were deleted "
+        "from the skill template",
+    )
+
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="Write outputs to staging copies of the provider directories, fsync "
+        "them once and swap them in when the sync completes",
+    )
+
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 if a sync would change anything; writes nothing",
+    )
+
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Like --check, and print a unified diff of pending changes",
+    )
+
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print wall time, bytes read/written and file counts per phase",
+    )
+
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="Write per-call phase timings as Chrome trace-event JSON to FILE",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    probe_parser = subparsers.add_parser(
+        "probe",
+        help="Start MCP servers and time their initialize handshake",
+        description="Start every enabled local MCP server (or the named ones) "
+        "concurrently, run the MCP initialize handshake over stdio and report "
+        "spawn time, time to the initialize response and memory use.",
+    )
+    probe_parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="SERVER",
+        help="Servers to probe (default: all enabled local servers)",
+    )
+    probe_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print results as JSON",
+    )
+    probe_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=PROBE_TIMEOUT,
+        metavar="SECONDS",
+        help=f"Time to wait for each server to respond (default: {PROBE_TIMEOUT:g})",
+    )
+    probe_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        metavar="N",
+        help="Start N servers at a time (default: all at once)",
+    )
+    probe_parser.add_argument(
+        "--slow-ms",
+        type=float,
+        default=PROBE_SLOW_MS,
+        metavar="MS",
+        help="Flag servers that take longer than MS to respond "
+        f"(default: {PROBE_SLOW_MS:g})",
+    )
+
+    tools_parser = subparsers.add_parser(
+        "tools",
+        help="Estimate the context tokens of each MCP server's tools",
+        description="Fetch the tools/list manifest of every enabled MCP server "
+        "(or the named ones), from the cache or by starting the server, and "
+        "report the estimated context tokens per server and per provider.",
+    )
+    tools_parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="SERVER",
+        help="Servers to measure (default: all enabled servers)",
+    )
+    tools_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Query every local server again instead of using cached manifests",
+    )
+    tools_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print results as JSON",
+    )
+    tools_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=PROBE_TIMEOUT,
+        metavar="SECONDS",
+        help=f"Time to wait for each server's manifest (default: {PROBE_TIMEOUT:g})",
+    )
+    tools_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        metavar="N",
+        help="Start N servers at a time (default: all at once)",
+    )
+
+    proxy_parser = subparsers.add_parser(
+        "proxy",
+        help="Run or control the MCP multiplexing proxy",
+        description="serve runs the proxy in the foreground; provider sessions "
+        "start it on demand when mcp_proxy.enabled is set. status lists the "
+        "pooled servers, and stop shuts the proxy and its servers down.",
+    )
+    proxy_parser.add_argument(
+        "action",
+        choices=["serve", "status", "stop"],
+        help="What to do",
+    )
+
+    prewarm_parser = subparsers.add_parser(
+        "prewarm",
+        help="Install uvx/npx MCP servers into pinned local environments",
+        description="Install the package of every enabled MCP server started "
+        "through uvx or npx (or the named ones) into a local environment, then "
+        "update the MCP configs to start its executable directly. Environments "
+        "are reinstalled when a server's command changes in config.yml.",
+    )
+    prewarm_parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="SERVER",
+        help="Servers to prewarm (default: all enabled uvx/npx servers)",
+    )
+    prewarm_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Reinstall current environments to pick up new releases",
+    )
+    prewarm_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Install from the local uv/npm caches without network access",
+    )
+
+    restore_parser = subparsers.add_parser(
+        "restore",
+        help="List MCP config backups, or restore one",
+        description="Without SNAPSHOT, list the snapshots in the backup store. "
+        "With SNAPSHOT, write it back to the file it was taken from, backing up "
+        "that file's current content first.",
+    )
+    restore_parser.add_argument(
+        "snapshot",
+        nargs="?",
+        metavar="SNAPSHOT",
+        help="Snapshot id, or a unique prefix of one",
+    )
+    restore_parser.add_argument(
+        "--to",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="Restore to FILE instead of the original location",
+    )
+
+    return parser.parse_args()
+
+
+def print_pending_changes(changes: list[PendingChange], *, diff: bool) -> None:
+    """Print the changes a sync would make, optionally as unified diffs.
 
-        for provider_name, generator_func in MCP_GENERATORS.items():
-            provider_cfg = get_provider_config(provider_name)
-            provider_config = providers_config.get(provider_name) or {}
+    Parameters
+    ----------
+    changes : list[PendingChange]
+        Pending changes to report
+    diff : bool
+        Print a unified diff for each text file that would change
+    """
+    for change in changes:
+        print(f"Would {change.action}: {change.path}")
+
+        if not diff or (change.old is None and change.new is None):
+            continue
+
+        for line in difflib.unified_diff(
+            (change.old or "").splitlines(keepends=True),
+            (change.new or "").splitlines(keepends=True),
+            fromfile=str(change.path) if change.old is not None else "/dev/null",
+            tofile=str(change.path) if change.new is not None else "/dev/null",
+        ):
+            if line.endswith("\n"):
+                sys.stdout.write(line)
+            else:
+                sys.stdout.write(f"{line}\n\\ No newline at end of file\n")
 
-            if "mcp_config" not in provider_config:
-                continue
+    if changes:
+        print(f"{len(changes)} pending change(s); run without --check to apply")
+    else:
+        print("Everything is up to date")
 
-            target_path = Path(provider_config["mcp_config"]).expanduser()
-            config_data = generator_func(servers)
-            mcp_key = provider_cfg.mcp_key
 
-            # Determine if any servers in config.yml reference this provider
-            # (regardless of enabled state). Used to distinguish:
-            #   - No servers reference provider → skip to preserve any manually-added servers
-            #   - Servers reference provider but all disabled → sync empty dict to remove them
-            provider_is_referenced = any(
-                provider_name in server.providers for server in servers
-            )
+def run_check(manager: AgentSyncManager, *, diff: bool) -> int:
+    """Report pending changes without writing anything.
 
-            if not provider_is_referenced:
-                # No servers are managed for this provider by this script;
-                # skip to avoid wiping manually-added servers in the target config.
-                continue
+    Returns
+    -------
+    int
+        Exit code (0 if up to date, 1 if a sync would change anything or a
+        template could not be processed)
+    """
+    changes = manager.check_templates(diff=diff)
+    changes += manager.check_mcp_servers(diff=diff)
+    print_pending_changes(changes, diff=diff)
 
-            success, backup_path = self.merge_json_file(
-                target_path,
-                config_data,
-                mcp_key,
-            )
+    return 1 if (changes or manager.stats.template_errors) else 0
 
-            if success:
-                success_count += 1
 
-                if backup_path:
-                    backup_files.append(backup_path)
-            else:
-                print(
-                    f"Sync failed for {provider_name}, "
-                    f"keeping all backups for recovery",
-                )
+def run_restore(
+    manager: AgentSyncManager,
+    snapshot_id: str | None,
+    target: Path | None,
+) -> int:
+    """List the backup store, or restore a snapshot from it.
 
-                return success_count
+    Returns
+    -------
+    int
+        Exit code (0 for success, 1 if the snapshot could not be restored)
+    """
+    store = manager.backups
 
-        self._cleanup_backups(backup_files)
+    if snapshot_id is None:
+        snapshots = store.snapshots()
 
-        return success_count
+        for snapshot in snapshots:
+            print(
+                f"{snapshot.id}  {snapshot.created}  {snapshot.size:>10}  "
+                f"{snapshot.path}",
+            )
 
-    def _get_template_mappings(self) -> dict[str, dict[str, set[Path]]]:
-        """Calculate file mappings for all templates (enabled and disabled).
+        if not snapshots:
+            print(f"No backups in {store.root}")
 
-        Returns
-        -------
-        dict[str, dict[str, set[Path]]]
-            Nested dictionary: {"enabled": {provider: set[Path]},
-            "disabled": {provider: set[Path]}}
-        """
-        templates = self.discover_templates()
-        enabled_files: dict[str, set[Path]] = {
-            provider: set() for provider in get_template_providers()
-        }
-        disabled_files: dict[str, set[Path]] = {
-            provider: set() for provider in get_template_providers()
-        }
+        return 0
 
-        for template_path in templates:
-            try:
-                # Skip README files
-                if template_path.name == "README.md":
-                    continue
+    try:
+        snapshot = store.find(snapshot_id)
 
-                template = FrontmatterParser.parse_file(template_path)
+        with manager.lock():
+            restored = store.restore(snapshot, target.expanduser() if target else None)
+    except KeyError as e:
+        print(f"Error: {e.args[0]}", file=sys.stderr)
 
-                # Track files for each provider (enabled or disabled)
-                for provider in template.provider_metadata:
-                    provider_config = template.provider_metadata.get(provider, {})
-
-                    output_path = self.get_output_path(
-                        config=self._config,
-                        provider=provider,
-                        template_path=template_path,
-                        template_type=template.type,
-                    )
+        return 1
 
-                    # Categorize by enabled status
-                    target_dict = (
-                        enabled_files
-                        if provider_config.get("enabled", False)
-                        else disabled_files
-                    )
+    print(f"Restored {restored} from snapshot {snapshot.id}")
 
-                    # For skills, track the entire directory
-                    if template.type == "skill":
-                        target_dict[provider].add(output_path.parent)
-                    else:
-                        target_dict[provider].add(output_path)
+    return 0
 
-            except Exception:
-                # Silently ignoring errors here allows discovery to continue for
-                # valid templates.
-                pass
 
-        return {"enabled": enabled_files, "disabled": disabled_files}
+def run_probe(manager: AgentSyncManager, args: argparse.Namespace) -> int:
+    """Probe MCP servers and print a table or JSON of the results.
 
-    def _cleanup_disabled_templates(self, disabled_files: dict[str, set[Path]]) -> int:
-        """Remove files/directories for disabled templates only.
+    Returns
+    -------
+    int
+        Exit code (0 if every server responded, 1 otherwise)
+    """
+    results = manager.probe_mcp_servers(
+        args.names,
+        timeout=args.timeout,
+        jobs=args.jobs,
+    )
 
-        Only removes files that correspond to templates that exist but are disabled.
-        This prevents removal of manually created files.
+    def is_slow(result: ProbeResult) -> bool:
+        return result.response_ms is not None and result.response_ms > args.slow_ms
 
-        Parameters
-        ----------
-        disabled_files : dict[str, set[Path]]
-            Dictionary mapping provider name to set of disabled file/directory paths
+    if args.json:
+        print(
+            json.dumps(
+                [result._asdict() | {"slow": is_slow(result)} for result in results],
+                indent=2,
+            ),
+        )
+    elif not results:
+        print("No enabled local MCP servers")
+    else:
+        width = max(len("Server"), *(len(result.name) for result in results)) + 2
+        print(
+            f"{'Server':<{width}}{'Spawn (ms)':>12}{'Init (ms)':>12}"
+            f"{'RSS (MB)':>10}  Status",
+        )
 
-        Returns
-        -------
-        int
-            Number of files/directories removed
-        """
-        removed_count = 0
+        for result in results:
+            status = result.error or ("SLOW" if is_slow(result) else "ok")
+            cells = [
+                f"{value:>{size}.1f}" if value is not None else f"{'-':>{size}}"
+                for value, size in (
+                    (result.spawn_ms, 12),
+                    (result.response_ms, 12),
+                    (None if result.rss_kb is None else result.rss_kb / 1024, 10),
+                )
+            ]
+            print(f"{result.name:<{width}}{''.join(cells)}  {status}")
 
-        for provider in get_template_providers():
-            disabled = disabled_files.get(provider, set())
+    return 1 if any(result.error for result in results) else 0
 
-            for path in disabled:
-                if not path.exists():
-                    continue
 
-                try:
-                    if path.is_dir():
-                        shutil.rmtree(path)
-                        print(f"Removed disabled skill: {path}")
-                        removed_count += 1
-                    else:
-                        path.unlink()
-                        path_type = "agent" if "agent" in str(path) else "command"
-                        print(f"Removed disabled {path_type}: {path}")
-                        removed_count += 1
+def run_tools(manager: AgentSyncManager, args: argparse.Namespace) -> int:
+    """Print the estimated context cost of MCP tools per server and provider.
 
-                        # Clean up empty parent directories
-                        provider_config = self._config["providers"][provider]
-                        templates_dir = provider_config.get("templates_dir")
-                        if templates_dir:
-                            provider_base = Path(templates_dir).expanduser()
-                            provider_cfg = PROVIDERS[provider]
-                            # Determine stop directory based on path
-                            if "agent" in str(path) and provider_cfg.agent_dir:
-                                stop_dir = provider_base / provider_cfg.agent_dir
-                            elif "command" in str(path) and provider_cfg.command_dir:
-                                stop_dir = provider_base / provider_cfg.command_dir
-                            else:
-                                stop_dir = provider_base
-                            self._cleanup_empty_directories(path.parent, stop_dir)
+    Returns
+    -------
+    int
+        Exit code (0 if every local server's manifest is known, 1 otherwise)
+    """
+    costs = manager.measure_tool_costs(
+        args.names,
+        refresh=args.refresh,
+        timeout=args.timeout,
+        jobs=args.jobs,
+    )
+    # Tokens, servers and unmeasured servers in each provider's sessions
+    totals: dict[str, dict[str, int]] = {}
+
+    for cost in costs:
+        for provider in cost.providers:
+            total = totals.setdefault(
+                provider,
+                {"tokens": 0, "servers": 0, "unmeasured": 0},
+            )
+            total["tokens"] += cost.tokens or 0
+            total["servers"] += 1
+            total["unmeasured"] += cost.tokens is None
 
-                except PermissionError as e:
-                    print(
-                        f"Warning: Permission denied removing {path}: {e}",
-                        file=sys.stderr,
-                    )
-                except OSError as e:
-                    # Covers: FileNotFoundError, IsADirectoryError, etc.
-                    print(
-                        f"Warning: Failed to remove {path}: {e}",
-                        file=sys.stderr,
-                    )
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "servers": [cost._asdict() for cost in costs],
+                    "providers": totals,
+                },
+                indent=2,
+            ),
+        )
+    elif not costs:
+        print("No enabled MCP servers")
+    else:
+        width = max(len("Server"), *(len(cost.name) for cost in costs)) + 2
+        print(f"{'Server':<{width}}{'Tools':>7}{'Tokens':>9}  Providers")
+
+        for cost in costs:
+            if cost.error:
+                status = f"  ({cost.error})"
+            elif cost.tokens is None:
+                status = "  (remote, not measured)"
+            else:
+                status = "  (cached)" if cost.cached else ""
 
-        return removed_count
+            tools = "-" if cost.tools is None else str(cost.tools)
+            tokens = "-" if cost.tokens is None else f"{cost.tokens:,}"
+            print(
+                f"{cost.name:<{width}}{tools:>7}{tokens:>9}  "
+                f"{', '.join(cost.providers) or '-'}{status}",
+            )
 
-    def _cleanup_empty_directories(self, directory: Path, stop_at: Path) -> None:
-        """Recursively remove empty directories up to stop_at directory.
+        print("\nEstimated context overhead per session:")
 
-        Parameters
-        ----------
-        directory : Path
-            Directory to start cleanup from
-        stop_at : Path
-            Directory to stop at (not removed even if empty)
-        """
-        try:
-            # Don't remove the base directory
-            if not directory.exists():
-                return
+        for provider, total in totals.items():
+            unmeasured = (
+                f", {total['unmeasured']} not measured" if total["unmeasured"] else ""
+            )
+            print(
+                f"  {provider:<10}{total['tokens']:>9,} tokens "
+                f"({total['servers']} servers{unmeasured})",
+            )
 
-            if directory == stop_at or not directory.is_relative_to(stop_at):
-                return
+    return 1 if any(cost.error for cost in costs) else 0
 
-            # Only remove if empty
-            if directory.is_dir() and not any(directory.iterdir()):
-                directory.rmdir()
-                print(f"Removed empty directory: {directory}")
 
-                # Try to remove parent if it's now empty
-                self._cleanup_empty_directories(directory.parent, stop_at)
+def run_proxy(manager: AgentSyncManager, action: str) -> int:
+    """Serve the MCP proxy, or show its status or stop it.
 
-        except Exception:  # noqa: BLE001, S110  # intentional catch-all; empty-dir cleanup is non-critical and must never abort the caller
-            # This is best-effort cleanup that should never fail the main
-            # operation. Possible errors include PermissionError, OSError
-            # (directory not empty), and filesystem errors.
-            pass
+    Returns
+    -------
+    int
+        Exit code (0 for success, 1 if status finds no running proxy)
+    """
+    settings = manager.proxy_settings
 
-    def _process_template(self, template_path: Path) -> int:
-        """Parse and generate output files for a single template.
+    if action == "serve":
+        with contextlib.suppress(KeyboardInterrupt):
+            if not MCPProxy(settings, manager.proxied_server).serve():
+                print(f"MCP proxy already running on {settings.socket}")
 
-        Returns the number of files successfully written for this template.
-        """
-        if template_path.name == "README.md":
-            return 0
+        return 0
 
-        template = FrontmatterParser.parse_file(template_path)
-        warnings = self.validate_template(template, template_path)
+    try:
+        reply = proxy_request(settings.socket, {"command": action})
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"MCP proxy is not running on {settings.socket}")
 
-        for warning in warnings:
-            print(f"Warning: {warning}")
+        return 1 if action == "status" else 0
 
-        success_count = 0
+    if action == "stop":
+        print("Stopped MCP proxy")
 
-        for provider, provider_config in template.provider_metadata.items():
-            if not provider_config.get("enabled", False):
-                continue
+        return 0
 
-            content = self._generator.generate_file_content(template, provider)
-            output_path = self.get_output_path(
-                config=self._config,
-                provider=provider,
-                template_path=template_path,
-                template_type=template.type,
-            )
+    print(f"MCP proxy (pid {reply['pid']}): {reply['sessions']} session(s)")
 
-            if not self.write_generated_file(output_path, content):
-                continue
+    if reply["servers"]:
+        width = max(len("Server"), *(len(item["name"]) for item in reply["servers"]))
+        print(f"  {'Server':<{width + 2}}{'PID':>8}{'Sessions':>10}{'RSS (MB)':>10}")
 
-            success_count += 1
+    for item in reply["servers"]:
+        rss = "-" if item["rss_kb"] is None else f"{item['rss_kb'] / 1024:.1f}"
+        print(
+            f"  {item['name']:<{width + 2}}{item['pid']:>8}{item['sessions']:>10}"
+            f"{rss:>10}",
+        )
 
-            if template.type == "skill":
-                copied, errors = self.copy_skill_directory(
-                    template_path.parent,
-                    output_path.parent,
-                )
-                if copied > 0:
-                    print(f"  Copied {copied} additional file(s)")
-                if errors > 0:
-                    print(
-                        f"  Warning: {errors} file(s) failed to copy",
-                        file=sys.stderr,
-                    )
+    return 0
 
-        return success_count
 
-    def sync_all(self) -> int:
-        """Process all templates and generate provider configs.
+def run_prewarm(manager: AgentSyncManager, args: argparse.Namespace) -> int:
+    """Prewarm uvx/npx MCP servers, then point the MCP configs at them.
 
-        Returns
-        -------
-        int
-            Number of successfully generated files
-        """
-        templates = self.discover_templates()
-        print(f"Found {len(templates)} templates")
+    Returns
+    -------
+    int
+        Exit code (0 if every server was prewarmed, 1 otherwise)
+    """
+    with manager.lock():
+        results = manager.prewarm_mcp_servers(
+            args.names,
+            refresh=args.refresh,
+            offline=args.offline,
+        )
 
-        # Track enabled and disabled files before generation
-        mappings = self._get_template_mappings()
-        disabled_files = mappings["disabled"]
+        for result in results:
+            if result.entry is None:
+                print(f"  {result.name}: failed: {result.error}")
+                continue
 
-        success_count = 0
+            status = "installed" if result.installed else "up to date"
+            pins = ", ".join(result.entry.pinned[:3])
+            more = len(result.entry.pinned) - 3
+            print(
+                f"  {result.name}: {status}, {result.entry.executable} "
+                f"({pins}{f', +{more} more' if more > 0 else ''})",
+            )
 
-        for template_path in templates:
-            try:
-                success_count += self._process_template(template_path)
-            except Exception as e:
-                # This is a batch processing loop where one bad template should
-                # not stop processing of other templates. Errors are logged with the
-                # specific template path to aid debugging. Possible errors
-                # include YAML parsing, validation failures, file I/O errors,
-                # and more.
-                print(f"Error processing {template_path}: {e}", file=sys.stderr)
+        if not results:
+            print("No enabled MCP servers are started through uvx or npx")
 
-        # Clean up disabled templates (not manually created files)
-        removed_count = self._cleanup_disabled_templates(disabled_files)
+        mcp_count = manager.sync_mcp_servers()
 
-        if removed_count > 0:
-            print(f"Cleaned up {removed_count} disabled/removed template(s)")
+    print(f"Successfully updated {mcp_count} MCP configuration files")
 
-        return success_count
+    return 1 if any(result.error for result in results) else 0
 
 
-def parse_arguments() -> argparse.Namespace:
-    """Parse command-line arguments.
+def run_command(manager: AgentSyncManager, args: argparse.Namespace) -> int:
+    """Run a subcommand, or --check/--diff, instead of a sync.
 
     Returns
     -------
-    argparse.Namespace
-        Parsed command-line arguments
+    int
+        Exit code of the subcommand
     """
-    parser = argparse.ArgumentParser(
-        description=(
-            "Synchronize agent, command, and skill templates to provider configurations"
-        ),
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  # Use config.yml in script directory (default)
-  %(prog)s
+    if args.command == "restore":
+        return run_restore(manager, args.snapshot, args.to)
 
-  # Use custom config file
-  %(prog)s --config /path/to/my-config.yml
-  %(prog)s -c ~/my-project/config.yml
-        """,
-    )
+    if args.command == "probe":
+        return run_probe(manager, args)
 
-    parser.add_argument(
-        "-c",
-        "--config",
-        type=Path,
-        default=None,
-        metavar="FILE",
-        help="Path to config file (default: config.yml in script directory)",
-    )
+    if args.command == "tools":
+        return run_tools(manager, args)
 
-    return parser.parse_args()
+    if args.command == "proxy":
+        return run_proxy(manager, args.action)
+
+    if args.command == "prewarm":
+        return run_prewarm(manager, args)
+
+    return run_check(manager, diff=args.diff)
 
 
 def main() -> int:
@@ -1442,12 +6309,45 @@ def main() -> int:
         return 1
 
     try:
-        manager = AgentSyncManager(config_file)
-        template_count = manager.sync_all()
-        mcp_count = manager.sync_mcp_servers()
+        tracer = SyncTracer() if (args.timings or args.trace) else None
+        manager = AgentSyncManager(
+            config_file,
+            prune_skills=args.prune,
+            tracer=tracer,
+            staged=args.staged,
+        )
+
+        if args.command is not None or args.check or args.diff:
+            return run_command(manager, args)
+
+        with manager.lock():
+            template_count = manager.sync_all(force=args.force)
+            mcp_count = manager.sync_mcp_servers()
 
         print(f"Successfully generated {template_count} template files")
+        print(f"Unchanged: {manager.stats.files_unchanged} template files")
+        print(
+            f"Parsed {manager.stats.parsed_files} template files "
+            f"({manager.stats.parse_count} parses)",
+        )
+        print(
+            f"Rendered frontmatter: {manager.stats.frontmatter_misses} rendered, "
+            f"{manager.stats.frontmatter_hits} reused",
+        )
         print(f"Successfully updated {mcp_count} MCP configuration files")
+
+        if manager.stats.mcp_files_unchanged > 0:
+            print(
+                f"Unchanged: {manager.stats.mcp_files_unchanged} "
+                f"MCP configuration files",
+            )
+
+        if tracer is not None and args.timings:
+            tracer.print_summary()
+
+        if tracer is not None and args.trace:
+            tracer.write_chrome_trace(args.trace.expanduser())
+            print(f"Wrote trace: {args.trace}")
     except FileNotFoundError as e:
         print(f"Error: {e}", file=sys.stderr)
 
@@ -1458,8 +6358,20 @@ def main() -> int:
         print(f"Error: {e}", file=sys.stderr)
 
         return 1
-    else:
-        return 0 if (template_count > 0 or mcp_count > 0) else 1
+    stats = manager.stats
+    up_to_date = (
+        stats.templates_skipped > 0
+        or stats.files_unchanged > 0
+        or stats.mcp_files_unchanged > 0
+    )
+
+    if args.watch:
+        with contextlib.suppress(KeyboardInterrupt):
+            TemplateWatcher(manager).run()
+
+        return 0
+
+    return 0 if (template_count > 0 or mcp_count > 0 or up_to_date) else 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+"""Shared fixtures for the sync-agents tests."""
+
+import importlib.util
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+from mcp_servers import MCPServerConfig
+
+SCRIPT = Path(__file__).resolve().parents[1] / "sync-agents.py"
+STUB_SERVER = Path(__file__).resolve().with_name("stub_mcp_server.py")
+
+
+def _load_script() -> ModuleType:
+    """Import sync-agents.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location("sync_agents", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    # dataclasses look their module up in sys.modules
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+@pytest.fixture(scope="session")
+def sync_agents() -> ModuleType:
+    """Return the sync-agents.py module."""
+    return sys.modules.get("sync_agents") or _load_script()
+
+
+@pytest.fixture
+def manager(
+    sync_agents: ModuleType,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> object:
+    """Return a manager for an empty config, with its cache under tmp_path."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "templates").mkdir()
+    config_file = tmp_path / "config.yml"
+    config_file.write_text("{}\n")
+
+    return sync_agents.AgentSyncManager(config_file)
+
+
+@pytest.fixture
+def stub_server() -> Callable[..., MCPServerConfig]:
+    """Return a factory of configs that start tests/stub_mcp_server.py.
+
+    Its arguments are passed to the stub, selecting how it behaves.
+    """
+
+    def make(*args: str, name: str = "stub") -> MCPServerConfig:
+        return MCPServerConfig(
+            name=name,
+            values={"command": sys.executable, "args": [str(STUB_SERVER), *args]},
+            providers={},
+        )
+
+    return make
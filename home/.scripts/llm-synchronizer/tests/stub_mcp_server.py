@@ -0,0 +1,116 @@
+"""Stand-in MCP server for the tests, speaking JSON-RPC over stdio.
+
+Options select how it misbehaves:
+
+--delay SECONDS   wait before answering each request
+--noise           print log lines and unrelated messages before each response
+--exit STATUS     exit with STATUS before reading any request
+--hang            never answer, and ignore SIGTERM
+--error JSON      answer requests with this JSON value as the error
+--tools N         offer N tools, listed by tools/list
+--page-size N     list at most N tools per tools/list page
+
+Other requests are answered with the id they arrived with, so tests can see
+how a proxy rewrote it. A progressToken in a request's _meta is sent a
+progress notification first.
+"""
+
+import argparse
+import json
+import signal
+import sys
+import time
+
+
+def _send(message: dict) -> None:
+    """Write one JSON-RPC message to stdout."""
+    print(json.dumps(message), flush=True)
+
+
+def _list_tools(args: argparse.Namespace, params: dict) -> dict:
+    """Return the page of tools that starts at params' cursor."""
+    start = int(params.get("cursor", 0))
+    end = min(start + args.page_size, args.tools)
+    page = {
+        "tools": [
+            {
+                "name": f"tool{index}",
+                "description": f"Stub tool {index}",
+                "inputSchema": {"type": "object"},
+            }
+            for index in range(start, end)
+        ],
+    }
+
+    if end < args.tools:
+        page["nextCursor"] = str(end)
+
+    return page
+
+
+def main() -> int:
+    """Answer requests on stdin until it is closed."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--noise", action="store_true")
+    parser.add_argument("--exit", type=int)
+    parser.add_argument("--hang", action="store_true")
+    parser.add_argument("--error", type=json.loads)
+    parser.add_argument("--tools", type=int)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.exit is not None:
+        return args.exit
+
+    if args.hang:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+        while True:
+            time.sleep(60)
+
+    for line in sys.stdin:
+        request = json.loads(line)
+
+        if "id" not in request:
+            continue
+
+        time.sleep(args.delay)
+
+        if args.noise:
+            print("stub starting up", flush=True)
+            _send({"jsonrpc": "2.0", "id": "other", "result": {}})
+
+        meta = (request.get("params") or {}).get("_meta") or {}
+
+        if "progressToken" in meta:
+            _send(
+                {
+                    "jsonrpc": "2.0",
+                    "method": "notifications/progress",
+                    "params": {"progressToken": meta["progressToken"], "progress": 1},
+                },
+            )
+
+        response = {"jsonrpc": "2.0", "id": request["id"]}
+
+        if args.error is not None:
+            response["error"] = args.error
+        elif request["method"] == "initialize":
+            response["result"] = {"serverInfo": {"name": "stub", "version": "1.0"}}
+
+            if args.tools is not None:
+                response["result"]["capabilities"] = {"tools": {}}
+                response["result"]["instructions"] = "Use the stub tools."
+        elif request["method"] == "tools/list" and args.tools is not None:
+            response["result"] = _list_tools(args, request.get("params") or {})
+        else:
+            response["result"] = {"receivedId": request["id"]}
+
+        _send(response)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Tests for the content-addressed backup store and the restore subcommand."""
+
+import gzip
+import lzma
+import os
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+import yaml
+
+from mcp_backups import BackupStore
+
+
+def _objects(store: BackupStore) -> list[Path]:
+    """Return the store's object files."""
+    return sorted(store.root.glob("objects/*/*"))
+
+
+def test_identical_content_is_stored_once(tmp_path: Path) -> None:
+    """Snapshots of the same content, from any file, share one object."""
+    store = BackupStore(tmp_path / "backups")
+
+    first = store.save(tmp_path / "a.json", b"{}")
+    repeated = store.save(tmp_path / "a.json", b"{}")
+    other = store.save(tmp_path / "b.json", b"{}")
+
+    assert repeated == first
+    assert other.sha256 == first.sha256
+    assert [snapshot.path for snapshot in store.snapshots()] == [
+        str(tmp_path / "a.json"),
+        str(tmp_path / "b.json"),
+    ]
+    assert len(_objects(store)) == 1
+
+
+@pytest.mark.parametrize(
+    ("compression", "suffix", "module"),
+    [("gzip", ".gz", gzip), ("lzma", ".xz", lzma)],
+)
+def test_compression(
+    tmp_path: Path,
+    compression: str,
+    suffix: str,
+    module: ModuleType,
+) -> None:
+    """Objects are written with the configured compressor and read back."""
+    store = BackupStore(tmp_path / "backups", compression=compression)
+    snapshot = store.save(tmp_path / "a.json", b'{"a": 1}')
+    [object_path] = _objects(store)
+
+    assert object_path.name == f"{snapshot.sha256}{suffix}"
+    assert module.decompress(object_path.read_bytes()) == b'{"a": 1}'
+    # A store switched to the other compressor still reads old objects
+    other = "lzma" if compression == "gzip" else "gzip"
+    assert BackupStore(store.root, compression=other).read(snapshot) == b'{"a": 1}'
+
+
+def test_unknown_compression_is_rejected() -> None:
+    """backups.compression must name a supported compressor."""
+    with pytest.raises(ValueError, match="gzip, lzma"):
+        BackupStore.from_config({"backups": {"compression": "zstd"}})
+
+
+def test_find_by_prefix(tmp_path: Path) -> None:
+    """Snapshots are found by a unique id prefix; others are rejected."""
+    store = BackupStore(tmp_path / "backups")
+    first = store.save(tmp_path / "a.json", b"1")
+    second = store.save(tmp_path / "a.json", b"2")
+    shared = os.path.commonprefix([first.id, second.id])
+
+    assert store.find(first.id) == first
+    assert store.find(second.id[: len(shared) + 1]) == second
+
+    with pytest.raises(KeyError, match="2 snapshots match"):
+        store.find(shared)
+
+    with pytest.raises(KeyError, match="No snapshots match"):
+        store.find("19700101")
+
+
+def test_corrupt_object_is_detected(tmp_path: Path) -> None:
+    """An object whose content no longer matches its digest is not restored."""
+    store = BackupStore(tmp_path / "backups")
+    snapshot = store.save(tmp_path / "a.json", b"{}")
+    [object_path] = _objects(store)
+    object_path.write_bytes(gzip.compress(b"[]"))
+
+    with pytest.raises(ValueError, match="corrupt"):
+        store.read(snapshot)
+
+
+@pytest.fixture
+def restore_manager(
+    sync_agents: ModuleType,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> object:
+    """Return a manager whose backup store is under tmp_path."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "templates").mkdir()
+    config_file = tmp_path / "config.yml"
+    config_file.write_text(
+        yaml.safe_dump({"backups": {"directory": str(tmp_path / "backups")}}),
+    )
+
+    return sync_agents.AgentSyncManager(config_file)
+
+
+def test_restore_backs_up_current_content(
+    sync_agents: ModuleType,
+    restore_manager: object,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """Restoring keeps the replaced content as a snapshot of its own."""
+    target = tmp_path / "claude.json"
+    store = restore_manager.backups
+    snapshot = store.save(target, b'{"old": true}')
+    target.write_text('{"new": true}')
+
+    assert sync_agents.run_restore(restore_manager, snapshot.id[:-2], None) == 0
+
+    assert target.read_text() == '{"old": true}'
+    replaced = store.snapshots()[-1]
+    assert store.read(replaced) == b'{"new": true}'
+    assert f"Restored {target} from snapshot {snapshot.id}" in capsys.readouterr().out
+
+    # Restoring content the file already has adds no snapshot
+    sync_agents.run_restore(restore_manager, snapshot.id, None)
+    assert store.snapshots()[-1] == replaced
+
+
+def test_restore_reports_unknown_snapshot(
+    sync_agents: ModuleType,
+    restore_manager: object,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """An id matching no snapshot is an error, and nothing is written."""
+    assert sync_agents.run_restore(restore_manager, "nope", None) == 1
+    assert "No snapshots match 'nope'" in capsys.readouterr().err
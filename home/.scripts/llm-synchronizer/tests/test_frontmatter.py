@@ -0,0 +1,102 @@
+"""Golden tests for rendered frontmatter.
+
+Each golden/frontmatter/NAME.yaml holds frontmatter fields, and NAME.expected
+the output of the original renderer, yaml.dump with the default pure-Python
+Dumper. Whichever dumper is installed, output must match it byte for byte, so
+switching PyYAML builds never rewrites generated files.
+"""
+
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+import yaml
+
+GOLDEN_DIR = Path(__file__).parent / "golden" / "frontmatter"
+CASES = sorted(GOLDEN_DIR.glob("*.yaml"))
+# Realistic frontmatter that must take the libyaml fast path
+COMMON_CASES = {"claude-agent", "opencode-agent", "skill-metadata"}
+
+golden = pytest.mark.parametrize("case", CASES, ids=lambda path: path.stem)
+
+
+def _config(case: Path) -> dict:
+    """Load a case's frontmatter fields."""
+    return yaml.safe_load(case.read_text(encoding="utf-8"))
+
+
+def _expected(case: Path) -> str:
+    """Read a case's expected output, without newline translation."""
+    return case.with_suffix(".expected").read_bytes().decode()
+
+
+@golden
+def test_render_frontmatter(sync_agents: ModuleType, case: Path) -> None:
+    """Frontmatter matches the original rendering with the installed dumper."""
+    assert sync_agents.TemplateGenerator.render_frontmatter(_config(case)) == (
+        _expected(case)
+    )
+
+
+@golden
+def test_python_dumper(
+    sync_agents: ModuleType,
+    case: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Frontmatter matches on PyYAML builds without libyaml."""
+    monkeypatch.setattr(sync_agents, "FastSafeDumper", yaml.SafeDumper)
+
+    assert sync_agents.TemplateGenerator.render_frontmatter(_config(case)) == (
+        _expected(case)
+    )
+
+
+@pytest.mark.skipif(not hasattr(yaml, "CSafeDumper"), reason="PyYAML without libyaml")
+@golden
+def test_libyaml_dumper(
+    sync_agents: ModuleType,
+    case: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Frontmatter matches with libyaml, which is only used where it agrees."""
+    monkeypatch.setattr(sync_agents, "FastSafeDumper", yaml.CSafeDumper)
+    config = _config(case)
+
+    assert sync_agents.TemplateGenerator.render_frontmatter(config) == _expected(case)
+
+    # Fields libyaml emits identically must not fall back to pure Python
+    if not sync_agents._contains_libyaml_escapes(config):
+        assert yaml.dump(
+            config,
+            Dumper=yaml.CSafeDumper,
+            default_flow_style=False,
+            sort_keys=False,
+            width=999999,
+            allow_unicode=True,
+        ) == _expected(case)
+
+
+@pytest.mark.parametrize("name", sorted(COMMON_CASES))
+def test_common_frontmatter_uses_libyaml(sync_agents: ModuleType, name: str) -> None:
+    """Typical agent, command and skill fields do not fall back to pure Python."""
+    config = _config(GOLDEN_DIR / f"{name}.yaml")
+
+    assert not sync_agents._contains_libyaml_escapes(config)
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        "",
+        "k" * 123,
+        "é" * 70,
+        "tab\tkey",
+        "don't",
+        "﻿bom",
+    ],
+    ids=["empty", "long-ascii", "long-utf8", "escaped", "quoted", "bom"],
+)
+def test_keys_emitted_differently_fall_back(sync_agents: ModuleType, key: str) -> None:
+    """Keys the emitters write in different styles select pure Python."""
+    assert sync_agents._contains_libyaml_escapes({"tools": {key: True}})
@@ -0,0 +1,129 @@
+"""Tests for the build manifest that lets syncs skip unchanged templates."""
+
+import os
+from collections.abc import Callable
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+import yaml
+
+AGENT = """\
+---
+type: agent
+shared:
+  description: Reviews code
+claude:
+  enabled: true
+---
+
+Review the code.
+"""
+
+
+@pytest.fixture
+def template(tmp_path: Path) -> Path:
+    """Return an agent template enabled for Claude."""
+    path = tmp_path / "templates" / "agents" / "reviewer.md"
+    path.parent.mkdir(parents=True)
+    path.write_text(AGENT)
+
+    return path
+
+
+@pytest.fixture
+def sync(
+    sync_agents: ModuleType,
+    template: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Callable[..., object]:
+    """Return a function running a full sync and returning its manager."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config_file = tmp_path / "config.yml"
+
+    def run(**claude: str) -> object:
+        config = {"templates_dir": str(tmp_path / "claude"), **claude}
+        config_file.write_text(yaml.safe_dump({"providers": {"claude": config}}))
+        manager = sync_agents.AgentSyncManager(config_file)
+        manager.sync_all()
+
+        return manager
+
+    return run
+
+
+@pytest.fixture
+def output(tmp_path: Path) -> Path:
+    """Return the file the template generates."""
+    return tmp_path / "claude" / "agents" / "reviewer.md"
+
+
+def test_unchanged_template_is_skipped(sync: Callable[..., object]) -> None:
+    """A second sync skips a template whose inputs and output are unchanged."""
+    assert sync().stats.templates_skipped == 0
+    assert sync().stats.templates_skipped == 1
+
+
+def test_touched_template_is_skipped(
+    sync: Callable[..., object],
+    template: Path,
+) -> None:
+    """A new mtime with the same content is caught by the content hash."""
+    sync()
+    os.utime(template, ns=(0, 0))
+
+    assert sync().stats.templates_skipped == 1
+
+
+def test_edited_output_is_rebuilt(
+    sync: Callable[..., object],
+    output: Path,
+) -> None:
+    """An output changed by hand is regenerated."""
+    sync()
+    expected = output.read_text()
+    output.write_text("edited")
+
+    assert sync().stats.templates_skipped == 0
+    assert output.read_text() == expected
+
+
+def test_config_change_rebuilds(sync: Callable[..., object]) -> None:
+    """Changing the providers section rebuilds every template."""
+    sync()
+
+    assert sync(mcp_config="claude.json").stats.templates_skipped == 0
+
+
+def test_renderer_change_rebuilds(
+    sync_agents: ModuleType,
+    sync: Callable[..., object],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Upgrading the script rebuilds templates whose inputs did not change."""
+    sync()
+    monkeypatch.setattr(sync_agents, "_renderer_hash", lambda: "upgraded")
+
+    assert sync().stats.templates_skipped == 0
+
+
+def test_stale_output_keeps_recorded_mtime(
+    sync_agents: ModuleType,
+    sync: Callable[..., object],
+    template: Path,
+    output: Path,
+    tmp_path: Path,
+) -> None:
+    """A touched template whose output fails verification is not marked fresh."""
+    manager = sync()
+    os.utime(template, ns=(0, 0))
+    output.write_text("edited")
+    manifest = sync_agents.BuildManifest.load(
+        tmp_path / sync_agents.MANIFEST_FILENAME,
+        manager._config_hash(),
+    )
+    recorded = manifest._entries[str(template)]["mtime_ns"]
+
+    assert manifest.lookup(template) is None
+    assert manifest._entries[str(template)]["mtime_ns"] == recorded
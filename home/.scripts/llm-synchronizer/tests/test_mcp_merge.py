@@ -0,0 +1,109 @@
+"""Tests for merging into MCP configs that other programs change concurrently."""
+
+import json
+import threading
+import time
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+NEW_DATA = {"mcpServers": {"stub": {"command": "stub"}}}
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(sync_agents: ModuleType, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Retry merges without waiting."""
+    monkeypatch.setattr(sync_agents, "MCP_MERGE_RETRY_DELAY", 0)
+
+
+def _edit_while_merging(
+    manager: object,
+    target: Path,
+    edits: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Make each of the next merges rewrite target with an edit after reading it."""
+    splice = manager._splice_mcp_section
+
+    def splice_then_edit(*args: object) -> bytes | None:
+        result = splice(*args)
+
+        if edits:
+            target.write_text(edits.pop(0))
+
+        return result
+
+    monkeypatch.setattr(manager, "_splice_mcp_section", splice_then_edit)
+
+
+def test_concurrent_edit_is_kept(
+    manager: object,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """A file changed between read and write is merged again from its new content."""
+    target = tmp_path / "claude.json"
+    target.write_text('{"mcpServers": {}}')
+    _edit_while_merging(
+        manager,
+        target,
+        ['{"theme": "dark", "mcpServers": {}}'],
+        monkeypatch,
+    )
+
+    success, snapshot = manager.merge_json_file(target, NEW_DATA, "mcpServers")
+
+    assert success
+    assert json.loads(target.read_text()) == {"theme": "dark", **NEW_DATA}
+    assert manager.backups.read(snapshot) == b'{"theme": "dark", "mcpServers": {}}'
+    assert f"{target} changed while merging, retrying" in capsys.readouterr().out
+
+
+def test_merge_gives_up_on_a_file_that_keeps_changing(
+    sync_agents: ModuleType,
+    manager: object,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """After MCP_MERGE_ATTEMPTS lost races the merge fails and writes nothing."""
+    target = tmp_path / "claude.json"
+    target.write_text("{}")
+    edits = [
+        json.dumps({"edit": "x" * attempt})
+        for attempt in range(1, sync_agents.MCP_MERGE_ATTEMPTS + 1)
+    ]
+    _edit_while_merging(manager, target, list(edits), monkeypatch)
+
+    assert manager.merge_json_file(target, NEW_DATA, "mcpServers") == (False, None)
+    assert target.read_text() == edits[-1]
+    assert "kept changing" in capsys.readouterr().err
+
+
+def test_sync_lock_waits_for_holder(
+    sync_agents: ModuleType,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """A second sync waits until the first releases the lock."""
+    lock_path = tmp_path / "sync.lock"
+    acquired = []
+
+    def second_sync() -> None:
+        with sync_agents.sync_lock(lock_path):
+            acquired.append(time.monotonic())
+
+    with sync_agents.sync_lock(lock_path):
+        thread = threading.Thread(target=second_sync)
+        thread.start()
+        time.sleep(0.3)
+        assert not acquired
+        released = time.monotonic()
+
+    thread.join(timeout=10)
+
+    assert acquired
+    assert acquired[0] >= released
+    assert "Waiting for another sync to finish" in capsys.readouterr().err
@@ -0,0 +1,157 @@
+"""Table-driven tests for parsing the uvx and npx command lines prewarm pins."""
+
+import pytest
+
+from mcp_prewarm import (
+    LauncherCommand,
+    PrewarmError,
+    _npm_package_name,
+    parse_launcher_command,
+)
+
+PARSED = {
+    "uvx-plain": (
+        ["uvx", "mcp-server-git", "--repository", "."],
+        LauncherCommand(
+            "uvx",
+            ["mcp-server-git"],
+            "mcp-server-git",
+            ["--repository", "."],
+        ),
+    ),
+    "uvx-version": (
+        ["uvx", "mcp-server-time@2025.1.0"],
+        LauncherCommand("uvx", ["mcp-server-time==2025.1.0"], "mcp-server-time", []),
+    ),
+    "uvx-latest": (
+        ["uvx", "mcp-server-time@latest"],
+        LauncherCommand("uvx", ["mcp-server-time"], "mcp-server-time", []),
+    ),
+    "uvx-extras": (
+        ["uvx", "markitdown-mcp[all]@0.1.2"],
+        LauncherCommand("uvx", ["markitdown-mcp[all]==0.1.2"], "markitdown-mcp", []),
+    ),
+    "uvx-from": (
+        [
+            "uvx",
+            "--from",
+            "git+https://github.com/Kapeli/dash-mcp-server.git",
+            "dash-mcp-server",
+        ],
+        LauncherCommand(
+            "uvx",
+            ["git+https://github.com/Kapeli/dash-mcp-server.git"],
+            "dash-mcp-server",
+            [],
+        ),
+    ),
+    "uvx-from-equals-with": (
+        ["uvx", "--from=serena==1.0", "--with", "numpy", "--with=rich", "serena"],
+        LauncherCommand("uvx", ["serena==1.0", "numpy", "rich"], "serena", []),
+    ),
+    "uvx-python": (
+        ["uvx", "-p", "3.12", "--quiet", "mcp-server-fetch"],
+        LauncherCommand(
+            "uvx",
+            ["mcp-server-fetch"],
+            "mcp-server-fetch",
+            [],
+            python="3.12",
+        ),
+    ),
+    "uvx-index": (
+        ["uvx", "--index-url", "https://pypi.example/simple", "tool", "--flag"],
+        LauncherCommand(
+            "uvx",
+            ["tool"],
+            "tool",
+            ["--flag"],
+            install_options=["--index-url", "https://pypi.example/simple"],
+        ),
+    ),
+    "uvx-double-dash": (
+        ["uvx", "--isolated", "--", "tool", "-x"],
+        LauncherCommand("uvx", ["tool"], "tool", ["-x"]),
+    ),
+    "uv-tool-run": (
+        ["uv", "tool", "run", "--python=3.11", "tool@1.0"],
+        LauncherCommand("uvx", ["tool==1.0"], "tool", [], python="3.11"),
+    ),
+    "npx-plain": (
+        ["npx", "-y", "@modelcontextprotocol/server-memory"],
+        LauncherCommand("npx", ["@modelcontextprotocol/server-memory"], None, []),
+    ),
+    "npx-scoped-version": (
+        ["npx", "-y", "@upstash/context7-mcp@1.0.14", "--transport", "stdio"],
+        LauncherCommand(
+            "npx",
+            ["@upstash/context7-mcp@1.0.14"],
+            None,
+            ["--transport", "stdio"],
+        ),
+    ),
+    "npx-package": (
+        ["npx", "--package", "@playwright/mcp@0.0.30", "-p=sharp", "mcp-server-pw"],
+        LauncherCommand(
+            "npx",
+            ["@playwright/mcp@0.0.30", "sharp"],
+            "mcp-server-pw",
+            [],
+        ),
+    ),
+    "npx-path": (
+        ["/usr/local/bin/npx", "--yes", "server@2"],
+        LauncherCommand("npx", ["server@2"], None, []),
+    ),
+    "other": (["node", "server.js"], None),
+    "uv-run": (["uv", "run", "server.py"], None),
+}
+
+ERRORS = {
+    "unsupported-uvx-option": (["uvx", "--editable", "tool"], "Unsupported uvx option"),
+    "short-option-with-value": (["uvx", "-p3.12", "tool"], "Unsupported uvx option"),
+    "missing-value": (["uvx", "--from"], "uvx --from needs a value"),
+    "uvx-no-command": (["uvx", "--isolated"], "uvx is not given a command"),
+    "npx-no-command": (["npx", "-y"], "npx is not given a command"),
+    "unsupported-npx-option": (["npx", "--call", "x"], "Unsupported npx option"),
+}
+
+
+@pytest.mark.parametrize(
+    ("argv", "expected"),
+    list(PARSED.values()),
+    ids=list(PARSED),
+)
+def test_parse_launcher_command(
+    argv: list[str],
+    expected: LauncherCommand | None,
+) -> None:
+    """Launcher options, package specs and server arguments are told apart."""
+    values = {"command": argv[0], "args": argv[1:]}
+
+    assert parse_launcher_command(values) == expected
+
+
+@pytest.mark.parametrize(
+    ("argv", "message"),
+    list(ERRORS.values()),
+    ids=list(ERRORS),
+)
+def test_unpinnable_commands_are_rejected(argv: list[str], message: str) -> None:
+    """Options prewarm cannot reproduce are errors, not silently dropped."""
+    with pytest.raises(PrewarmError, match=message):
+        parse_launcher_command({"command": argv[0], "args": argv[1:]})
+
+
+@pytest.mark.parametrize(
+    ("spec", "name"),
+    [
+        ("server", "server"),
+        ("server@2", "server"),
+        ("@scope/server", "@scope/server"),
+        ("@scope/server@1.0.0", "@scope/server"),
+    ],
+)
+def test_npm_package_name(spec: str, name: str) -> None:
+    """Versions are stripped from npm specs, scopes are kept."""
+    assert _npm_package_name(spec) == name
@@ -0,0 +1,88 @@
+"""Tests for probing local MCP servers, run against tests/stub_mcp_server.py."""
+
+import signal
+import time
+from collections.abc import Callable
+
+import pytest
+
+from mcp_probe import probe_mcp_server
+from mcp_servers import MCPServerConfig, spawn_mcp_server, stop_process_group
+
+StubServer = Callable[..., MCPServerConfig]
+
+
+@pytest.mark.parametrize("args", [(), ("--noise",)], ids=["fast", "stdout-noise"])
+def test_probe_measures_startup(stub_server: StubServer, args: tuple[str]) -> None:
+    """Log lines and other messages on stdout are skipped."""
+    result = probe_mcp_server(stub_server(*args), timeout=10)
+
+    assert result.error is None
+    assert result.server_info == "stub 1.0"
+    assert result.spawn_ms is not None
+    assert result.response_ms >= result.spawn_ms
+
+
+def test_slow_server_is_timed(stub_server: StubServer) -> None:
+    """The response time includes the server's startup delay."""
+    result = probe_mcp_server(stub_server("--delay", "0.3"), timeout=10)
+
+    assert result.error is None
+    assert result.response_ms >= 300
+
+
+@pytest.mark.parametrize("args", [("--delay", "5"), ("--hang",)], ids=["slow", "hang"])
+def test_probe_times_out(stub_server: StubServer, args: tuple[str, ...]) -> None:
+    """A server that does not answer in time is reported and stopped."""
+    start = time.perf_counter()
+    result = probe_mcp_server(stub_server(*args), timeout=0.3)
+
+    assert result.error == "no initialize response in time"
+    assert result.response_ms is None
+    # Only a server ignoring SIGTERM waits for the SIGKILL
+    assert time.perf_counter() - start < 4
+
+
+def test_hanging_server_is_killed(stub_server: StubServer) -> None:
+    """Servers ignoring SIGTERM are killed."""
+    process = spawn_mcp_server(stub_server("--hang").values)
+    # Give the stub time to ignore SIGTERM
+    time.sleep(0.5)
+
+    stop_process_group(process)
+
+    assert process.returncode == -signal.SIGKILL
+
+
+def test_early_exit_is_reported(stub_server: StubServer) -> None:
+    """A server exiting before its response reports its exit status."""
+    result = probe_mcp_server(stub_server("--exit", "3"), timeout=10)
+
+    assert result.error == "exited before responding (status 3)"
+
+
+@pytest.mark.parametrize(
+    "error",
+    ['{"code": -32603, "message": "boom"}', '"boom"'],
+    ids=["object", "string"],
+)
+def test_error_response_is_reported(stub_server: StubServer, error: str) -> None:
+    """Error objects show their message; other error values are shown as is."""
+    result = probe_mcp_server(stub_server("--error", error), timeout=10)
+
+    assert result.error == "initialize failed: boom"
+    assert result.server_info is None
+
+
+def test_missing_command_is_reported() -> None:
+    """A command that cannot be executed fails before anything is timed."""
+    server = MCPServerConfig(
+        name="missing",
+        values={"command": "/nonexistent/mcp-server"},
+        providers={},
+    )
+
+    result = probe_mcp_server(server)
+
+    assert "No such file or directory" in result.error
+    assert result.spawn_ms is None
@@ -0,0 +1,249 @@
+"""Tests for the MCP proxy, with sessions run through mcp-proxy-connect.py.
+
+The first client starts the proxy (sync-agents.py proxy serve), which pools
+tests/stub_mcp_server.py for every session.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+import yaml
+
+from mcp_proxy import PROXY_CLIENT, proxy_request
+
+SCRIPT = Path(__file__).resolve().parents[1] / "sync-agents.py"
+STUB_SERVER = Path(__file__).resolve().with_name("stub_mcp_server.py")
+IDLE_TIMEOUT = 0.5
+
+
+class Session:
+    """A provider CLI's stdio connection to one proxied server."""
+
+    def __init__(self, socket_path: Path) -> None:
+        config_file = socket_path.with_name("config.yml")
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                str(PROXY_CLIENT),
+                str(socket_path),
+                "stub",
+                *(sys.executable, str(SCRIPT), "--config", str(config_file)),
+                *("proxy", "serve"),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self._buffer = b""
+
+    def send(self, message: dict[str, Any]) -> None:
+        """Write one JSON-RPC message to the client's stdin."""
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+        self.process.stdin.flush()
+
+    def receive(self, timeout: float = 10) -> dict[str, Any] | None:
+        """Return the next message, or None if none arrives in time."""
+        fd = self.process.stdout.fileno()
+        deadline = time.monotonic() + timeout
+
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+
+            chunk = os.read(fd, 65536)
+
+            if not chunk:
+                return None
+
+            self._buffer += chunk
+
+        line, self._buffer = self._buffer.split(b"\n", 1)
+
+        return json.loads(line)
+
+    def request(self, request_id: int, method: str, **params: Any) -> dict[str, Any]:
+        """Send a request and return its response."""
+        self.send(
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        )
+
+        return self.receive()
+
+    def initialize(self) -> dict[str, Any]:
+        """Run the initialize handshake and return the initialize result."""
+        response = self.request(0, "initialize", protocolVersion="2025-06-18")
+        self.send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+        return response["result"]
+
+    def close(self) -> None:
+        """End the session like a provider CLI exiting."""
+        self.process.stdin.close()
+        self.process.wait(timeout=10)
+        self.process.stdout.close()
+
+
+@pytest.fixture
+def socket_path(tmp_path: Path) -> Iterator[Path]:
+    """Return the socket of a proxy for a config with one stub server."""
+    path = tmp_path / "proxy.sock"
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "config.yml").write_text(
+        yaml.safe_dump(
+            {
+                "mcp_proxy": {
+                    "enabled": True,
+                    "socket": str(path),
+                    "idle_timeout": IDLE_TIMEOUT,
+                },
+                "mcp_servers": {
+                    "stub": {
+                        "values": {
+                            "command": sys.executable,
+                            "args": [str(STUB_SERVER)],
+                        },
+                        "providers": {"claude": {"enabled": True}},
+                    },
+                },
+            },
+        ),
+    )
+
+    yield path
+
+    with contextlib.suppress(OSError):
+        proxy_request(path, {"command": "stop"})
+
+
+def _wait_for(condition: Any, timeout: float = 10) -> bool:
+    """Poll condition until it returns true or timeout seconds pass."""
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.05)
+
+    return True
+
+
+def test_sessions_share_one_server(socket_path: Path) -> None:
+    """Clients starting at once start one proxy, which starts one server."""
+    sessions = [Session(socket_path) for _ in range(4)]
+    results = [session.initialize() for session in sessions]
+    status = proxy_request(socket_path, {"command": "status"})
+
+    assert results == [{"serverInfo": {"name": "stub", "version": "1.0"}}] * 4
+    assert status["sessions"] == 4
+    assert [server["sessions"] for server in status["servers"]] == [4]
+
+    for session in sessions:
+        session.close()
+
+
+def test_request_ids_stay_unique(socket_path: Path) -> None:
+    """Sessions reusing ids get their own responses, with their own ids."""
+    first, second = (Session(socket_path) for _ in range(2))
+    first.initialize()
+    second.initialize()
+
+    first.send({"jsonrpc": "2.0", "id": 1, "method": "tools/list"})
+    second.send({"jsonrpc": "2.0", "id": 1, "method": "tools/list"})
+    responses = [first.receive(), second.receive()]
+
+    assert [response["id"] for response in responses] == [1, 1]
+    server_ids = {response["result"]["receivedId"] for response in responses}
+    assert len(server_ids) == 2
+    assert first.receive(timeout=0.2) is None
+    assert second.receive(timeout=0.2) is None
+
+    first.close()
+    second.close()
+
+
+def test_progress_reaches_its_session(socket_path: Path) -> None:
+    """Progress notifications go to the session that asked, with its token."""
+    first, second = (Session(socket_path) for _ in range(2))
+    first.initialize()
+    second.initialize()
+
+    for session in (first, second):
+        session.send(
+            {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "tools/call",
+                "params": {"_meta": {"progressToken": "token"}},
+            },
+        )
+
+    for session in (first, second):
+        progress = session.receive()
+        assert progress["method"] == "notifications/progress"
+        assert progress["params"]["progressToken"] == "token"
+        assert session.receive()["id"] == 1
+        assert session.receive(timeout=0.2) is None
+
+    first.close()
+    second.close()
+
+
+def test_server_stops_after_last_session(socket_path: Path) -> None:
+    """The server outlives one leaving session, then idles out after the last."""
+    first, second = (Session(socket_path) for _ in range(2))
+    first.initialize()
+    second.initialize()
+    status = proxy_request(socket_path, {"command": "status"})
+    server_pid = status["servers"][0]["pid"]
+
+    first.close()
+    time.sleep(IDLE_TIMEOUT * 2)
+
+    assert second.request(1, "tools/list")["result"]
+    assert (
+        proxy_request(socket_path, {"command": "status"})["servers"][0]["pid"]
+        == server_pid
+    )
+
+    second.close()
+
+    def server_stopped() -> bool:
+        try:
+            os.kill(server_pid, 0)
+        except ProcessLookupError:
+            return True
+
+        return False
+
+    assert _wait_for(server_stopped)
+    # With no servers left, the proxy exits and removes its socket
+    assert _wait_for(lambda: not socket_path.exists())
+
+
+def test_start_is_retried_while_old_proxy_exits(socket_path: Path) -> None:
+    """A proxy started while an exiting one holds its lock is started again."""
+    lock_file = socket_path.with_name(socket_path.name + ".lock").open("a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    # The old proxy has removed its socket, and releases the lock once its
+    # servers are stopped
+    threading.Timer(1.5, lock_file.close).start()
+    start = time.monotonic()
+    session = Session(socket_path)
+
+    assert session.initialize()["serverInfo"]["name"] == "stub"
+    assert time.monotonic() - start < 5
+
+    session.close()
@@ -0,0 +1,164 @@
+"""Tests for splicing MCP sections into provider config files.
+
+A spliced document must decode to the same config as a full merge, and keep
+every byte outside the MCP section as it was.
+"""
+
+import json
+from types import ModuleType
+
+import pytest
+
+MCP_KEY = "mcpServers"
+SERVERS = {"fetch": {"command": "uvx", "args": ["mcp-server-fetch"]}}
+
+DOCUMENTS = {
+    "indented": json.dumps(
+        {"theme": "dark", MCP_KEY: {"old": {"command": "old"}}, "zoom": 1.5},
+        indent=2,
+    )
+    + "\n",
+    "four-space": json.dumps(
+        {"theme": "dark", MCP_KEY: {}, "nested": {"a": [1, 2]}},
+        indent=4,
+    ),
+    "compact": json.dumps(
+        {"theme": "dark", MCP_KEY: {"old": {"command": "old"}}},
+        separators=(",", ":"),
+    ),
+    "non-ascii": json.dumps(
+        {"name": "café ☕", MCP_KEY: {"old": {"command": "ö"}}, "emoji": "🚀"},
+        indent=2,
+        ensure_ascii=False,
+    ),
+}
+
+
+def _splice(manager: object, existing: bytes, servers: dict) -> bytes | None:
+    """Splice servers into existing as the MCP section."""
+    return manager._splice_mcp_section(existing, {MCP_KEY: servers}, MCP_KEY)
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_splice_matches_full_merge(
+    sync_agents: ModuleType,
+    manager: object,
+    name: str,
+) -> None:
+    """Only the MCP value changes, and the result decodes like a full merge."""
+    existing = DOCUMENTS[name].encode()
+    layout = sync_agents.scan_json_object(existing)
+    _, value_start, value_end = layout.members[MCP_KEY]
+
+    spliced = _splice(manager, existing, SERVERS)
+
+    expected = json.loads(existing) | {MCP_KEY: SERVERS}
+    assert json.loads(spliced) == expected
+    assert list(json.loads(spliced)) == list(expected)
+    assert spliced.startswith(existing[:value_start])
+    assert spliced.endswith(existing[value_end:])
+
+
+def test_indented_splice_matches_full_rewrite(manager: object) -> None:
+    """A document written by a full rewrite stays identical to one."""
+    existing = DOCUMENTS["indented"].encode()
+    expected = json.loads(existing) | {MCP_KEY: SERVERS}
+    full_rewrite = (json.dumps(expected, indent=2) + "\n").encode()
+
+    assert _splice(manager, existing, SERVERS) == full_rewrite
+
+
+def test_compact_splice_stays_compact(manager: object) -> None:
+    """Members of compact documents are serialized compactly."""
+    spliced = _splice(manager, DOCUMENTS["compact"].encode(), SERVERS)
+
+    assert b"\n" not in spliced
+    assert b'"mcpServers":{"fetch":{"command":"uvx"' in spliced
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_current_section_is_unchanged(manager: object, name: str) -> None:
+    """A section that is already current returns the document itself."""
+    existing = DOCUMENTS[name].encode()
+    current = json.loads(existing)[MCP_KEY]
+
+    assert _splice(manager, existing, current) is existing
+
+
+@pytest.mark.parametrize(
+    ("existing", "expected"),
+    [
+        (
+            b'{\n  "theme": "dark"\n}\n',
+            (
+                b'{\n  "theme": "dark",\n  "mcpServers": {\n'
+                b'    "fetch": {\n      "command": "uvx",\n'
+                b'      "args": [\n        "mcp-server-fetch"\n      ]\n'
+                b"    }\n  }\n}\n"
+            ),
+        ),
+        (
+            b'{"theme":"dark"}',
+            (
+                b'{"theme":"dark","mcpServers":'
+                b'{"fetch":{"command":"uvx","args":["mcp-server-fetch"]}}}'
+            ),
+        ),
+    ],
+    ids=["indented", "compact"],
+)
+def test_missing_section_is_appended(
+    manager: object,
+    existing: bytes,
+    expected: bytes,
+) -> None:
+    """A missing section becomes the last member, where a full merge puts it."""
+    assert _splice(manager, existing, SERVERS) == expected
+
+
+@pytest.mark.parametrize(
+    "existing",
+    [
+        b'{"mcpServers": {}, "mcpServers": {}}',
+        b'{"theme": "dark", "theme": "light"}',
+    ],
+    ids=["duplicate-mcp-key", "duplicate-other-key"],
+)
+def test_duplicate_keys_need_full_merge(
+    sync_agents: ModuleType,
+    manager: object,
+    existing: bytes,
+) -> None:
+    """Documents with duplicate keys are not spliced."""
+    assert sync_agents.scan_json_object(existing) is None
+    assert _splice(manager, existing, SERVERS) is None
+
+
+@pytest.mark.parametrize(
+    "existing",
+    [b"", b"{}", b"[]", b'{"a": 1', b'{"a": 1} {}', b'{"a": 1,}', b"\xff{}"],
+    ids=["empty", "empty-object", "array", "truncated", "trailing", "comma", "bytes"],
+)
+def test_unsplicable_documents_need_full_merge(
+    manager: object,
+    existing: bytes,
+) -> None:
+    """Malformed or empty documents fall back to a full merge."""
+    assert _splice(manager, existing, SERVERS) is None
+
+
+def test_other_provider_key_needs_full_merge(manager: object) -> None:
+    """Another provider's MCP section must be migrated by a full merge."""
+    assert _splice(manager, b'{"mcp": {}}', SERVERS) is None
+
+
+def test_non_ascii_offsets_are_bytes(sync_agents: ModuleType) -> None:
+    """Offsets index the encoded document, not its decoded text."""
+    existing = DOCUMENTS["non-ascii"].encode()
+    layout = sync_agents.scan_json_object(existing)
+
+    for key, (key_start, value_start, value_end) in layout.members.items():
+        assert json.loads(existing[key_start:value_start].rstrip(b": \n")) == key
+        assert json.loads(existing[value_start:value_end]) == json.loads(existing)[key]
+
+    assert existing[layout.end : layout.end + 1] == b"}"
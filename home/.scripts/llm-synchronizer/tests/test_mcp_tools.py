@@ -0,0 +1,165 @@
+"""Tests for tool manifests, their cache and the tools subcommand's costs."""
+
+import math
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+import yaml
+
+from mcp_servers import MCPServerConfig
+from mcp_tools import (
+    CHARS_PER_TOKEN,
+    ToolManifest,
+    ToolManifestCache,
+    fetch_tool_manifest,
+)
+
+StubServer = Callable[..., MCPServerConfig]
+STUB_SERVER = Path(__file__).resolve().with_name("stub_mcp_server.py")
+
+
+def test_pages_are_fetched(stub_server: StubServer) -> None:
+    """tools/list is repeated with each nextCursor until the last page."""
+    manifest = fetch_tool_manifest(
+        stub_server("--tools", "5", "--page-size", "2"),
+        timeout=10,
+    )
+
+    assert [tool["name"] for tool in manifest.tools] == [f"tool{i}" for i in range(5)]
+    assert manifest.server_info == "stub 1.0"
+    assert manifest.instructions == "Use the stub tools."
+
+
+def test_server_without_tools_capability(stub_server: StubServer) -> None:
+    """Servers that do not declare tools are not asked for them."""
+    manifest = fetch_tool_manifest(stub_server(), timeout=10)
+
+    assert manifest.tools == []
+    assert manifest.estimate_tokens() == 0
+
+
+def test_token_estimate_counts_model_visible_fields() -> None:
+    """Names, descriptions, schemas and instructions count; other keys don't."""
+    manifest = ToolManifest(
+        server_info="stub 1.0",
+        instructions="Use search first.",
+        tools=[
+            {
+                "name": "search",
+                "description": "Search the docs",
+                "inputSchema": {"type": "object"},
+                "annotations": {"readOnlyHint": True},
+            },
+        ],
+        fetched="2026-01-01T00:00:00+00:00",
+    )
+    definitions = (
+        '[{"name":"search","description":"Search the docs",'
+        '"inputSchema":{"type":"object"}}]'
+    )
+
+    assert manifest.estimate_tokens() == math.ceil(
+        (len(definitions) + len("Use search first.")) / CHARS_PER_TOKEN,
+    )
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        {"args": ["--other"]},
+        {"env": {"TOKEN": "${env:OTHER_TOKEN}"}},
+        {"cwd": "/srv"},
+        {"command": "python3-other"},
+    ],
+    ids=["args", "env", "cwd", "command"],
+)
+def test_cache_key_follows_server_command(change: dict) -> None:
+    """Editing how a server is started gives it a new cache key."""
+    values = {"command": sys.executable, "args": ["-m", "server"], "env": {}}
+    server = MCPServerConfig("stub", values, {})
+    changed = MCPServerConfig("stub", values | change, {})
+
+    assert ToolManifestCache.key(server) == ToolManifestCache.key(
+        MCPServerConfig("renamed", dict(values), {"claude": {"enabled": True}}),
+    )
+    assert ToolManifestCache.key(changed) != ToolManifestCache.key(server)
+
+
+def test_cache_round_trip(tmp_path: Path) -> None:
+    """Stored manifests are returned until the cache format changes."""
+    cache = ToolManifestCache(tmp_path / "cache")
+    manifest = ToolManifest("stub 1.0", None, [{"name": "tool0"}], "2026-01-01")
+
+    assert cache.get("key") is None
+
+    cache.put("key", manifest)
+    assert cache.get("key") == manifest
+
+    (tmp_path / "cache" / "key.json").write_text('{"version": 0, "manifest": {}}')
+    assert cache.get("key") is None
+
+
+@pytest.fixture
+def tools_manager(
+    sync_agents: ModuleType,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Callable[..., object]:
+    """Return a factory of managers for a config with one paginated stub."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "templates").mkdir()
+    config_file = tmp_path / "config.yml"
+
+    def make(*args: str) -> object:
+        config = {
+            "providers": {"claude": {"mcp_config": str(tmp_path / "claude.json")}},
+            "mcp_servers": {
+                "stub": {
+                    "values": {
+                        "command": sys.executable,
+                        "args": [str(STUB_SERVER), "--page-size", "2", *args],
+                    },
+                    "providers": {"claude": {"enabled": True}},
+                },
+            },
+        }
+        config_file.write_text(yaml.safe_dump(config))
+
+        return sync_agents.AgentSyncManager(config_file)
+
+    return make
+
+
+def test_costs_are_cached_per_command(tools_manager: Callable[..., object]) -> None:
+    """Manifests are reused until the server's command line changes."""
+    first = tools_manager("--tools", "5").measure_tool_costs(timeout=10)
+    cached = tools_manager("--tools", "5").measure_tool_costs(timeout=10)
+    changed = tools_manager("--tools", "3").measure_tool_costs(timeout=10)
+
+    assert [(cost.tools, cost.cached) for cost in first] == [(5, False)]
+    assert cached == [first[0]._replace(cached=True)]
+    assert [(cost.tools, cost.cached) for cost in changed] == [(3, False)]
+    assert first[0].providers == ["claude"]
+    assert 0 < changed[0].tokens < first[0].tokens
+
+
+def test_refresh_ignores_cache(tools_manager: Callable[..., object]) -> None:
+    """--refresh queries servers even when their manifest is cached."""
+    manager = tools_manager("--tools", "1")
+    manager.measure_tool_costs(timeout=10)
+
+    assert not manager.measure_tool_costs(refresh=True, timeout=10)[0].cached
+
+
+def test_failed_fetch_is_reported(tools_manager: Callable[..., object]) -> None:
+    """A server that fails is reported with its error and nothing is cached."""
+    manager = tools_manager("--exit", "2")
+
+    costs = manager.measure_tool_costs(timeout=10)
+
+    assert costs[0].error == "exited before responding (status 2)"
+    assert costs[0].tokens is None
+    assert manager.measure_tool_costs(timeout=10)[0].cached is False
@@ -0,0 +1,69 @@
+"""Tests for comparing and masking MCP sections without resolving secrets."""
+
+import os
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+TEMPLATE = {
+    "command": "tool",
+    "args": ["--key", "${env:TOOL_KEY}"],
+    "env": {"AUTH": "Bearer ${pass:api/token}", "DEBUG": True},
+}
+RESOLVED = {
+    "command": "tool",
+    "args": ["--key", "s3cret"],
+    "env": {"AUTH": "Bearer t0ken\nline", "DEBUG": True},
+}
+
+
+def test_resolved_value_matches_template(sync_agents: ModuleType) -> None:
+    """Each placeholder matches whatever it resolved to."""
+    assert sync_agents.SecretResolver.matches(TEMPLATE, RESOLVED)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        RESOLVED | {"command": "other"},
+        RESOLVED | {"env": {"AUTH": "Basic t0ken", "DEBUG": True}},
+        RESOLVED | {"env": {"AUTH": "Bearer t0ken", "DEBUG": 1}},
+        RESOLVED | {"args": ["--key"]},
+        {key: value for key, value in RESOLVED.items() if key != "env"},
+    ],
+    ids=["literal", "around-placeholder", "type", "length", "missing-key"],
+)
+def test_changed_value_does_not_match(sync_agents: ModuleType, value: dict) -> None:
+    """Anything besides the placeholders themselves must be equal."""
+    assert not sync_agents.SecretResolver.matches(TEMPLATE, value)
+
+
+def test_mask_hides_resolved_values(sync_agents: ModuleType) -> None:
+    """Matching strings show their placeholders; other strings are masked."""
+    mask = sync_agents.SECRET_MASK
+    existing = {"tool": RESOLVED | {"command": "old"}, "removed": {"key": "x"}}
+
+    assert sync_agents.SecretResolver.mask({"tool": TEMPLATE}, existing) == {
+        "tool": TEMPLATE | {"command": mask},
+        "removed": {"key": mask},
+    }
+
+
+@pytest.mark.parametrize(("private", "mode"), [(True, 0o600), (False, 0o644)])
+def test_new_file_mode(
+    manager: object,
+    tmp_path: Path,
+    private: bool,
+    mode: int,
+) -> None:
+    """New config files holding resolved secrets are only readable by the owner."""
+    target = tmp_path / "settings.json"
+    old_umask = os.umask(0o022)
+
+    try:
+        assert manager._write_json_atomic(target, {}, expected=None, private=private)
+    finally:
+        os.umask(old_umask)
+
+    assert target.stat().st_mode & 0o777 == mode
@@ -0,0 +1,250 @@
+"""Tests for staged syncs: the directory swap, concurrent edits and rollback."""
+
+import errno
+import os
+from collections.abc import Callable
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+import yaml
+
+AGENT = """\
+---
+type: agent
+shared:
+  description: {description}
+claude:
+  enabled: true
+---
+
+Review the code.
+"""
+
+
+@pytest.fixture
+def live(tmp_path: Path) -> Path:
+    """Return a managed directory holding one file another program created."""
+    path = tmp_path / "agents"
+    path.mkdir()
+    (path / "mine.md").write_text("mine")
+
+    return path
+
+
+def _staging(sync_agents: ModuleType, live: Path) -> object:
+    """Return a staging tree for live, with a change staged to new.md."""
+    staging = sync_agents.StagedOutputTree([live])
+    staging.path(live / "new.md", write=True).write_text("new")
+
+    return staging
+
+
+def test_live_directory_changes_at_commit(
+    sync_agents: ModuleType,
+    live: Path,
+) -> None:
+    """Staged changes reach the live directory only when committed."""
+    staging = _staging(sync_agents, live)
+    staged_dir = staging.path(live)
+    inode = (live / "mine.md").stat().st_ino
+
+    assert sorted(path.name for path in live.iterdir()) == ["mine.md"]
+
+    staging.commit()
+
+    assert sorted(path.name for path in live.iterdir()) == ["mine.md", "new.md"]
+    # Untouched files are linked across, not copied
+    assert (live / "mine.md").stat().st_ino == inode
+    assert not staged_dir.exists()
+
+
+def test_missing_directory_is_created(sync_agents: ModuleType, tmp_path: Path) -> None:
+    """A managed directory that does not exist yet is renamed into place."""
+    live = tmp_path / "agents"
+    staging = sync_agents.StagedOutputTree([live])
+    staging.path(live / "new.md", write=True).write_text("new")
+
+    staging.commit()
+
+    assert (live / "new.md").read_text() == "new"
+
+
+def test_concurrent_changes_are_kept(sync_agents: ModuleType, live: Path) -> None:
+    """Files written to the live directory during the sync survive the swap."""
+    (live / "other.md").write_text("other")
+    (live / "gone.md").write_text("gone")
+    staging = _staging(sync_agents, live)
+    (live / "added.md").write_text("added")
+    (live / "mine.md").write_text("edited")
+    (live / "gone.md").unlink()
+    # The sync and another program both write new.md; the sync wins
+    (live / "new.md").write_text("theirs")
+    (live / "sub").mkdir()
+    (live / "sub" / "nested.md").write_text("nested")
+
+    staging.commit()
+
+    assert {path.name: path.read_text() for path in live.glob("*.md")} == {
+        "added.md": "added",
+        "mine.md": "edited",
+        "new.md": "new",
+        "other.md": "other",
+    }
+    assert (live / "sub" / "nested.md").read_text() == "nested"
+
+
+def test_sync_edit_wins_over_concurrent_edit(
+    sync_agents: ModuleType,
+    live: Path,
+) -> None:
+    """A file both the sync and another program replaced keeps the sync's copy."""
+    staging = sync_agents.StagedOutputTree([live])
+    staged = staging.path(live / "mine.md", write=True)
+    staged.unlink()
+    staged.write_text("synced")
+    (live / "mine.md").write_text("theirs")
+
+    staging.commit()
+
+    assert (live / "mine.md").read_text() == "synced"
+
+
+def test_failed_exchange_leaves_live_directory(
+    sync_agents: ModuleType,
+    live: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A filesystem that cannot exchange directories fails the commit cleanly."""
+
+    def unsupported(first: Path, second: Path) -> None:
+        raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), str(first))
+
+    monkeypatch.setattr(sync_agents, "_exchange_paths", unsupported)
+    staging = _staging(sync_agents, live)
+    staged_dir = staging.path(live)
+
+    with pytest.raises(OSError, match="Invalid argument"):
+        staging.commit()
+
+    assert sorted(path.name for path in live.iterdir()) == ["mine.md"]
+
+    staging.abort()
+    assert not staged_dir.exists()
+
+
+def test_exchange_swaps_directories(sync_agents: ModuleType, tmp_path: Path) -> None:
+    """renameat2 is called with its argument types and swaps both paths."""
+    if not sync_agents.StagedOutputTree.supported():
+        pytest.skip("renameat2 is not available")
+
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    (first / "a").touch()
+
+    sync_agents._exchange_paths(first, second)
+
+    assert [path.name for path in second.iterdir()] == ["a"]
+    assert not any(first.iterdir())
+
+    with pytest.raises(FileNotFoundError):
+        sync_agents._exchange_paths(first, tmp_path / "missing")
+
+
+@pytest.fixture
+def staged_manager(
+    sync_agents: ModuleType,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Callable[..., object]:
+    """Return a factory of staged managers generating one Claude agent."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "templates" / "agents").mkdir(parents=True)
+    (tmp_path / "templates" / "agents" / "reviewer.md").write_text(
+        AGENT.format(description="Reviews code"),
+    )
+    config_file = tmp_path / "config.yml"
+    config_file.write_text(
+        yaml.safe_dump(
+            {"providers": {"claude": {"templates_dir": str(tmp_path / "claude")}}},
+        ),
+    )
+
+    def make() -> object:
+        return sync_agents.AgentSyncManager(config_file, staged=True)
+
+    return make
+
+
+def test_failed_sync_is_rolled_back(
+    sync_agents: ModuleType,
+    staged_manager: Callable[..., object],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Outputs of a sync that fails before its commit are discarded."""
+    if not sync_agents.StagedOutputTree.supported():
+        pytest.skip("renameat2 is not available")
+
+    staged_manager().sync_all()
+    output = tmp_path / "claude" / "agents" / "reviewer.md"
+    before = output.read_text()
+    (tmp_path / "templates" / "agents" / "reviewer.md").write_text(
+        AGENT.format(description="Reviews code closely"),
+    )
+    manager = staged_manager()
+
+    def interrupt(*args: object) -> None:
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(manager, "_cleanup_disabled_templates", interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        manager.sync_all()
+
+    assert output.read_text() == before
+    assert [path.name for path in output.parent.parent.iterdir()] == ["agents"]
+
+
+def test_watch_resyncs_are_staged(
+    sync_agents: ModuleType,
+    staged_manager: Callable[..., object],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """sync_templates, used by watch mode, writes through the staging tree."""
+    if not sync_agents.StagedOutputTree.supported():
+        pytest.skip("renameat2 is not available")
+
+    manager = staged_manager()
+    manager.sync_all()
+    template = tmp_path / "templates" / "agents" / "reviewer.md"
+    template.write_text(AGENT.format(description="Reviews code closely"))
+    commits = []
+    commit = sync_agents.StagedOutputTree.commit
+
+    def record(staging: object) -> None:
+        commits.append(sorted(staging._staged_roots))
+        commit(staging)
+
+    monkeypatch.setattr(sync_agents.StagedOutputTree, "commit", record)
+
+    assert manager.sync_templates([template]) == 1
+    assert commits == [[tmp_path / "claude" / "agents"]]
+    assert (
+        "Reviews code closely"
+        in (tmp_path / "claude" / "agents" / "reviewer.md").read_text()
+    )
+
+
+def test_staged_needs_renameat2(
+    sync_agents: ModuleType,
+    staged_manager: Callable[..., object],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """--staged is refused where directories cannot be swapped atomically."""
+    monkeypatch.setattr(sync_agents, "_load_renameat2", lambda: None)
+
+    with pytest.raises(ValueError, match="renameat2"):
+        staged_manager()
@@ -0,0 +1,210 @@
+"""Tests for watch mode: event sources, ignore rules, debouncing and re-syncs."""
+
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+
+@pytest.fixture
+def templates(manager: object) -> Path:
+    """Return the manager's templates with an agent, a skill and ignore files."""
+    root = manager.templates_dir
+    (root / "agents").mkdir()
+    (root / "agents" / "reviewer.md").write_text("agent")
+    skill = root / "skills" / "pdf"
+    (skill / "scripts").mkdir(parents=True)
+    (skill / "SKILL.md").write_text("skill")
+    (skill / "scripts" / "extract.py").write_text("print()")
+    (skill / ".gitignore").write_text("*.pyc\n")
+    (root / ".syncignore").write_text("drafts/\n")
+    (root / "agents" / "drafts").mkdir()
+
+    return root
+
+
+@pytest.mark.parametrize(
+    ("path", "is_dir", "ignored"),
+    [
+        ("agents/reviewer.md", False, False),
+        ("agents/drafts", True, True),
+        ("agents/drafts/idea.md", False, True),
+        ("skills/pdf/scripts/extract.py", False, False),
+        ("skills/pdf/scripts/extract.pyc", False, True),
+        ("skills/pdf", True, False),
+        ("../config.yml", False, False),
+    ],
+)
+def test_is_ignored(
+    sync_agents: ModuleType,
+    templates: Path,
+    path: str,
+    is_dir: bool,
+    ignored: bool,
+) -> None:
+    """.syncignore applies everywhere, a skill's .gitignore inside the skill."""
+    tree = sync_agents.WatchedTree(templates)
+
+    assert tree.is_ignored(templates / path, is_dir=is_dir) is ignored
+
+
+def test_walk_skips_ignored_paths(sync_agents: ModuleType, templates: Path) -> None:
+    """Ignored directories are not descended into."""
+    (templates / "agents" / "drafts" / "idea.md").write_text("draft")
+    (templates / "skills" / "pdf" / "scripts" / "extract.pyc").write_bytes(b"")
+
+    walked = {
+        path.relative_to(templates).as_posix()
+        for path, _ in sync_agents.WatchedTree(templates).walk(templates)
+    }
+
+    assert "agents/reviewer.md" in walked
+    assert "skills/pdf/scripts/extract.py" in walked
+    assert not {p for p in walked if "drafts" in p or p.endswith(".pyc")}
+
+
+def test_polling_watcher_reports_changes(
+    sync_agents: ModuleType,
+    templates: Path,
+    tmp_path: Path,
+) -> None:
+    """Changed, added and removed files are reported; ignored ones are not."""
+    config_file = tmp_path / "config.yml"
+    config_file.write_text("{}\n")
+    watcher = sync_agents.PollingWatcher(templates, config_file, interval=0.01)
+
+    assert watcher.read(0.05) == set()
+
+    (templates / "agents" / "reviewer.md").write_text("edited agent")
+    (templates / "agents" / "new.md").write_text("new")
+    (templates / "skills" / "pdf" / "scripts" / "extract.py").unlink()
+    (templates / "agents" / "drafts" / "idea.md").write_text("draft")
+    config_file.write_text("providers: {}\n")
+
+    changed = watcher.read(1)
+
+    # Directories whose entries changed are reported too
+    assert changed - {templates / "agents", templates / "skills/pdf/scripts"} == {
+        templates / "agents" / "reviewer.md",
+        templates / "agents" / "new.md",
+        templates / "skills" / "pdf" / "scripts" / "extract.py",
+        config_file,
+    }
+    assert watcher.read(0.05) == set()
+
+
+@pytest.mark.parametrize(
+    ("path", "template"),
+    [
+        ("agents/reviewer.md", "agents/reviewer.md"),
+        ("agents/notes.txt", None),
+        ("skills/pdf/SKILL.md", "skills/pdf/SKILL.md"),
+        ("skills/pdf/scripts/extract.py", "skills/pdf/SKILL.md"),
+        ("skills/README.md", None),
+        ("agents/drafts/idea.md", None),
+        ("../config.yml", None),
+    ],
+)
+def test_template_for_path(
+    manager: object,
+    templates: Path,
+    path: str,
+    template: str | None,
+) -> None:
+    """Files map to the template that generates from them."""
+    manager.discover_templates()
+
+    expected = None if template is None else templates / template
+    assert manager.template_for_path(templates / path) == expected
+
+
+class FakeEvents:
+    """Event source replaying batches of changes; None means events were lost."""
+
+    def __init__(self, batches: list[set[Path] | None]) -> None:
+        """Replay batches, then report no changes."""
+        self.batches = batches
+        self.timeouts: list[float | None] = []
+        self.closed = False
+
+    def read(self, timeout: float | None) -> set[Path] | None:
+        """Return the next batch, recording how long the watcher would wait."""
+        self.timeouts.append(timeout)
+
+        return self.batches.pop(0) if self.batches else set()
+
+    def close(self) -> None:
+        """Record that the watcher stopped using this source."""
+        self.closed = True
+
+
+@pytest.fixture
+def watcher(
+    sync_agents: ModuleType,
+    manager: object,
+    templates: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> object:
+    """Return a watcher of the manager that records the syncs it runs."""
+    watcher = sync_agents.TemplateWatcher(manager, debounce=0.2)
+    watcher._events.close()
+    watcher._events = FakeEvents([])
+    watcher.syncs = []
+    monkeypatch.setattr(watcher, "_open_events", lambda: FakeEvents([]))
+    monkeypatch.setattr(manager, "sync_all", lambda: watcher.syncs.append("all"))
+    monkeypatch.setattr(manager, "sync_mcp_servers", lambda: None)
+    monkeypatch.setattr(manager, "sync_templates", watcher.syncs.append)
+    manager.discover_templates()
+
+    return watcher
+
+
+def test_bursts_are_debounced(watcher: object, templates: Path) -> None:
+    """Events arriving within the debounce interval form one batch."""
+    first, second = templates / "agents" / "a.md", templates / "agents" / "b.md"
+    watcher._events = FakeEvents([{first}, {second}, {first}, set()])
+
+    assert watcher._wait_for_changes() == {first, second}
+    assert watcher._events.timeouts == [None, 0.2, 0.2, 0.2]
+
+
+def test_lost_events_end_the_batch(watcher: object, templates: Path) -> None:
+    """An overflowing event queue makes the batch a full resync."""
+    watcher._events = FakeEvents([{templates / "agents" / "a.md"}, None])
+
+    assert watcher._wait_for_changes() is None
+
+
+def test_skill_change_resyncs_its_skill(watcher: object, templates: Path) -> None:
+    """Editing a skill's supporting file re-syncs only that skill."""
+    watcher._sync_changes(
+        {
+            templates / "skills" / "pdf" / "scripts" / "extract.py",
+            templates / "agents" / "drafts" / "idea.md",
+        },
+    )
+
+    assert watcher.syncs == [[templates / "skills" / "pdf" / "SKILL.md"]]
+
+
+@pytest.mark.parametrize("changed", ["config.yml", "templates/.syncignore", None])
+def test_full_resync(
+    watcher: object,
+    tmp_path: Path,
+    changed: str | None,
+) -> None:
+    """Config and .syncignore changes, or lost events, re-sync everything."""
+    events = watcher._events
+
+    watcher._sync_changes(None if changed is None else {tmp_path / changed})
+
+    assert watcher.syncs == ["all"]
+    # Ignore rules decide what is watched, so the event source is reopened
+    assert events.closed is (changed != "config.yml")
+
+
+def test_ignored_changes_sync_nothing(watcher: object, templates: Path) -> None:
+    """Changes that belong to no template do not trigger a sync."""
+    watcher._sync_changes({templates / "agents" / "drafts" / "idea.md"})
+
+    assert watcher.syncs == []